@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+"""
+Compares the throughput of the hash algorithms a repository can
+compute its keys with (see `nit.core.hash_factory`), hashing
+blobs the way `BaseStorage` does: the blob header, then the
+content in CHUNK_SIZE pieces.
+
+The blob sizes follow a typical source repository: mostly small
+files, some medium ones and a few large assets.
+
+    python bin/bench-hash.py [--total-mb 256] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nit.components.base.storage import BaseStorage
+from nit.core.hash_factory import algorithms
+
+
+# (probability, smallest size, largest size)
+BLOB_SIZE_DISTRIBUTION = [
+    (0.70, 256, 16 * 1024),
+    (0.25, 16 * 1024, 512 * 1024),
+    (0.05, 512 * 1024, 16 * 1024 * 1024),
+]
+
+
+def make_blob_sizes(total_bytes, rng):
+    sizes = []
+    while sum(sizes) < total_bytes:
+        r = rng.random()
+        for probability, smallest, largest in BLOB_SIZE_DISTRIBUTION:
+            if r < probability:
+                sizes.append(rng.randint(smallest, largest))
+                break
+            r -= probability
+    return sizes
+
+
+def hash_blobs(hash_fn, data, sizes):
+    chunk_size = BaseStorage.CHUNK_SIZE
+    view = memoryview(data)
+    for size in sizes:
+        key_hash = hash_fn()
+        key_hash.update("blob {}\n".format(size).encode())
+        for start in range(0, size, chunk_size):
+            key_hash.update(view[start:min(start + chunk_size, size)])
+        key_hash.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--total-mb", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = make_blob_sizes(
+        args.total_mb * 1024 * 1024, random.Random(args.seed)
+    )
+    data = os.urandom(max(sizes))
+    total_mb = sum(sizes) / (1024 * 1024)
+
+    print("{} blobs, {:.1f} MiB".format(len(sizes), total_mb))
+
+    for name, hash_fn in sorted(algorithms.items()):
+        best = min(
+            _time(lambda: hash_blobs(hash_fn, data, sizes))
+            for _ in range(args.repeat)
+        )
+        print("{:<10s} {:8.1f} MiB/s".format(name, total_mb / best))
+
+
+def _time(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+"""
+Measures how fast each serializer parses the objects it wrote: a
+tree of many nodes, a commit and an index, deserialized from
+memory the way `BaseStorage` reads them from their files.
+
+    python bin/bench-serialize.py [--nodes 100000] [--repeat 3]
+"""
+import argparse
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nit.components.git.serialization import GitSerializer
+from nit.components.nit.serialization import (
+    CompressedNitSerializer,
+    NitSerializer
+)
+from nit.core.objects.commit import Commit
+from nit.core.objects.index import Index, IndexStat
+from nit.core.objects.tree import Tree, TreeNode
+
+
+SERIALIZERS = [
+    ("nit", NitSerializer),
+    ("nit-bin", lambda stream: NitSerializer(stream, tree_format="binary")),
+    ("nit-zlib", lambda stream: CompressedNitSerializer(stream, level=1)),
+    ("git", GitSerializer),
+]
+
+
+def make_nodes(count, rng):
+    dir_strs = [
+        "/".join("d{}".format(rng.randrange(20)) for _ in range(depth))
+        for depth in range(count // 1000 + 1)
+    ]
+    return [
+        TreeNode(
+            "{}/file{}.py".format(rng.choice(dir_strs), i).lstrip("/"),
+            "{:040x}".format(rng.getrandbits(160))
+        )
+        for i in range(count)
+    ]
+
+
+def make_objects(node_count, rng):
+    nodes = make_nodes(node_count, rng)
+
+    index = Index()
+    for node in nodes:
+        index.add_node(node, stat=IndexStat(
+            rng.getrandbits(60), rng.randrange(1 << 20), rng.getrandbits(30)
+        ))
+
+    commit = Commit(
+        "{:040x}".format(rng.getrandbits(160)),
+        "{:040x}".format(rng.getrandbits(160)),
+        message="A commit message\n" * 20
+    )
+
+    return [("tree", Tree(nodes)), ("index", index), ("commit", commit)]
+
+
+def serialize(serializer_cls, obj):
+    stream = io.BytesIO()
+    serializer_cls(stream).serialize(obj)
+    return stream.getvalue()
+
+
+def deserialize(serializer_cls, data, count):
+    for _ in range(count):
+        serializer_cls(io.BytesIO(data)).deserialize()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    objects = make_objects(args.nodes, random.Random(args.seed))
+
+    for name, serializer_cls in SERIALIZERS:
+        for obj_type, obj in objects:
+            data = serialize(serializer_cls, obj)
+            # Parse small objects enough times to be measurable
+            count = max(1, (1 << 20) // len(data))
+            best = min(
+                _time(lambda: deserialize(serializer_cls, data, count))
+                for _ in range(args.repeat)
+            )
+            mb = len(data) * count / (1024 * 1024)
+            print(
+                "{:<10s} {:<8s} {:10d} bytes {:8.1f} MiB/s "
+                "{:10.3f} ms each".format(
+                    name, obj_type, len(data), mb / best,
+                    best * 1000 / count
+                )
+            )
+
+
+def _time(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+"""
+Measures the memory that tree nodes take, and how long it takes
+to diff trees of them: the bytes retained per node by a tree
+read from its serialized form (as the head tree and the index
+are), and per node by several such trees of the same paths (as
+`nit status` holds), then the time to diff two of the trees.
+
+    python bin/bench-tree-nodes.py [--nodes 100000] [--repeat 3]
+"""
+import argparse
+import gc
+import io
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nit.components.nit.serialization import NitSerializer
+from nit.core.diff import BaseTreeDiff
+from nit.core.objects.tree import Tree, TreeNode
+
+
+def make_tree(count, rng):
+    dir_strs = [
+        "/".join("d{}".format(rng.randrange(20)) for _ in range(depth))
+        for depth in range(count // 1000 + 1)
+    ]
+    return Tree([
+        TreeNode(
+            "{}/file{}.py".format(rng.choice(dir_strs), i).lstrip("/"),
+            "{:040x}".format(rng.getrandbits(160))
+        )
+        for i in range(count)
+    ])
+
+
+def serialize(tree):
+    stream = io.BytesIO()
+    NitSerializer(stream).serialize(tree)
+    return stream.getvalue()
+
+
+def deserialize(data):
+    return NitSerializer(io.BytesIO(data)).deserialize()
+
+
+def retained_bytes(fn):
+    """
+    :return (tuple): (what `fn` returned, the bytes allocated by
+                      `fn` that are still allocated)
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--trees", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = serialize(make_tree(args.nodes, random.Random(args.seed)))
+
+    _, size = retained_bytes(lambda: deserialize(data))
+    print("{:<24s} {:8.1f} bytes/node".format("one tree", size / args.nodes))
+
+    trees, size = retained_bytes(
+        lambda: [deserialize(data) for _ in range(args.trees)]
+    )
+    print("{:<24s} {:8.1f} bytes/node".format(
+        "{} trees".format(args.trees), size / (args.nodes * args.trees)
+    ))
+
+    best = min(
+        _time(lambda: _diff(trees[0], trees[1]))
+        for _ in range(args.repeat)
+    )
+    print("{:<24s} {:8.1f} ms".format("diff", best * 1000))
+
+
+def _diff(from_tree, to_tree):
+    diff = BaseTreeDiff(from_tree, to_tree)
+    return diff.added, diff.removed, diff.modified, diff.unmodified
+
+
+def _time(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
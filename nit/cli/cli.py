@@ -10,7 +10,9 @@ from pathlib import Path
 
 from nit.core.log import getLogger
 from nit.core.errors import NitExpectedError, NitUnexpectedError
+from nit.core.config import BaseConfigBuilder
 from nit.core.paths import BasePaths
+from nit.core.paths_factory import get_paths_cls
 from nit.core.repository_factory import get_repository_cls
 
 logger = getLogger(__name__)
@@ -67,15 +69,21 @@ class RepositoryProxy:
     def __init__(self, repo):
         self.repo = repo
 
-    @map_args()
-    def init(self):
-        self.repo.create()
+    @map_args(
+        kwarg_mappings=["hash_algorithm"]
+    )
+    def init(self, hash_algorithm=None):
+        self.repo.create(hash_algorithm=hash_algorithm)
 
     @map_args(
-        kwarg_mappings=[]
+        kwarg_mappings=["cached", "untracked_files", "pathspec"]
     )
-    def status(self):
-        self.repo.status()
+    def status(self, cached=False, untracked_files="all", pathspec=None):
+        self.repo.status(
+            cached=cached,
+            untracked=untracked_files != "no",
+            pathspec=pathspec
+        )
 
     @map_args(
         arg_mappings=["treeish"]
@@ -121,6 +129,22 @@ class RepositoryProxy:
             s = s[:-1]
         logger.info(s)
 
+    @map_args()
+    def repack(self):
+        self.repo.repack()
+
+    @map_args(
+        arg_mappings=["layout"]
+    )
+    def migrate(self, layout):
+        self.repo.migrate(layout)
+
+    @map_args(
+        kwarg_mappings=["stop"]
+    )
+    def fsmonitor(self, stop=False):
+        self.repo.fsmonitor(stop=stop)
+
     @map_args()
     def log(self):
         self.repo.log()
@@ -196,6 +220,12 @@ class BaseParserFactory(ParserFactory):
         parser_init.set_defaults(
             func="init"
         )
+        parser_init.add_argument(
+            "--hash-algorithm",
+            dest="hash_algorithm",
+            metavar="ALGORITHM",
+            help="'sha1' (the default), 'sha256' or 'blake2b'"
+        )
 
         # Sub-parser for 'config' command
         parser_config = subparsers.add_parser(
@@ -225,6 +255,23 @@ class BaseParserFactory(ParserFactory):
         parser_status.set_defaults(
             func="status"
         )
+        parser_status.add_argument(
+            "--cached",
+            action='store_true',
+            help="only compare the HEAD commit and the index"
+        )
+        parser_status.add_argument(
+            "-u", "--untracked-files",
+            dest="untracked_files",
+            choices=["all", "no"],
+            default="all",
+            help="'no' skips looking for untracked files"
+        )
+        parser_status.add_argument(
+            "pathspec", nargs="*",
+            metavar="PATH",
+            help="only report files at or below these paths"
+        )
 
         # Sub-parser for 'cat' command
         parser_cat = subparsers.add_parser(
@@ -293,6 +340,45 @@ class BaseParserFactory(ParserFactory):
             func="log"
         )
 
+        # Sub-parser for 'repack' command
+        parser_repack = subparsers.add_parser(
+            "repack",
+            aliases=["gc"],
+            help="move loose objects in the database into a packfile"
+        )
+        parser_repack.set_defaults(
+            func="repack"
+        )
+
+        # Sub-parser for 'migrate' command
+        parser_migrate = subparsers.add_parser(
+            "migrate",
+            help="move loose objects in the database into another "
+                 "directory layout"
+        )
+        parser_migrate.set_defaults(
+            func="migrate"
+        )
+        parser_migrate.add_argument(
+            "layout", metavar="LAYOUT",
+            help="'flat' or 'fanout'"
+        )
+
+        # Sub-parser for 'fsmonitor' command
+        parser_fsmonitor = subparsers.add_parser(
+            "fsmonitor",
+            help="watch the working tree (with Linux's inotify) so "
+                 "that status only checks the paths that changed"
+        )
+        parser_fsmonitor.set_defaults(
+            func="fsmonitor"
+        )
+        parser_fsmonitor.add_argument(
+            "--stop",
+            action='store_true',
+            help="stop the running monitor"
+        )
+
         # Sub-parser for 'checkout' command
         parser_checkout = subparsers.add_parser(
             "checkout",
@@ -380,6 +466,8 @@ def setup(args, name):
 
     cwd = Path(os.getcwd())
     nit_paths = BasePaths(cwd, repo_name="." + name)
+    layout = BaseConfigBuilder(nit_paths).get("core.objectLayout")
+    nit_paths = get_paths_cls(layout)(cwd, repo_name="." + name)
     nit_repo = repository_cls(nit_paths)
     repo = RepositoryProxy(nit_repo)
 
@@ -0,0 +1,134 @@
+#! /usr/bin/env python
+"""
+"""
+from collections import OrderedDict
+
+from nit.core.errors import NitUserError
+from nit.core.objects.blob import Blob
+
+
+def parse_size(value):
+    """
+    Parses a config value like "4096", "512k", "64m" or "1g"
+
+    :return (int): A number of bytes
+    """
+    units = {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30}
+    value = str(value).strip().lower()
+    try:
+        if value and value[-1] in units:
+            return int(value[:-1]) * units[value[-1]]
+        return int(value)
+    except ValueError:
+        raise NitUserError(
+            "'{}' is not a valid size".format(value)
+        )
+
+
+class LruPool:
+
+    """
+    A least-recently-used mapping whose values are evicted
+    when their total size exceeds `limit` bytes.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        try:
+            obj, _ = self._entries[key]
+        except KeyError:
+            return None
+        self._entries.move_to_end(key)
+        return obj
+
+    def put(self, key, obj, size):
+        if size > self.limit:
+            return
+        if key in self._entries:
+            self.size -= self._entries.pop(key)[1]
+        self._entries[key] = (obj, size)
+        self.size += size
+        while self.size > self.limit:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+class ObjectCache:
+
+    """
+    An in-process cache of deserialized objects, keyed by their
+    full keys. Since objects are content-addressed, an entry
+    can never go stale.
+
+    Blobs and everything else (trees, commits) are kept in
+    separate pools, so a few large blobs can't evict the trees
+    and commits that a command walks repeatedly.
+
+    `hits` and `misses` count lookups, to help size the limits.
+    Cached objects are shared, so callers must not modify them.
+    """
+
+    def __init__(self, blob_limit, object_limit):
+        self.blobs = LruPool(blob_limit)
+        self.objects = LruPool(object_limit)
+        self.hits = 0
+        self.misses = 0
+
+    def _pool_for(self, obj):
+        return self.blobs if isinstance(obj, Blob) else self.objects
+
+    def get(self, key):
+        """
+        :return: The cached object for `key`, or None
+        """
+        obj = self.objects.get(key)
+        if obj is None:
+            obj = self.blobs.get(key)
+        if obj is not None:
+            self.hits += 1
+        return obj
+
+    def put(self, key, obj, size):
+        """
+        Records a miss, and caches `obj` if it fits
+
+        :param size: The number of bytes `obj` takes once loaded
+        """
+        self.misses += 1
+        self._pool_for(obj).put(key, obj, size)
+
+    def clear(self):
+        self.blobs.clear()
+        self.objects.clear()
+
+    @property
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "blobs": len(self.blobs),
+            "blob_bytes": self.blobs.size,
+            "objects": len(self.objects),
+            "object_bytes": self.objects.size,
+        }
+
+    def __str__(self):
+        return (
+            "Object cache: {hits} hits, {misses} misses, "
+            "{blobs} blobs ({blob_bytes} bytes), "
+            "{objects} other objects ({object_bytes} bytes)"
+        ).format(**self.stats)
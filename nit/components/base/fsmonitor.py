@@ -0,0 +1,421 @@
+#! /usr/bin/env python
+"""
+A filesystem monitor, which watches the working tree with
+Linux's inotify so that `nit status` only has to look at the
+paths that changed since the index was last written, instead
+of every file in the project.
+
+The daemon (``nit fsmonitor``) listens on a Unix socket in the
+repository directory. A client sends a single line,
+
+    since <token>
+
+and the daemon answers with its current token, followed by
+either ``*`` if it can't tell what changed since `token` (it
+was given by another daemon, or events were lost), or by the
+relative path of every file and directory changed since then,
+one per line. Tokens are ``<generation>:<sequence number>``;
+each daemon, and each reset of its change log, starts a new
+generation.
+
+``stop`` asks the daemon to exit.
+"""
+import ctypes
+import ctypes.util
+import os
+import selectors
+import socket
+import struct
+import sys
+
+from nit.core.errors import NitUserError
+from nit.core.log import getLogger
+
+
+logger = getLogger(__name__)
+
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+
+class Inotify:
+
+    """
+    A thin ctypes wrapper around an inotify instance
+    """
+
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise NitUserError(
+                "The filesystem monitor needs Linux's inotify"
+            )
+
+        libc = ctypes.CDLL(
+            ctypes.util.find_library("c"), use_errno=True
+        )
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32
+        ]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+        self.fd = self._check(
+            libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        )
+
+    @staticmethod
+    def _check(result):
+        if result < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return result
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        os.close(self.fd)
+
+    def add_watch(self, path_str, mask):
+        """
+        :return (int): The watch descriptor
+        """
+        return self._check(
+            self._add_watch(self.fd, os.fsencode(path_str), mask)
+        )
+
+    def rm_watch(self, wd):
+        self._check(self._rm_watch(self.fd, wd))
+
+    def read_events(self):
+        """
+        :return (list): (watch descriptor, mask, name) for each
+                        event that's queued, without blocking
+        """
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+
+class FsMonitorDaemon:
+
+    """
+    Watches every directory in the project except the
+    repository directory, and logs the paths that change.
+    """
+
+    WATCH_MASK = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE |
+        IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+        IN_DELETE_SELF | IN_MOVE_SELF |
+        IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+    )
+
+    # Past this many changed paths, the log is reset (so the
+    # next status checks everything) rather than grow forever
+    MAX_CHANGES = 100000
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.project_str = str(paths.project)
+        self.inotify = None
+        self.generation = None
+        self.seq = 0
+        self.changes = {}
+        self.dirs_by_wd = {}
+        self.wds_by_dir = {}
+        self.running = False
+
+    @property
+    def token(self):
+        return "{}:{}".format(self.generation, self.seq)
+
+    def _reset(self):
+        self.generation = os.urandom(4).hex()
+        self.seq = 0
+        self.changes = {}
+
+    def _mark(self, path_str):
+        self.seq += 1
+        self.changes[path_str] = self.seq
+        if len(self.changes) > self.MAX_CHANGES:
+            self._reset()
+
+    def _watch_tree(self, dir_str, mark=False):
+        """
+        Watches the directory at `dir_str` and everything in it,
+        marking all of it changed if `mark` is True, since
+        events from before a watch is added aren't seen
+        """
+        dir_path = os.path.join(self.project_str, dir_str)
+        try:
+            wd = self.inotify.add_watch(dir_path, self.WATCH_MASK)
+        except OSError as exc:
+            logger.warn("Can't watch '{}': {}".format(dir_path, exc))
+            return
+        self.dirs_by_wd[wd] = dir_str
+        self.wds_by_dir[dir_str] = wd
+
+        if mark:
+            self._mark(dir_str)
+
+        try:
+            with os.scandir(dir_path) as it:
+                dir_entries = list(it)
+        except OSError:
+            return
+
+        for dir_entry in dir_entries:
+            if not dir_str and dir_entry.name == self.paths.repo_name:
+                continue
+            path_str = os.path.join(dir_str, dir_entry.name)
+            if dir_entry.is_dir(follow_symlinks=False):
+                self._watch_tree(path_str, mark=mark)
+            elif mark:
+                self._mark(path_str)
+
+    def _unwatch_tree(self, dir_str):
+        prefix = dir_str + os.path.sep
+        for watched_str in list(self.wds_by_dir):
+            if watched_str == dir_str or watched_str.startswith(prefix):
+                wd = self.wds_by_dir.pop(watched_str)
+                self.dirs_by_wd.pop(wd, None)
+                try:
+                    self.inotify.rm_watch(wd)
+                except OSError:
+                    # Already gone along with the directory
+                    pass
+
+    def process_events(self):
+        """
+        Logs every event that's queued
+        """
+        while True:
+            events = self.inotify.read_events()
+            if not events:
+                return
+            for wd, mask, name in events:
+                self._process_event(wd, mask, name)
+
+    def _process_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            logger.warn("Missed some changes, starting over")
+            self._reset()
+            self._watch_tree("")
+            return
+
+        dir_str = self.dirs_by_wd.get(wd)
+        if dir_str is None:
+            return
+
+        if mask & IN_IGNORED:
+            self.dirs_by_wd.pop(wd, None)
+            if self.wds_by_dir.get(dir_str) == wd:
+                del self.wds_by_dir[dir_str]
+            return
+
+        if not dir_str and name == self.paths.repo_name:
+            return
+
+        path_str = os.path.join(dir_str, name) if name else dir_str
+        self._mark(path_str)
+        if name:
+            # The directory's listing may have changed
+            self._mark(dir_str)
+
+        if mask & IN_ISDIR:
+            if mask & (IN_MOVED_FROM | IN_DELETE):
+                self._unwatch_tree(path_str)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(path_str, mark=True)
+
+    def changed_since(self, token):
+        """
+        :return (list): The paths changed since `token`, or None
+                        if it's from another generation
+        """
+        generation, _, seq = token.partition(":")
+        if generation != self.generation or not seq.isdigit():
+            return None
+        seq = int(seq)
+        return [
+            path_str
+            for path_str, changed_seq in self.changes.items()
+            if changed_seq > seq
+        ]
+
+    def _respond(self, request):
+        if request == "stop":
+            self.running = False
+            return "stopping\n"
+
+        command, _, token = request.partition(" ")
+        if command != "since":
+            return "error unknown request\n"
+
+        # Everything done before the request was sent is
+        # already queued, so nothing can be missed
+        self.process_events()
+        changed = self.changed_since(token)
+        if changed is None or any("\n" in p for p in changed):
+            changed = ["*"]
+        return "".join(
+            line + "\n" for line in [self.token] + changed
+        )
+
+    def _serve(self, server):
+        conn, _ = server.accept()
+        with conn:
+            conn.settimeout(FsMonitorClient.TIMEOUT)
+            try:
+                request = _recv_all(conn).decode().strip()
+                conn.sendall(self._respond(request).encode())
+            except (OSError, UnicodeDecodeError) as exc:
+                logger.debug("Bad fsmonitor request: {}".format(exc))
+
+    def run(self):
+        """
+        Watches the project and answers requests until stopped
+        """
+        socket_str = str(self.paths.fsmonitor_socket)
+        if FsMonitorClient(self.paths).request("since -") is not None:
+            raise NitUserError(
+                "The filesystem monitor is already running"
+            )
+
+        self.inotify = Inotify()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        selector = selectors.DefaultSelector()
+        try:
+            self._reset()
+            self._watch_tree("")
+
+            try:
+                os.unlink(socket_str)
+            except FileNotFoundError:
+                pass
+            server.bind(socket_str)
+            server.listen()
+
+            selector.register(self.inotify, selectors.EVENT_READ)
+            selector.register(server, selectors.EVENT_READ)
+
+            logger.info(
+                "Watching {} directories in {}".format(
+                    len(self.wds_by_dir), self.project_str
+                )
+            )
+
+            self.running = True
+            while self.running:
+                for key, _ in selector.select():
+                    if key.fileobj is server:
+                        self._serve(server)
+                    else:
+                        self.process_events()
+
+        finally:
+            selector.close()
+            server.close()
+            self.inotify.close()
+            try:
+                os.unlink(socket_str)
+            except FileNotFoundError:
+                pass
+
+
+class FsMonitorClient:
+
+    """
+    Asks a running `FsMonitorDaemon` what has changed. Every
+    failure (no daemon, no inotify) just means that the caller
+    has to check everything itself.
+    """
+
+    TIMEOUT = 5
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def request(self, request):
+        """
+        :return (list): The lines of the daemon's response, or
+                        None if there's no daemon to ask
+        """
+        socket_path = self.paths.fsmonitor_socket
+        if not socket_path.exists():
+            return None
+
+        try:
+            with socket.socket(
+                socket.AF_UNIX, socket.SOCK_STREAM
+            ) as conn:
+                conn.settimeout(self.TIMEOUT)
+                conn.connect(str(socket_path))
+                conn.sendall((request + "\n").encode())
+                conn.shutdown(socket.SHUT_WR)
+                response = _recv_all(conn).decode()
+        except (OSError, UnicodeDecodeError) as exc:
+            logger.debug("No filesystem monitor: {}".format(exc))
+            return None
+
+        return response.splitlines()
+
+    def query(self, token):
+        """
+        :param token: The token that the index was last written
+                      with, or None
+        :return (tuple): (the daemon's current token, the set of
+                          paths changed since `token`), where
+                          either may be None if it isn't known
+        """
+        lines = self.request("since " + (token or "-"))
+        if not lines or ":" not in lines[0]:
+            return None, None
+        if lines[1:] == ["*"]:
+            return lines[0], None
+        return lines[0], set(lines[1:])
+
+    def stop(self):
+        """
+        :return (bool): False if no daemon was running
+        """
+        return self.request("stop") is not None
+
+
+def _recv_all(conn):
+    chunks = []
+    while True:
+        chunk = conn.recv(64 * 1024)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
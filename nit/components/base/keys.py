@@ -0,0 +1,226 @@
+#! /usr/bin/env python
+"""
+A persisted, sorted index of every key in the object database,
+so that resolving an abbreviated key or checking whether a key
+exists is a binary search rather than a directory scan.
+
+The index is made of two files:
+
+``keys``
+    A header followed by fixed-width keys in sorted order,
+    binary-searched through an mmap:
+
+        magic (4s) | version (B) | key length (B) | count (I)
+        key (key length bytes)
+        ...
+
+``keys-new``
+    A journal of keys added since ``keys`` was last written,
+    one per line. It's kept sorted in memory once loaded, and
+    merged into ``keys`` when it grows past JOURNAL_LIMIT.
+"""
+import bisect
+import mmap
+import os
+import struct
+
+from nit.core.log import getLogger
+
+
+logger = getLogger(__name__)
+
+
+HEX_DIGITS = frozenset("0123456789abcdef")
+
+
+def is_keyish(s):
+    """
+    :return (bool): True if `s` could be (part of) a key
+    """
+    return bool(s) and HEX_DIGITS.issuperset(s)
+
+
+class KeyIndex:
+
+    """
+    """
+
+    MAGIC = b"NKEY"
+    VERSION = 1
+    HEADER = struct.Struct(">4sBBI")
+
+    JOURNAL_LIMIT = 4096
+
+    def __init__(self, path, iter_all_keys):
+        """
+        :param path: Where the index is stored
+        :param iter_all_keys: A callable returning every key in
+                              the database, used to build the
+                              index if it doesn't exist yet
+        """
+        self.path = path
+        self.journal_path = path.with_name(path.name + "-new")
+        self._iter_all_keys = iter_all_keys
+        self._map = None
+        self._key_len = 0
+        self._count = 0
+        self._journal = None
+
+    def _load(self):
+        if self._journal is not None:
+            return
+
+        if not self.path.exists():
+            self.rebuild(self._iter_all_keys())
+            return
+
+        self._open_map()
+
+        self._journal = []
+        try:
+            with self.journal_path.open('r') as f:
+                self._journal = sorted(set(
+                    line.strip() for line in f if line.strip()
+                ))
+        except FileNotFoundError:
+            pass
+
+    def _open_map(self):
+        with self.path.open('rb') as f:
+            self._map = mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            )
+
+        magic, version, self._key_len, self._count = (
+            self.HEADER.unpack_from(self._map, 0)
+        )
+
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(
+                "Not a version {} key index: {}".format(
+                    self.VERSION, self.path
+                )
+            )
+
+    def close(self):
+        if self._map:
+            self._map.close()
+        self._map = None
+        self._journal = None
+
+    def _key_at(self, i):
+        start = self.HEADER.size + i * self._key_len
+        return self._map[start:start + self._key_len]
+
+    def _bisect(self, key_bytes):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key_bytes:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _iter_stored_keys_matching(self, prefix):
+        prefix_bytes = prefix.encode()
+        i = self._bisect(prefix_bytes)
+        while i < self._count:
+            key_bytes = self._key_at(i)
+            if not key_bytes.startswith(prefix_bytes):
+                break
+            yield key_bytes.decode()
+            i += 1
+
+    def _iter_journal_keys_matching(self, prefix):
+        i = bisect.bisect_left(self._journal, prefix)
+        while i < len(self._journal):
+            key = self._journal[i]
+            if not key.startswith(prefix):
+                break
+            yield key
+            i += 1
+
+    def find_keys_matching(self, keyish):
+        """
+        :return (list): Every indexed key starting with `keyish`
+        """
+        if not is_keyish(keyish):
+            return []
+        self._load()
+        return sorted(
+            set(self._iter_stored_keys_matching(keyish)).union(
+                self._iter_journal_keys_matching(keyish)
+            )
+        )
+
+    def __contains__(self, key):
+        if not is_keyish(key):
+            return False
+        self._load()
+        if len(key) == self._key_len:
+            i = self._bisect(key.encode())
+            if i < self._count and self._key_at(i) == key.encode():
+                return True
+        i = bisect.bisect_left(self._journal, key)
+        return i < len(self._journal) and self._journal[i] == key
+
+    def __iter__(self):
+        self._load()
+        stored = (self._key_at(i).decode() for i in range(self._count))
+        return iter(sorted(set(stored).union(self._journal)))
+
+    def add(self, key):
+        """
+        Records `key`, which must be stored already
+        """
+        self.add_many([key])
+
+    def add_many(self, keys):
+        """
+        Records each of `keys` with a single journal write
+        """
+        new_keys = sorted(set(key for key in keys if key not in self))
+        if not new_keys:
+            return
+
+        with self.journal_path.open('a') as f:
+            f.write("".join(key + "\n" for key in new_keys))
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal = sorted(self._journal + new_keys)
+
+        if len(self._journal) > self.JOURNAL_LIMIT:
+            self.rebuild(iter(self))
+
+    def rebuild(self, keys):
+        """
+        Replaces the index with `keys`, and empties the journal
+        """
+        keys = sorted(set(keys))
+        key_len = len(keys[0]) if keys else 0
+
+        tmp_path = self.path.with_name("." + self.path.name + "-tmp")
+        with tmp_path.open('wb') as f:
+            f.write(self.HEADER.pack(
+                self.MAGIC, self.VERSION, key_len, len(keys)
+            ))
+            for key in keys:
+                assert len(key) == key_len, (
+                    "All keys in an index must have the same length"
+                )
+                f.write(key.encode())
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.close()
+        os.replace(str(tmp_path), str(self.path))
+        try:
+            self.journal_path.unlink()
+        except FileNotFoundError:
+            pass
+
+        logger.trace("Indexed {} keys".format(len(keys)))
+
+        self._open_map()
+        self._journal = []
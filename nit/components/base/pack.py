@@ -0,0 +1,321 @@
+#! /usr/bin/env python
+"""
+Packfiles store many objects in a single data file, so that a
+repository with hundreds of thousands of objects doesn't cost
+hundreds of thousands of inodes (and an open() for every read).
+
+Each ``pack-<name>.pack`` file is simply the serialized objects
+concatenated back to back, exactly as they would have been
+written as loose files. Its companion ``pack-<name>.idx`` file
+holds a header followed by a table of fixed-width records
+sorted by key:
+
+    magic (4s) | version (B) | key length (B) | count (I)
+    key (key length bytes) | offset (Q) | length (Q)
+    ...
+
+The table is binary-searched through an mmap, which makes both
+exact and abbreviated key lookups O(log n).
+"""
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+from nit.core.log import getLogger
+
+
+logger = getLogger(__name__)
+
+
+class PackIndex:
+
+    """
+    A read-only view of a sorted ``.idx`` file
+    """
+
+    MAGIC = b"NIDX"
+    VERSION = 1
+    HEADER = struct.Struct(">4sBBI")
+    LOCATION = struct.Struct(">QQ")
+
+    def __init__(self, idx_path):
+        self.path = idx_path
+
+        with idx_path.open('rb') as f:
+            self._map = mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            )
+
+        magic, version, self.key_len, self.count = (
+            self.HEADER.unpack_from(self._map, 0)
+        )
+
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(
+                "Not a version {} pack index: {}".format(
+                    self.VERSION, idx_path
+                )
+            )
+
+        self.record_len = self.key_len + self.LOCATION.size
+
+    def close(self):
+        self._map.close()
+
+    def _key_at(self, i):
+        start = self.HEADER.size + i * self.record_len
+        return self._map[start:start + self.key_len]
+
+    def _location_at(self, i):
+        start = self.HEADER.size + i * self.record_len
+        return self.LOCATION.unpack_from(
+            self._map, start + self.key_len
+        )
+
+    def _bisect(self, key_bytes):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key_bytes:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def locate(self, key):
+        """
+        :return (tuple): (offset, length) of the object with
+                         exactly `key`, or None
+        """
+        key_bytes = key.encode()
+        if len(key_bytes) != self.key_len:
+            return None
+        i = self._bisect(key_bytes)
+        if i < self.count and self._key_at(i) == key_bytes:
+            return self._location_at(i)
+        return None
+
+    def iter_keys_matching(self, keyish):
+        prefix = keyish.encode()
+        i = self._bisect(prefix)
+        while i < self.count:
+            key_bytes = self._key_at(i)
+            if not key_bytes.startswith(prefix):
+                break
+            yield key_bytes.decode()
+            i += 1
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self._key_at(i).decode()
+
+    def __len__(self):
+        return self.count
+
+
+class Pack:
+
+    """
+    A ``.pack`` data file and its ``.idx``
+    """
+
+    def __init__(self, idx_path):
+        self.index = PackIndex(idx_path)
+        self.path = idx_path.with_suffix(".pack")
+        self._file = self.path.open('rb')
+        self._map = None
+
+        if self.path.stat().st_size:
+            self._map = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+
+    def close(self):
+        if self._map:
+            self._map.close()
+        self._file.close()
+        self.index.close()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def locate(self, key):
+        return self.index.locate(key)
+
+    def read(self, key):
+        """
+        :return (bytes): The stored bytes of `key`, or None
+        """
+        location = self.locate(key)
+        if location is None:
+            return None
+        return self.read_at(*location)
+
+    def read_at(self, offset, length):
+        return self._map[offset:offset + length]
+
+    def __contains__(self, key):
+        return self.locate(key) is not None
+
+    def __iter__(self):
+        return iter(self.index)
+
+
+class PackSet:
+
+    """
+    All of the packs in a repository's pack directory. The
+    indexes are opened lazily, the first time a lookup is made.
+    """
+
+    pack_class = Pack
+
+    def __init__(self, packs_dir):
+        self.packs_dir = packs_dir
+        self._packs = None
+
+    @property
+    def packs(self):
+        if self._packs is None:
+            self._packs = []
+            if self.packs_dir.is_dir():
+                for idx_path in sorted(self.packs_dir.glob("*.idx")):
+                    self._packs.append(self.pack_class(idx_path))
+        return self._packs
+
+    def reload(self):
+        self.close()
+        self._packs = None
+
+    def close(self):
+        for pack in self._packs or []:
+            pack.close()
+
+    def locate(self, key):
+        """
+        :return (tuple): (pack, offset, length) for `key`, or None
+        """
+        for pack in self.packs:
+            location = pack.locate(key)
+            if location is not None:
+                return (pack,) + tuple(location)
+        return None
+
+    def read(self, key):
+        for pack in self.packs:
+            content = pack.read(key)
+            if content is not None:
+                return content
+        return None
+
+    def find_keys_matching(self, keyish):
+        keys = set()
+        for pack in self.packs:
+            keys.update(pack.index.iter_keys_matching(keyish))
+        return sorted(keys)
+
+    def __contains__(self, key):
+        return any(key in pack for pack in self.packs)
+
+    def __iter__(self):
+        for pack in self.packs:
+            yield from pack
+
+    def __len__(self):
+        return len(self.packs)
+
+
+def _mkstemp(packs_dir, file_mode):
+    """
+    Creates a uniquely named temporary file in `packs_dir`, so
+    that concurrent writers never share one
+
+    :return (tuple): (open binary file, path)
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=str(packs_dir))
+    if file_mode is not None:
+        os.fchmod(fd, file_mode)
+    return os.fdopen(fd, 'wb'), Path(tmp_path)
+
+
+def write_pack(packs_dir, entries, file_mode=None):
+    """
+    Writes a new pack from `entries`, an iterable of
+    ``(key, content_bytes)`` pairs, which is consumed lazily
+    so that only the index records are held in memory.
+
+    The data file is renamed into place before its index, so
+    the presence of an ``.idx`` implies a complete ``.pack``.
+
+    :param file_mode (int): The permissions of the pack files,
+                            if not mkstemp's private ones
+    :return (Path): The path of the new ``.idx`` file, or None
+                    if `entries` was empty
+    """
+    packs_dir.mkdir(exist_ok=True)
+
+    records = []
+    key_len = None
+    offset = 0
+
+    f, tmp_pack_path = _mkstemp(packs_dir, file_mode)
+    try:
+        with f:
+            for key, content in entries:
+                key_bytes = key.encode()
+                if key_len is None:
+                    key_len = len(key_bytes)
+                assert len(key_bytes) == key_len, (
+                    "All keys in a pack must have the same length"
+                )
+                f.write(content)
+                records.append((key_bytes, offset, len(content)))
+                offset += len(content)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        tmp_pack_path.unlink()
+        raise
+
+    if not records:
+        tmp_pack_path.unlink()
+        return None
+
+    records.sort()
+
+    name_hash = hashlib.sha1()
+    f, tmp_idx_path = _mkstemp(packs_dir, file_mode)
+    try:
+        with f:
+            f.write(PackIndex.HEADER.pack(
+                PackIndex.MAGIC, PackIndex.VERSION, key_len, len(records)
+            ))
+            for key_bytes, offset, length in records:
+                name_hash.update(key_bytes)
+                f.write(key_bytes)
+                f.write(PackIndex.LOCATION.pack(offset, length))
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        tmp_pack_path.unlink()
+        tmp_idx_path.unlink()
+        raise
+
+    name = "pack-" + name_hash.hexdigest()
+    pack_path = packs_dir/(name + ".pack")
+    idx_path = packs_dir/(name + ".idx")
+
+    os.replace(str(tmp_pack_path), str(pack_path))
+    os.replace(str(tmp_idx_path), str(idx_path))
+
+    logger.debug(
+        logger.Fore.LIGHTGREEN_EX +
+        "PACKED" +
+        logger.Fore.RESET +
+        "  {} objects into {}".format(len(records), idx_path.name)
+    )
+
+    return idx_path
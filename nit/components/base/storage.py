@@ -1,13 +1,32 @@
 """
 """
-import hashlib
+import ctypes
 import io
 import os
 import shutil
-from nit.components.base.working_tree import BaseWorkingTree
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from nit.components.base.cache import ObjectCache, parse_size
+from nit.components.base.keys import KeyIndex, is_keyish
+from nit.components.base.pack import PackSet, write_pack
+from nit.components.base.working_tree import (
+    BaseWorkingTree, WorkingTreeWalker
+)
 from nit.core.config import BaseConfigBuilder
+from nit.core.objects.tree import Tree
+from nit.core.pathspec import Pathspec
 
-from nit.core.errors import NitUserError, NitRefNotFoundError
+from nit.core.hash_factory import DEFAULT_HASH_ALGORITHM, get_hash_fn
+from nit.core.errors import (
+    NitUnexpectedError,
+    NitUserError,
+    NitRefNotFoundError,
+    NitObjectNotFoundError
+)
 from nit.core.serialization import BaseSerializer
 from nit.core.storage import Storage
 from nit.core.log import getLogger
@@ -16,11 +35,97 @@ from nit.core.log import getLogger
 logger = getLogger(__name__)
 
 
+def copy_file_range(src_fd, src_offset, count, dst_fd):
+    """
+    Copies `count` bytes starting at `src_offset` in `src_fd`
+    to the current position of `dst_fd`, inside the kernel if
+    possible: first with copy_file_range(2), then sendfile(2),
+    and finally with an ordinary read/write loop.
+    """
+    copied = 0
+
+    copy_fns = [
+        lambda n: os.copy_file_range(
+            src_fd, dst_fd, n, src_offset + copied
+        ),
+        lambda n: os.sendfile(
+            dst_fd, src_fd, src_offset + copied, n
+        ),
+        lambda n: os.write(
+            dst_fd, os.pread(
+                src_fd, min(n, BaseStorage.CHUNK_SIZE),
+                src_offset + copied
+            )
+        ),
+    ]
+
+    for copy_fn in copy_fns:
+        try:
+            while copied < count:
+                n = copy_fn(count - copied)
+                if not n:
+                    break
+                copied += n
+        except (AttributeError, OSError):
+            # Not available on this platform or for these
+            # files; carry on with the next method
+            continue
+        if copied == count:
+            return
+
+    raise NitUnexpectedError(
+        "Copied {} of {} bytes".format(copied, count)
+    )
+
+
+def get_file_mode():
+    """
+    :return (int): The permissions that open() gives new files,
+                   under the current umask
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def sync_filesystem(path):
+    """
+    Flushes every pending write on the filesystem holding
+    `path` to disk: with syncfs(2) where it's available, and
+    otherwise with sync(2), which flushes every filesystem.
+    """
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.syncfs(fd) == 0:
+                return
+        except (AttributeError, OSError):
+            pass
+        os.sync()
+    finally:
+        os.close(fd)
+
+
 class BaseStorage(Storage):
 
     """
     """
 
+    # Large files are read, hashed and written in chunks
+    # of this many bytes
+    CHUNK_SIZE = 1024 * 1024
+
+    # Batch operations run their I/O, hashing and compression
+    # (all of which release the GIL) on a pool of core.threads
+    # threads, handing each one this many items at a time
+    THREAD_BATCH_SIZE = 32
+
+    # Default byte budgets of the object cache, overridden by
+    # the core.blobCacheLimit and core.objectCacheLimit settings
+    BLOB_CACHE_LIMIT = 8 * 1024 * 1024
+    OBJECT_CACHE_LIMIT = 32 * 1024 * 1024
+
     def __init__(
         self,
         paths,
@@ -32,6 +137,84 @@ class BaseStorage(Storage):
         self._serialization_cls = serialization_cls
         self._config_builder_cls = config_builder_cls
         self._working_tree_cls = working_tree_cls
+        self._packs = None
+        self._key_index = None
+        self._object_cache = None
+        self._pending_writes = None
+        self._pending_objects = None
+        self._hash_fn = None
+        self._threads = None
+        # Read here rather than on first use, since reading the
+        # umask briefly changes it, which isn't thread-safe
+        self._file_mode = get_file_mode()
+
+    @property
+    def object_cache(self):
+        """
+        :return (ObjectCache): Objects already loaded by this
+                               storage instance
+        """
+        if self._object_cache is None:
+            config = self.get_config()
+            self._object_cache = ObjectCache(
+                blob_limit=parse_size(config.get(
+                    "core.blobCacheLimit", self.BLOB_CACHE_LIMIT
+                )),
+                object_limit=parse_size(config.get(
+                    "core.objectCacheLimit", self.OBJECT_CACHE_LIMIT
+                ))
+            )
+        return self._object_cache
+
+    @property
+    def hash_algorithm(self):
+        """
+        The algorithm that keys are computed with, as recorded
+        in the repository's config when it was created. Only
+        the repository config is read: a repository without the
+        setting predates it, and so uses SHA-1.
+
+        :return (str): A name from `nit.core.hash_factory`
+        """
+        return (
+            self.get_config().repo_config.get(
+                "core.hashAlgorithm", recursive=False
+            ) or DEFAULT_HASH_ALGORITHM
+        )
+
+    @property
+    def key_index(self):
+        """
+        :return (KeyIndex): A sorted index of every key stored
+        """
+        if self._key_index is None:
+            self._key_index = KeyIndex(
+                self.paths.key_index, self._iter_all_keys
+            )
+        return self._key_index
+
+    def _iter_all_keys(self):
+        yield from self.packs
+        for object_path in self.paths.iter_loose_object_paths():
+            yield self.paths.get_object_key_for_path(object_path)
+
+    @property
+    def packs(self):
+        """
+        :return (PackSet): The packfiles in this repository
+        """
+        if self._packs is None:
+            self._packs = PackSet(self.paths.packs)
+        return self._packs
+
+    def close(self):
+        """
+        Unmaps the packs and the key index, if they were opened
+        """
+        if self._packs is not None:
+            self._packs.close()
+        if self._key_index is not None:
+            self._key_index.close()
 
     @property
     def exists(self):
@@ -43,15 +226,19 @@ class BaseStorage(Storage):
         except FileExistsError:
             assert path.is_dir()
 
-    def create(self, force=False):
+    def create(self, force=False, hash_algorithm=None):
         """
         Initialize the repository within the project directory
 
         :param force: Delete existing repository first, if found
+        :param hash_algorithm: The algorithm to compute keys with
+                               in a new repository, defaulting to
+                               the global core.hashAlgorithm
         """
         new = not self.exists
         self._mkdir(self.paths.repo)
         self._mkdir(self.paths.objects)
+        self._mkdir(self.paths.packs)
         self._mkdir(self.paths.refs)
         self._mkdir(self.paths.refs/"heads")
         self._mkdir(self.paths.refs/"tags")
@@ -59,6 +246,8 @@ class BaseStorage(Storage):
         self._mkdir(self.paths.repo/"info")
         with (self.paths.repo/"description").open('w') as f:
             f.write('No description')
+        if new:
+            self._record_hash_algorithm(hash_algorithm)
         try:
             self.get_symbolic_ref("HEAD")
         except NitRefNotFoundError:
@@ -84,6 +273,19 @@ class BaseStorage(Storage):
     def get_config(self):
         return self._config_builder_cls(self.paths)
 
+    def _record_hash_algorithm(self, hash_algorithm):
+        config = self.get_config()
+        hash_algorithm = (
+            hash_algorithm or
+            config.get("core.hashAlgorithm") or
+            DEFAULT_HASH_ALGORITHM
+        )
+        # Validate it before anything is written with it
+        get_hash_fn(hash_algorithm)
+        config.repo_config["core.hashAlgorithm"] = hash_algorithm
+        config.repo_config.save()
+        self._hash_fn = None
+
     def get(self, keyish):
         return self.get_object(keyish)
 
@@ -95,48 +297,426 @@ class BaseStorage(Storage):
         """
         return obj.accept_put(self)
 
+    def get_many(self, keyishes):
+        """
+        Loads many objects at once: keys are resolved and the
+        cache consulted up front, then the stored bytes of the
+        remaining objects are read on a thread pool.
+
+        :return (list): The objects, in the order of `keyishes`
+        """
+        keys = [self.resolve_key(keyish) for keyish in keyishes]
+
+        objs = {}
+        for key in keys:
+            obj = self.object_cache.get(key)
+            if obj is not None:
+                objs[key] = obj
+
+        missing_keys = sorted(set(keys) - set(objs))
+        stored = self.map_in_threads(
+            self._read_object_bytes, missing_keys
+        )
+
+        for key, content in zip(missing_keys, stored):
+            with io.BytesIO(content) as f:
+                obj = self._get_serializer(f).deserialize()
+            self.object_cache.put(
+                key, obj, self._get_cached_size(obj, len(content))
+            )
+            objs[key] = obj
+
+        return [objs[key] for key in keys]
+
+    def put_many(self, objs):
+        """
+        Stores many objects at once: they're hashed and written
+        on a thread pool, each object directory is created once,
+        and the key index is updated with a single write.
+
+        :return (list): The keys of the objects, in the order
+                        of `objs`
+        """
+        contents = [self._serialize_object_to_bytes(obj) for obj in objs]
+        keys = self.map_in_threads(
+            self.get_object_key_for_content, contents
+        )
+
+        new_objects = {}
+        for key, content in zip(keys, contents):
+            if key not in new_objects and not self._object_exists(key):
+                new_objects[key] = content
+
+        object_paths = {
+            key: self.paths.get_canonical_object_path(key)
+            for key in new_objects
+        }
+        self._mkdirs(object_paths.values())
+
+        tmp_paths = self.map_in_threads(
+            lambda key: self._write_object_tmp_file(
+                object_paths[key], new_objects[key]
+            ),
+            list(new_objects)
+        )
+
+        self._place_objects({
+            key: (tmp_path, object_paths[key])
+            for key, tmp_path in zip(new_objects, tmp_paths)
+        })
+        for key in new_objects:
+            self._log_object_added(key)
+
+        return keys
+
+    @property
+    def threads(self):
+        """
+        The core.threads setting: the number of threads batch
+        operations use, where 0 (the default) means one per CPU
+
+        :return (int):
+        """
+        if self._threads is None:
+            threads = self.get_config().get("core.threads") or 0
+            try:
+                threads = int(threads)
+                assert threads >= 0
+            except (ValueError, AssertionError):
+                raise NitUserError(
+                    "core.threads must be a positive integer, "
+                    "or 0 for one per CPU, not '{}'".format(threads)
+                )
+            self._threads = threads or os.cpu_count() or 1
+        return self._threads
+
+    def map_in_threads(self, fn, items):
+        """
+        Applies `fn` to each of `items` on a pool of `threads`
+        threads. `fn` mustn't use the object cache or the key
+        index, which aren't thread-safe.
+
+        :return (list): The results, in the order of `items`
+        """
+        items = list(items)
+        if self.threads == 1 or len(items) < 2:
+            return [fn(item) for item in items]
+
+        # Open the packs before any worker needs them
+        self.packs.packs
+
+        batch_size = self.THREAD_BATCH_SIZE
+        batches = [
+            items[i:i + batch_size]
+            for i in range(0, len(items), batch_size)
+        ]
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            return [
+                result
+                for batch_results in pool.map(
+                    lambda batch: [fn(item) for item in batch],
+                    batches
+                )
+                for result in batch_results
+            ]
+
+    def _mkdirs(self, file_paths):
+        """
+        Creates the parent directory of each of `file_paths`,
+        trying each distinct directory only once
+        """
+        for dir_path in sorted(set(p.parent for p in file_paths)):
+            self._mkdir(dir_path)
+
     def get_ref(self, ref):
         ref_path = self.paths.get_ref_path(ref)
-        if not ref_path.exists():
+        try:
+            b, _ = self._read_metadata(ref_path)
+        except FileNotFoundError:
             raise NitRefNotFoundError(ref_path)
-        with ref_path.open('rb') as file:
-            b = file.read()
-            return b.decode()
+        return b.decode()
 
     def put_ref(self, ref, key):
         relative_ref_path = self.paths.get_ref_relative_path(ref)
         ref_path = self.paths.get_ref_path(ref)
         os.makedirs(str(ref_path.parent), exist_ok=True)
-        with ref_path.open('wb') as file:
-            b = key.encode()
-            file.write(b)
+        b = key.encode()
+        self._write_metadata(ref_path, b)
         return str(relative_ref_path)
 
     def get_symbolic_ref(self, name):
         ref_path = self.paths.repo/name
-        if not ref_path.exists():
+        try:
+            b, _ = self._read_metadata(ref_path)
+        except FileNotFoundError:
             raise NitRefNotFoundError(ref_path)
-        with ref_path.open('rb') as file:
-            b = file.read()
-            symbolic_ref = b.decode()
-            if symbolic_ref.startswith('ref: '):
-                symbolic_ref = symbolic_ref[5:]
-            return symbolic_ref
+        symbolic_ref = b.decode()
+        if symbolic_ref.startswith('ref: '):
+            symbolic_ref = symbolic_ref[5:]
+        return symbolic_ref
 
     def put_symbolic_ref(self, name, ref):
         ref_path = self.paths.repo/name
-        with ref_path.open('wb') as file:
-            b = ref.encode()
-            file.write(b"ref: " + b)
+        b = ref.encode()
+        self._write_metadata(ref_path, b"ref: " + b)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Makes the writes in the body of a `with` statement
+        durable together (a group commit):
+
+        - Objects are written to temporary files, which aren't
+          synced one by one: the whole filesystem is synced once
+          at the end. Only then are they renamed to their object
+          paths and added to the key index, so an object is never
+          found under its key before its content is on disk.
+        - Refs and the index are held back, and written (and
+          synced) only after the objects, so they can never point
+          to objects that didn't make it to disk. They're read
+          back from memory in the meantime.
+
+        If the body raises, the held back writes are dropped,
+        leaving only unreferenced objects behind. Transactions
+        don't nest: an inner one joins the outer one.
+        """
+        if self._pending_writes is not None:
+            yield
+            return
+
+        self._pending_writes = OrderedDict()
+        self._pending_objects = pending_objects = {}
+        pending_writes = {}
+        try:
+            try:
+                yield
+                pending_writes = self._pending_writes
+            finally:
+                self._pending_objects = None
+                self._pending_writes = None
+                if pending_objects:
+                    # Once for the objects' content, then again
+                    # for their names
+                    sync_filesystem(self.paths.objects)
+                    for tmp_path, object_path in pending_objects.values():
+                        os.replace(str(tmp_path), str(object_path))
+                    sync_filesystem(self.paths.objects)
+                    self.key_index.add_many(pending_objects)
+
+            for file_path, content in pending_writes.items():
+                self._write_file_atomically(file_path, [content])
+        finally:
+            # Whatever wasn't renamed into place
+            for tmp_path, _ in pending_objects.values():
+                if tmp_path.exists():
+                    tmp_path.unlink()
+            self._pending_objects = None
+            self._pending_writes = None
+
+    def _read_metadata(self, file_path):
+        """
+        :return (tuple): The content of a ref or index file,
+                         including any write to it pending in
+                         the current transaction, and the mtime
+                         of the file in nanoseconds (None for a
+                         pending write)
+        """
+        if self._pending_writes and file_path in self._pending_writes:
+            return self._pending_writes[file_path], None
+        with file_path.open('rb') as f:
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            return f.read(), mtime_ns
+
+    def _write_metadata(self, file_path, content):
+        if self._pending_writes is not None:
+            # Keep the writes in the order they were last made
+            self._pending_writes.pop(file_path, None)
+            self._pending_writes[file_path] = content
+        else:
+            self._write_file_atomically(file_path, [content])
+
+    def _write_file_atomically(self, file_path, chunks):
+        """
+        Writes `chunks` to a temporary file next to `file_path`
+        and renames it into place, so that readers (and a crash)
+        see either the old file or the complete new one
+        """
+        tmp_path = self._write_tmp_file(file_path.parent, chunks)
+        try:
+            os.replace(str(tmp_path), str(file_path))
+        except BaseException:
+            tmp_path.unlink()
+            raise
+
+    def _write_tmp_file(self, dir_path, chunks):
+        """
+        Writes `chunks` to a new temporary file in `dir_path`,
+        synced unless a transaction will sync it
+
+        :return (Path):
+        """
+        fd, tmp_path = self._mkstemp(dir_path)
+        tmp_path = Path(tmp_path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                self._sync_file(f)
+        except BaseException:
+            tmp_path.unlink()
+            raise
+        return tmp_path
+
+    def _mkstemp(self, dir_path):
+        """
+        Creates a temporary file in `dir_path` to be renamed into
+        place, with the permissions of a file made by open()
+        rather than mkstemp's private ones
+
+        :return (tuple): (open fd, path)
+        """
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=str(dir_path))
+        os.fchmod(fd, self._file_mode)
+        return fd, tmp_path
+
+    def _sync_file(self, f):
+        """
+        Flushes the open file `f` to disk, unless a transaction
+        will sync it along with everything else
+        """
+        if self._pending_writes is None:
+            f.flush()
+            os.fsync(f.fileno())
 
     def get_object(self, keyish):
-        file_path = self.paths.get_object_path(
-            keyish, must_exist=True
+        obj = self.object_cache.get(keyish)
+        if obj is not None:
+            return obj
+
+        key = self.resolve_key(keyish)
+        if key != keyish:
+            obj = self.object_cache.get(key)
+            if obj is not None:
+                return obj
+
+        with self._open_object(key) as f:
+            s = self._get_serializer(f)
+            obj = s.deserialize()
+            size = f.seek(0, io.SEEK_END)
+
+        self.object_cache.put(key, obj, self._get_cached_size(obj, size))
+        return obj
+
+    def _read_object_bytes(self, key):
+        with self._open_object(key) as f:
+            return f.read()
+
+    def _open_object(self, key):
+        """
+        Opens the stored bytes of the object `key`, looking in
+        the packs (through their indexes) before falling back
+        to the loose object files.
+
+        :return: A readable binary file-like object
+        """
+        content = self.packs.read(key)
+        if content is not None:
+            return io.BytesIO(content)
+
+        if self._pending_objects and key in self._pending_objects:
+            return self._pending_objects[key][0].open('rb')
+
+        object_path = self.paths.get_existing_object_path(key)
+        if object_path is None:
+            raise NitObjectNotFoundError(
+                "No object matching '{}'".format(key)
+            )
+        return object_path.open('rb')
+
+    def resolve_key(self, keyish):
+        """
+        Expands `keyish`, which may be an abbreviated key, to
+        the full key of exactly one stored object.
+
+        Full keys are looked up in the key index. An abbreviated
+        key is also matched against the packs and the object
+        directory, since an object the index doesn't know about
+        (e.g. one written by another tool) can make it ambiguous.
+
+        :return (str):
+        """
+        if not is_keyish(keyish):
+            raise NitObjectNotFoundError(
+                "No object matching '{}'".format(keyish)
+            )
+
+        if keyish in self.key_index:
+            return keyish
+
+        if self._has_unindexed_object(keyish):
+            return keyish
+
+        keys = set(self.key_index.find_keys_matching(keyish))
+        if self._pending_objects:
+            keys.update(
+                key for key in self._pending_objects
+                if key.startswith(keyish)
+            )
+        keys.update(self.packs.find_keys_matching(keyish))
+
+        loose_keys = {
+            self.paths.get_object_key_for_path(p)
+            for p in self.paths.iter_object_paths_matching(keyish)
+        }
+        unindexed_keys = loose_keys - keys
+        if unindexed_keys:
+            self.key_index.add_many(unindexed_keys)
+            keys.update(unindexed_keys)
+
+        if len(keys) == 1:
+            return keys.pop()
+
+        if len(keys) > 1:
+            logger.debug(
+                "Multiple objects found:\n{}".format(
+                    "\n".join("    " + k for k in sorted(keys))
+                )
+            )
+            raise NitObjectNotFoundError(
+                "Multiple objects matching '{}'".format(keyish)
+            )
+
+        raise NitObjectNotFoundError(
+            "No object matching '{}'".format(keyish)
         )
 
-        with file_path.open('rb') as f:
-            s = self._serialization_cls(f)
-            return s.deserialize()
+    def has_object(self, key):
+        """
+        :return (bool): True if an object with exactly `key`
+                        is stored, packed or loose
+        """
+        return (
+            key in self.key_index or
+            self._has_unindexed_object(key)
+        )
+
+    def has_objects(self, keys):
+        """
+        :return (list): `has_object` for each of `keys`, in order
+        """
+        return [self.has_object(key) for key in keys]
+
+    def _has_unindexed_object(self, key):
+        if self._pending_objects and key in self._pending_objects:
+            return True
+        if (
+            key in self.packs or
+            self.paths.get_existing_object_path(key) is not None
+        ):
+            self.key_index.add(key)
+            return True
+        return False
 
     def put_object(self, obj):
         content = self._serialize_object_to_bytes(obj)
@@ -151,51 +731,377 @@ class BaseStorage(Storage):
         :param content:
         :return:
         """
-        file_path = self.paths.get_object_path(
-            key, must_exist=False
+        file_path = self.paths.get_canonical_object_path(key)
+
+        if self._object_exists(key):
+            return
+
+        self._mkdir(file_path.parent)
+        tmp_path = self._write_object_tmp_file(file_path, content)
+        self._place_objects({key: (tmp_path, file_path)})
+
+        self._log_object_added(key)
+
+    def _write_object_tmp_file(self, file_path, content):
+        """
+        :return (Path): A temporary file next to `file_path`
+                        holding the stored form of `content`
+        """
+        return self._write_tmp_file(
+            file_path.parent, self._encode_object_chunks([content])
         )
 
-        dir_path = file_path.parent
+    def _place_objects(self, placements):
+        """
+        Renames the temporary files of new objects to their
+        object paths, and adds their keys to the key index. In
+        a transaction, both wait until the transaction's sync.
+
+        :param placements (dict): (temporary path, object path)
+                                  by key
+        """
+        if self._pending_objects is not None:
+            self._pending_objects.update(placements)
+            return
+        for tmp_path, object_path in placements.values():
+            os.replace(str(tmp_path), str(object_path))
+        self.key_index.add_many(placements)
+
+    def put_blob_from_path(self, file_path):
+        """
+        Stores the file at `file_path` as a Blob without reading
+        it into memory: the blob header is built from the file
+        size, then the content is hashed and written in chunks
+        to a temporary file, which is renamed into place once
+        its key is known.
+
+        :return (str): The key of the blob
+        """
+        return self.put_blobs_from_paths([file_path])[0]
+
+    def put_blobs_from_paths(self, file_paths):
+        """
+        Stores each of the files at `file_paths` as a Blob, like
+        `put_blob_from_path`. The files are hashed and written
+        to their temporary files on a thread pool; the renames
+        into place and the key index update happen afterwards.
+
+        :return (list): The keys of the blobs, in the order of
+                        `file_paths`
+        """
+        file_paths = list(file_paths)
+        staged = []
+        placements = {}
+
+        def stage(file_path):
+            staged_blob = self._stage_blob_from_path(file_path)
+            staged.append(staged_blob)
+            return staged_blob
 
         try:
-            dir_path.mkdir()
-        except FileExistsError:
-            pass
+            staged_blobs = self.map_in_threads(stage, file_paths)
+            keys = [key for key, _ in staged_blobs]
+
+            new_placements = {}
+            for key, tmp_path in staged_blobs:
+                if key in new_placements or self._object_exists(key):
+                    tmp_path.unlink()
+                    continue
+                new_placements[key] = (
+                    tmp_path, self.paths.get_canonical_object_path(key)
+                )
+
+            self._mkdirs(p for _, p in new_placements.values())
+
+            self._place_objects(new_placements)
+            placements = new_placements
+            for key in placements:
+                self._log_object_added(key)
+
+        finally:
+            # A transaction's objects stay in their temporary
+            # files until it's synced
+            placed = set(tmp_path for tmp_path, _ in placements.values())
+            for _, tmp_path in staged:
+                if tmp_path not in placed and tmp_path.exists():
+                    tmp_path.unlink()
+
+        return keys
+
+    def _stage_blob_from_path(self, file_path):
+        """
+        Hashes the file at `file_path` as a Blob while writing
+        its stored form to a temporary file in the object dir
+
+        :return (tuple): (key, temporary file path)
+        """
+        fd, tmp_path = self._mkstemp(self.paths.objects)
+        tmp_path = Path(tmp_path)
+
+        try:
+            key_hash = self._new_key_hash()
+
+            def iter_hashed_chunks():
+                for chunk in self._iter_blob_chunks_from_path(file_path):
+                    key_hash.update(chunk)
+                    yield chunk
+
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in self._encode_object_chunks(
+                    iter_hashed_chunks()
+                ):
+                    f.write(chunk)
+                self._sync_file(f)
+
+        except BaseException:
+            tmp_path.unlink()
+            raise
+
+        return key_hash.hexdigest(), tmp_path
+
+    # Enough bytes to hold any object header
+    HEADER_SIZE_MAX = 1024
+
+    def copy_blob_to_path(self, key, file_path):
+        """
+        Writes the content of the blob `key` to `file_path`.
+
+        When the blob is stored verbatim after its header (in a
+        loose file or a pack) the content is copied straight
+        from the object file by the kernel, without passing
+        through Python; otherwise the blob is deserialized and
+        written out.
+        """
+        location = self._locate_blob_content(key)
+
+        with open(str(file_path), 'wb') as f:
+            if location:
+                src_file, offset, length = location
+                with src_file:
+                    copy_file_range(
+                        src_file.fileno(), offset, length, f.fileno()
+                    )
+            else:
+                # Bypasses the object cache, which isn't safe to
+                # use from copy_blobs_to_paths' worker threads
+                with self._open_object(key) as src_file:
+                    blob = self._get_serializer(src_file).deserialize()
+                f.write(blob.content)
+
+    def copy_blobs_to_paths(self, keys_and_paths):
+        """
+        Like `copy_blob_to_path`, for each (key, file path) pair
+        in `keys_and_paths`, copying on a thread pool
+        """
+        self.map_in_threads(
+            lambda key_and_path: self.copy_blob_to_path(*key_and_path),
+            list(keys_and_paths)
+        )
+
+    def _locate_blob_content(self, key):
+        """
+        :return (tuple): (open file, offset, length) of the
+                         verbatim content of blob `key`, or None
+        """
+        packed = self.packs.locate(key)
+
+        if packed:
+            pack, offset, length = packed
+            src_file = os.fdopen(os.dup(pack.fileno()), 'rb')
+            header = pack.read_at(
+                offset, min(length, self.HEADER_SIZE_MAX)
+            )
+            stream = io.BytesIO(header)
+        else:
+            src_file = self._open_object(key)
+            offset, length = 0, os.fstat(src_file.fileno()).st_size
+            stream = src_file
+
+        try:
+            blob_len = self._get_serializer(
+                stream
+            ).deserialize_blob_header()
+        except (NotImplementedError, ValueError):
+            blob_len = None
+
+        header_len = stream.tell()
+
+        if blob_len is None or header_len + blob_len != length:
+            src_file.close()
+            return None
+
+        return src_file, offset + header_len, blob_len
+
+    def _iter_blob_chunks_from_path(self, file_path):
+        """
+        Yields the canonical serialized bytes of the file at
+        `file_path` as a Blob, in chunks of at most CHUNK_SIZE
+        """
+        with open(str(file_path), 'rb') as f:
+            remaining = os.fstat(f.fileno()).st_size
+
+            with io.BytesIO() as memory_file:
+                s = self._get_canonical_serializer(memory_file)
+                s.serialize_blob_header(remaining)
+                yield memory_file.getvalue()
+
+            while remaining:
+                chunk = f.read(min(self.CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
 
-        if file_path.exists():
+            if remaining or f.read(1):
+                raise NitUserError(
+                    "The file '{}' changed while it was "
+                    "being read".format(file_path)
+                )
+
+    def _object_exists(self, key):
+        # Only the key index (and the objects pending in the
+        # transaction) are checked: if the index has missed an
+        # object, rewriting the object is harmless
+        if (
+            (self._pending_objects and key in self._pending_objects) or
+            key in self.key_index
+        ):
             logger.debug(
                 logger.Fore.LIGHTBLACK_EX +
                 "EXISTS" +
                 logger.Fore.RESET +
                 "  {}".format(key)
             )
+            return True
 
-        else:
-            with file_path.open('wb') as f:
-                f.write(content)
+        return False
 
-            logger.debug(
-                logger.Fore.LIGHTGREEN_EX +
-                "ADDED" +
-                logger.Fore.RESET +
-                "   {}".format(key)
-            )
+    def _log_object_added(self, key):
+        logger.debug(
+            logger.Fore.LIGHTGREEN_EX +
+            "ADDED" +
+            logger.Fore.RESET +
+            "   {}".format(key)
+        )
+
+    def repack(self):
+        """
+        Moves every loose object into a new packfile
+
+        :return (int): The number of objects packed, not
+                       counting loose copies of objects that
+                       were already in a pack
+        """
+        loose_paths = sorted(
+            self.paths.iter_loose_object_paths()
+        )
+        packed_keys = []
+
+        def iter_entries():
+            for object_path in loose_paths:
+                key = self.paths.get_object_key_for_path(object_path)
+                if key in self.packs:
+                    continue
+                with object_path.open('rb') as f:
+                    yield key, f.read()
+                packed_keys.append(key)
+
+        write_pack(
+            self.paths.packs, iter_entries(), file_mode=self._file_mode
+        )
+        self.packs.reload()
+
+        for object_path in loose_paths:
+            key = self.paths.get_object_key_for_path(object_path)
+            if key not in self.packs:
+                raise NitUnexpectedError(
+                    "{} is missing from the new pack, so its loose "
+                    "object wasn't removed".format(key)
+                )
+            object_path.unlink()
+
+        return len(packed_keys)
+
+    def migrate_objects(self, paths):
+        """
+        Moves every loose object to the path that `paths` gives
+        it, then uses `paths` from now on. Each object is moved
+        with an atomic rename, so the store stays readable while
+        it's being migrated.
+
+        :return (int): The number of objects moved
+        """
+        count = 0
+
+        for object_path in list(self.paths.iter_loose_object_paths()):
+            key = self.paths.get_object_key_for_path(object_path)
+            new_object_path = paths.get_canonical_object_path(key)
+            if new_object_path == object_path:
+                continue
+            self._mkdir(new_object_path.parent)
+            os.replace(str(object_path), str(new_object_path))
+            count += 1
+
+        # Clean up any shard directories left empty
+        for dir_path in self.paths.objects.iterdir():
+            if dir_path.is_dir() and dir_path != self.paths.packs:
+                try:
+                    dir_path.rmdir()
+                except OSError:
+                    pass
+
+        self.paths = paths
+        return count
 
     def get_index(self):
         try:
-            with open(self.paths.index_str, 'rb') as f:
-                s = self._serialization_cls(f)
-                return s.deserialize()
+            b, mtime_ns = self._read_metadata(self.paths.index)
         except FileNotFoundError:
             return None
+        with io.BytesIO(b) as f:
+            s = self._get_serializer(f)
+            index = s.deserialize()
+        index.mtime_ns = mtime_ns
+        return index
 
     def put_index(self, index):
-        with self.paths.index.open('wb') as file:
-            s = self._serialization_cls(file)
+        index.drop_racy_stats(time.time_ns())
+        with io.BytesIO() as memory_file:
+            s = self._get_serializer(memory_file)
             s.serialize(index)
+            self._write_metadata(
+                self.paths.index, memory_file.getvalue()
+            )
+
+    def get_working_tree(
+        self, index=None, ignore=None, changed_paths=None,
+        pathspec=None, untracked=True
+    ):
+        """
+        :param index: If given, files whose stat data matches
+                      their entry in `index` aren't hashed again
+        :param ignore: If given, directories it ignores aren't
+                       walked (see `BaseWorkingTree`)
+        :param changed_paths: If given, with `index`, the only
+                              paths that may differ from it
+        :param pathspec: If given, the only files to include
+        :param untracked: If False, only the files in `index`
+                          are included
+        """
+        return self._working_tree_cls(
+            self, index=index, ignore=ignore,
+            changed_paths=changed_paths, pathspec=pathspec,
+            untracked=untracked
+        )
 
-    def get_working_tree(self):
-        return self._working_tree_cls(self)
+    def iter_working_tree_paths(self, index=None, ignore=None):
+        """
+        Yields the relative path of every file in the working
+        tree, lazily, without reading or stat'ing the files
+        (see `WorkingTreeWalker`)
+        """
+        walker = WorkingTreeWalker(self, index=index, ignore=ignore)
+        return walker.iter_file_strs()
 
     def put_blob(self, blob):
         return self.put_object(blob)
@@ -206,27 +1112,234 @@ class BaseStorage(Storage):
     def put_tree(self, tree):
         return self.put_object(tree)
 
+    def put_nested_tree(self, tree, tree_cache=None):
+        """
+        Stores `tree` as a tree for each directory, holding a
+        node for each of its files and a subtree node (with the
+        key of the subdirectory's tree) for each subdirectory.
+        Changing a file then only changes the trees of the
+        directories containing it; every other tree is shared
+        with the commits before.
+
+        The trees are stored a level at a time, deepest first,
+        since a tree's key depends on its subtrees' keys.
+
+        :param tree: Has a node for every file, by its path
+                     from the project directory
+        :param tree_cache (dict): The keys of trees already
+                                  stored for directories that
+                                  haven't changed, by path,
+                                  which aren't built again;
+                                  updated to hold the key of
+                                  every directory in `tree`
+        :return (str): The key of the project directory's tree
+        """
+        if tree_cache is None:
+            tree_cache = {}
+
+        # dir str -> [(name, key)] of its files
+        file_entries = {"": []}
+        # dir str -> names of its subdirectories
+        dir_names = {}
+        for node in tree:
+            dir_str, _, name = node.path_str.rpartition(os.path.sep)
+            child_str = dir_str
+            while child_str not in file_entries:
+                file_entries[child_str] = []
+                parent_str, _, child_name = child_str.rpartition(
+                    os.path.sep
+                )
+                dir_names.setdefault(parent_str, []).append(child_name)
+                child_str = parent_str
+            file_entries[dir_str].append((name, node.key))
+
+        dir_strs_by_depth = {}
+        for dir_str in file_entries:
+            depth = dir_str.count(os.path.sep) + 1 if dir_str else 0
+            dir_strs_by_depth.setdefault(depth, []).append(dir_str)
+
+        keys = {}
+        built = 0
+        for depth in sorted(dir_strs_by_depth, reverse=True):
+            new_dir_strs = []
+            new_trees = []
+            for dir_str in dir_strs_by_depth[depth]:
+                key = tree_cache.get(dir_str)
+                if key is not None:
+                    keys[dir_str] = key
+                    continue
+                new_dir_strs.append(dir_str)
+                new_trees.append(Tree(
+                    [
+                        Tree.Node(name, file_key)
+                        for name, file_key in file_entries[dir_str]
+                    ] + [
+                        Tree.Subtree(name, keys[os.path.join(dir_str, name)])
+                        for name in dir_names.get(dir_str, ())
+                    ]
+                ))
+            if new_trees:
+                keys.update(zip(new_dir_strs, self.put_many(new_trees)))
+                built += len(new_trees)
+
+        logger.trace(
+            "Built {} of {} directory trees".format(built, len(keys))
+        )
+
+        tree_cache.clear()
+        tree_cache.update(keys)
+        return keys[""]
+
+    def get_nested_tree(self, key, tree_cache=None, index=None):
+        """
+        Loads a tree stored by `put_nested_tree`, and all of its
+        subtrees, a level at a time. A tree stored by `put_tree`
+        as a single, flat tree loads the same way.
+
+        :param tree_cache (dict): If given, the key of the tree
+                                  of each directory is added to
+                                  it, by path
+        :param index (Index): If given, a subtree with the key
+                              that the index's tree cache has for
+                              its directory isn't loaded, since
+                              the index has the same files below
+                              the directory: they're taken from
+                              the index instead
+        :return (Tree): A tree with a node for every file, by
+                        its path from the project directory
+        """
+        nodes = []
+        reused_dir_strs = []
+        level = [("", key)]
+        while level:
+            next_level = []
+            if index is not None:
+                for dir_str, tree_key in level:
+                    if index.tree_cache.get(dir_str) == tree_key:
+                        reused_dir_strs.append(dir_str)
+                level = [
+                    (dir_str, tree_key) for dir_str, tree_key in level
+                    if index.tree_cache.get(dir_str) != tree_key
+                ]
+            trees = self.get_many([tree_key for _, tree_key in level])
+            for (dir_str, tree_key), tree in zip(level, trees):
+                self._check_is_tree(tree_key, tree)
+                if tree_cache is not None:
+                    tree_cache[dir_str] = tree_key
+                for node in tree:
+                    if node.is_tree:
+                        next_level.append((
+                            os.path.join(dir_str, node.path_str),
+                            node.key
+                        ))
+                    elif dir_str:
+                        nodes.append(Tree.Node(
+                            os.path.join(dir_str, node.path_str),
+                            node.key
+                        ))
+                    else:
+                        nodes.append(node)
+            level = next_level
+
+        if reused_dir_strs:
+            logger.trace(
+                "Reused {} directory trees from the index".format(
+                    len(reused_dir_strs)
+                )
+            )
+            reused = Pathspec(reused_dir_strs)
+            nodes.extend(reused.filter(index))
+            if tree_cache is not None:
+                tree_cache.update(
+                    (dir_str, tree_key)
+                    for dir_str, tree_key in index.tree_cache.items()
+                    if reused.matches(dir_str)
+                )
+        return Tree(nodes)
+
+    @staticmethod
+    def _check_is_tree(key, obj):
+        if not isinstance(obj, Tree):
+            raise NitUserError(
+                "The object '{}' is a {}, not a tree".format(
+                    key, obj.__class__.__name__
+                )
+            )
+
     def get_object_key_for(
         self, obj
     ):
         content = self._serialize_object_to_bytes(obj)
         return self.get_object_key_for_content(content)
 
+    def get_object_key_for_path(self, file_path):
+        """
+        The key that the file at `file_path` would have if it
+        were stored as a Blob, computed in constant memory
+
+        :return (str):
+        """
+        key_hash = self._new_key_hash()
+        for chunk in self._iter_blob_chunks_from_path(file_path):
+            key_hash.update(chunk)
+        return key_hash.hexdigest()
+
     def get_object_key_for_content(self, content):
         """
         :param content:
         :return:
         """
-        return hashlib.sha1(content).hexdigest()
+        key_hash = self._new_key_hash()
+        key_hash.update(content)
+        return key_hash.hexdigest()
 
-    def _serialize_object_to_bytes(self, obj):
+    def _new_key_hash(self):
+        if self._hash_fn is None:
+            self._hash_fn = get_hash_fn(self.hash_algorithm)
+        return self._hash_fn()
+
+    def _get_serializer(self, stream):
+        """
+        :return (Serializer): The serializer used to read and
+                              write `stream` in this repository
+        """
+        return self._get_canonical_serializer(stream)
+
+    def _get_canonical_serializer(self, stream):
+        """
+        :return (Serializer): The serializer used to write the
+                              canonical form of objects (which
+                              their keys are computed from) to
+                              `stream`
+        """
+        return self._serialization_cls(stream)
+
+    def _encode_object_chunks(self, chunks):
+        """
+        Transforms the canonical bytes of an object (the bytes
+        its key is computed from) into the bytes stored on disk.
+
+        :param chunks: An iterable of bytes
+        :return: An iterable of bytes
         """
+        return chunks
 
+    def _get_cached_size(self, obj, stored_size):
+        """
+        :param stored_size: The number of bytes `obj` was read from
+        :return (int): The number of bytes to charge the object
+                       cache for `obj`, which for canonical bytes
+                       stored as they are is `stored_size`
+        """
+        return stored_size
+
+    def _serialize_object_to_bytes(self, obj):
+        """
         :param obj:
-        :return:
+        :return (bytes): The canonical serialized form of `obj`
         """
         with io.BytesIO() as memory_file:
-            s = self._serialization_cls(memory_file)
+            s = self._get_canonical_serializer(memory_file)
             s.serialize(obj)
             return memory_file.getvalue()
 
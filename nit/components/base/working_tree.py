@@ -2,12 +2,12 @@
 """
 """
 import os
+import stat
 from pathlib import Path
-from nit.core.errors import NitExpectedError
+from nit.core.errors import NitExpectedError, NitObjectNotFoundError
 from nit.core.log import getLogger
-from nit.core.objects.blob import Blob
 from nit.core.objects.commit import Commit
-from nit.core.objects.index import Index
+from nit.core.objects.index import DirCacheEntry, Index, IndexStat
 from nit.core.objects.tree import TreeNode, Tree
 
 from nit.core.working_tree import WorkingTree
@@ -16,48 +16,270 @@ from nit.core.working_tree import WorkingTree
 logger = getLogger(__name__)
 
 
-class BaseWorkingTree(WorkingTree):
+class WorkingTreeWalker:
 
     """
-    Creates a `Tree` from the project's working directory.
+    Walks the project's working directory, without reading or
+    stat'ing any files, so that callers can stop early.
+
+    Given an `index`, a directory whose mtime matches its entry
+    in the index's directory cache isn't listed again.
+    `dir_cache` holds the listing of every directory walked,
+    and `dir_cache_refreshed` is True if any had to be read.
+
+    Given an `ignore` predicate, ignored directories are pruned
+    from the walk, unless the index tracks files inside them.
+
+    Given `changed_paths`, the relative paths that a filesystem
+    monitor saw change since the index was written, any other
+    directory in the directory cache is taken to be unchanged
+    without even being stat'ed.
+
+    Given a `pathspec` (see `nit.core.pathspec`), only the files
+    it matches are walked, and if `untracked` is False, only the
+    files in the index are. Either makes the walk `partial`.
     """
 
-    def __init__(self, storage, ignore=None):
+    def __init__(
+        self, storage, ignore=None, index=None, changed_paths=None,
+        pathspec=None, untracked=True
+    ):
         self.storage = storage
         self.ignore = ignore
+        self.index = index
+        self.changed_paths = changed_paths
+        self.pathspec = pathspec
+        self.untracked = untracked
+        self.partial = pathspec is not None or not untracked
         self.paths = self.storage.paths
+        self.dir_cache = {}
+        self.dir_cache_refreshed = False
+        self._tracked_dir_strs = self._get_tracked_dir_strs()
+        self._tracked_file_strs = (
+            self.index.nodes_by_path_str
+            if self.index is not None else {}
+        )
 
-        super().__init__(nodes=[])
+    def walk(self):
+        """
+        Yields (dir path, subdir names, file names) for every
+        directory in the project, like os.walk, except for the
+        repository directory
+        """
+        for dir_path, dir_str, entry in self._walk_dir(
+            str(self.paths.project), ""
+        ):
+            yield (
+                dir_path,
+                list(entry.dir_names),
+                self._filter_file_names(dir_str, entry.file_names)
+            )
 
-        for base, dir_names, file_names in self.walk():
-            self._walk_files(base, file_names)
+    def iter_file_strs(self):
+        """
+        Yields the relative path of every file in the project,
+        except for the repository directory
+        """
+        for _, dir_str, entry in self._walk_dir(
+            str(self.paths.project), ""
+        ):
+            for file_name in self._filter_file_names(
+                dir_str, entry.file_names
+            ):
+                yield os.path.join(dir_str, file_name)
 
-    def _walk_files(self, base, file_names):
-        for filename in file_names:
-            self._walk_file(base, filename)
+    def _filter_file_names(self, dir_str, file_names):
+        if not self.partial:
+            return list(file_names)
+        return [
+            file_name for file_name in file_names
+            if self._include_file(os.path.join(dir_str, file_name))
+        ]
 
-    def _exclude_path(self, p):
-        return not (p.is_file() and p.exists())
+    def _include_file(self, file_str):
+        if self.pathspec is not None and not self.pathspec.matches(
+            file_str
+        ):
+            return False
+        return self.untracked or file_str in self._tracked_file_strs
 
-    def _walk_file(self, base, filename):
-        p = Path(os.path.join(base, filename))
-        p.resolve()
-        if self._exclude_path(p):
+    def _get_tracked_dir_strs(self):
+        """
+        :return (set): The relative paths of the directories
+                       that contain files in the index
+        """
+        dir_strs = set()
+        if self.index is not None:
+            for node in self.index:
+                dir_strs.update(str(p) for p in node.path.parents)
+        return dir_strs
+
+    def _exclude_dir(self, dir_str):
+        # The repository is never part of the working tree, and
+        # changes with every command, which would invalidate its
+        # entry in the directory cache every time
+        if dir_str == self.paths.repo_name:
+            return True
+
+        if self.pathspec is not None and not self.pathspec.matches_below(
+            dir_str
+        ):
+            return True
+
+        if not self.untracked and dir_str not in self._tracked_dir_strs:
+            return True
+
+        # A tracked file in an ignored directory must still be
+        # found, or it would look as though it had been removed
+        return (
+            self.ignore is not None and
+            dir_str not in self._tracked_dir_strs and
+            self.ignore(Path(dir_str))
+        )
+
+    def _walk_dir(self, dir_path, dir_str):
+        """
+        Yields (dir path, relative dir path, DirCacheEntry) for
+        the directory at `dir_path` and those below it
+        """
+        try:
+            entry = None
+            if (
+                self.changed_paths is not None and
+                dir_str not in self.changed_paths
+            ):
+                entry = self.index.dir_cache.get(dir_str)
+            if entry is None:
+                st = os.stat(dir_path)
+                if self.index is not None:
+                    entry = self.index.get_clean_dir(dir_str, st)
+            if entry is None:
+                entry = self._list_dir(dir_path, st)
+                self.dir_cache_refreshed = True
+        except OSError:
+            # Gone, or unreadable; os.walk skips these too
             return
-        node = self._read_tree_node(p)
-        self.add_node(node)
 
-    def _read_tree_node(self, p):
+        self.dir_cache[dir_str] = entry
+
+        yield dir_path, dir_str, entry
+
+        for dir_name in entry.dir_names:
+            sub_dir_str = os.path.join(dir_str, dir_name)
+            if self._exclude_dir(sub_dir_str):
+                continue
+            yield from self._walk_dir(
+                os.path.join(dir_path, dir_name), sub_dir_str
+            )
+
+    def _list_dir(self, dir_path, st):
+        dir_names = []
+        file_names = []
+        with os.scandir(dir_path) as it:
+            for dir_entry in it:
+                if dir_entry.is_dir(follow_symlinks=False):
+                    dir_names.append(dir_entry.name)
+                elif not dir_entry.is_dir():
+                    file_names.append(dir_entry.name)
+        return DirCacheEntry(
+            st.st_mtime_ns, tuple(dir_names), tuple(file_names)
+        )
+
+
+class BaseWorkingTree(WorkingTreeWalker, WorkingTree):
+
+    """
+    Creates a `Tree` from the project's working directory,
+    walked as described in `WorkingTreeWalker`.
+
+    Given an `index`, a file whose stat data matches its index
+    entry takes its key from the index without being read. The
+    stat data of files that were hashed and found to match the
+    index is collected in `refreshed_stats`, for the caller to
+    save to the index.
+
+    Given `changed_paths`, any other file with stat data in the
+    index is taken to be unchanged without even being stat'ed.
+    Files found to differ from the index are collected in
+    `stale_stats`, since their stat data in the index no longer
+    describes them.
+    """
+
+    def __init__(
+        self, storage, ignore=None, index=None, changed_paths=None,
+        pathspec=None, untracked=True
+    ):
+        WorkingTreeWalker.__init__(
+            self, storage, ignore=ignore, index=index,
+            changed_paths=changed_paths, pathspec=pathspec,
+            untracked=untracked
+        )
+        self.refreshed_stats = {}
+        self.stale_stats = set()
+
+        file_paths = [
+            Path(os.path.join(base, filename))
+            for base, dir_names, file_names in self.walk()
+            for filename in file_names
+        ]
+
+        WorkingTree.__init__(
+            self, nodes=self._read_tree_nodes(file_paths)
+        )
+
+    def _read_tree_nodes(self, file_paths):
+        """
+        Reads and hashes the files at `file_paths` on the
+        storage's thread pool (see the core.threads setting)
+
+        :return (list): A TreeNode for each file not excluded,
+                        in the order of `file_paths`
+        """
+        nodes = self.storage.map_in_threads(
+            self._read_file_node, file_paths
+        )
+        return [node for node in nodes if node is not None]
+
+    def _exclude_path(self, p, st):
+        return not stat.S_ISREG(st.st_mode)
+
+    def _read_file_node(self, p):
+        if self.changed_paths is not None:
+            node = self._read_unchanged_node(p)
+            if node is not None:
+                return node
+        try:
+            st = os.stat(str(p))
+        except FileNotFoundError:
+            return None
+        if self._exclude_path(p, st):
+            return None
+        return self._read_tree_node(p, st)
+
+    def _read_unchanged_node(self, p):
+        rp_str = str(p.relative_to(self.paths.project))
+        if rp_str in self.changed_paths or rp_str not in self.index.stats:
+            return None
+        # Nodes are immutable, so the index's can be shared
+        return self.index.nodes_by_path_str.get(rp_str)
+
+    def _read_tree_node(self, p, st):
         rp = p.relative_to(self.paths.project)
-        with p.open('rb') as file:
-            contents = file.read()
-            blob = Blob(contents)
-            key = self.storage.get_object_key_for(blob)
-            node = TreeNode(rp, key)
-        return node
+        if self.index is None:
+            return TreeNode(rp, self.storage.get_object_key_for_path(p))
 
-    def walk(self):
-        yield from os.walk(str(self.paths.project))
+        rp_str = str(rp)
+        key = self.index.get_clean_key(rp_str, st)
+        if key is None:
+            key = self.storage.get_object_key_for_path(p)
+            node = self.index.nodes_by_path_str.get(rp_str)
+            if node is not None and node.key == key:
+                self.refreshed_stats[rp_str] = (
+                    IndexStat.from_stat_result(st)
+                )
+            elif rp_str in self.index.stats:
+                self.stale_stats.add(rp_str)
+        return TreeNode(rp_str, key)
 
 
 class BaseWorkingTreeEditor(BaseWorkingTree):
@@ -65,8 +287,8 @@ class BaseWorkingTreeEditor(BaseWorkingTree):
     """
     """
 
-    def __init__(self, storage, ignore):
-        super().__init__(storage, ignore=ignore)
+    def __init__(self, storage, ignore, index=None):
+        super().__init__(storage, ignore=ignore, index=index)
 
     def merge(self, tree):
         """
@@ -111,9 +333,15 @@ class BaseWorkingTreeEditor(BaseWorkingTree):
             logger.debug(node.path)
             cp_path = self.storage.paths.project/node.path
             assert cp_path.is_absolute()
-            self.storage.get(node.key)
             cp_keys_and_paths.append((node.key, cp_path))
 
+        cp_keys = [key for key, _ in cp_keys_and_paths]
+        for key, found in zip(cp_keys, self.storage.has_objects(cp_keys)):
+            if not found:
+                raise NitObjectNotFoundError(
+                    "No object matching '{}'".format(key)
+                )
+
         # We've been a bit more careful about planning our
         # operations; now we do the scary part
 
@@ -122,7 +350,4 @@ class BaseWorkingTreeEditor(BaseWorkingTree):
             os.remove(str(rm_path))
 
         # Copy objects into the working dir from the db
-        for key, cp_path in cp_keys_and_paths:
-            obj = self.storage.get(key)
-            with cp_path.open('wb') as f:
-                f.write(obj.content)
+        self.storage.copy_blobs_to_paths(cp_keys_and_paths)
@@ -6,7 +6,6 @@ from nit.components.git.status import GitStatusFormatter
 from nit.components.git.storage import GitStorage
 from nit.components.nit.ignore import NitIgnoreStrategy
 from nit.components.nit.repository import NitRepository
-from nit.components.nit.serialization import NitSerializer
 from nit.core.log import getLogger
 from nit.core.status import BaseStatusStrategy
 
@@ -22,7 +21,7 @@ class GitRepository(NitRepository):
             self,
             paths,
             storage_cls=GitStorage,
-            serialization_cls=NitSerializer,
+            serialization_cls=None,
             ignore_cls=NitIgnoreStrategy,
             status_cls=BaseStatusStrategy,
             status_format_cls=GitStatusFormatter,
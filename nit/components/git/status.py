@@ -58,7 +58,7 @@ Changes to be committed:
         index_lines = list(
             logger.Fore.GREEN + "\t" +
             "{label:<12s}".format(label=status+":") +
-            str(f.path) +
+            f.path_str +
             logger.Fore.RESET
             for (f, status) in index_statuses
         )
@@ -94,7 +94,7 @@ Changes not staged for commit:
         index_lines = list(
             logger.Fore.RED + "\t" +
             "{label:<12s}".format(label=status+":") +
-            str(f.path) +
+            f.path_str +
             logger.Fore.RESET
             for (f, status) in index_statuses
         )
@@ -121,7 +121,7 @@ Untracked files:
 
         index_lines = list(
             logger.Fore.RED + "\t" +
-            str(f.path) +
+            f.path_str +
             logger.Fore.RESET
             for f in index_statuses
         )
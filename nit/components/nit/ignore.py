@@ -1,49 +1,137 @@
 #! /usr/bin/env python
 """
 """
-from nit.core.ignore import (
-    PathspecIgnorePredicate,
-    CompoundIgnorePredicate
-)
+import os
+
+from nit.core.ignore import CompiledIgnorePredicate, relative_path_str
 
 
 class NitIgnoreStrategy:
 
     """
+    Ignores files using the ignore file (e.g. ".nitignore") in
+    the project directory, and any in its subdirectories.
+
+    Patterns in an ignore file are relative to the directory
+    it's in, and only apply to files below it. The patterns of
+    a deeper ignore file take precedence over those above it,
+    and nothing inside an ignored directory can be re-included.
+
+    Each directory's ignore file is read and compiled the first
+    time a path below it is checked. Compiled predicates are
+    cached along with the file's mtime, and `refresh` makes
+    the next check of each directory look at its mtime again,
+    so a long-lived strategy picks up edits without recompiling
+    the files that haven't changed.
     """
 
     def __init__(self, paths):
         self.base_path = paths.project
+        self.ignore_name = paths.ignore_name
+
+        # Always ignore the repo dir
+        self.default_patterns = [paths.repo_name + "/"]
+
+        # dir str -> (mtime_ns, predicate or None)
+        self._loaded = {}
+        # dir str -> predicate or None, checked since refresh
+        self._predicates = {}
+        # dir str -> True if it or a parent is ignored
+        self._dir_verdicts = {}
 
+    def refresh(self):
+        """
+        Forgets which ignore files have been checked for
+        changes, and every verdict that depended on them
+        """
+        self._predicates.clear()
+        self._dir_verdicts.clear()
+
+    def _read_patterns(self, ignore_path):
+        """
+        :return (tuple): (mtime_ns, lines), or (None, []) if
+                         there's no ignore file at `ignore_path`
+        """
         try:
-            with paths.ignore.open(
-                'r', encoding='utf-8'
-            ) as f:
-                lines = f.readlines()
-
-            predicates = []
-            for line in lines:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                predicate = PathspecIgnorePredicate(line)
-                predicates.append(predicate)
-
-        except FileNotFoundError:
-            predicates = []
+            with open(ignore_path, 'r', encoding='utf-8') as f:
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                return mtime_ns, f.readlines()
+        except (FileNotFoundError, NotADirectoryError):
+            return None, []
 
-        # Always ignore the repo dir
-        predicates = [
-            PathspecIgnorePredicate(
-                paths.repo_name + "/"
+    def _get_predicate(self, dir_str):
+        """
+        :return (CompiledIgnorePredicate): For the patterns
+                                           that apply from the
+                                           directory `dir_str`
+                                           down, or None
+        """
+        try:
+            return self._predicates[dir_str]
+        except KeyError:
+            pass
+
+        ignore_path = os.path.join(
+            str(self.base_path), dir_str, self.ignore_name
+        )
+        try:
+            mtime_ns = os.stat(ignore_path).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            mtime_ns = None
+
+        loaded = self._loaded.get(dir_str)
+        if loaded is not None and loaded[0] == mtime_ns:
+            predicate = loaded[1]
+        else:
+            mtime_ns, lines = self._read_patterns(ignore_path)
+            if not dir_str:
+                lines = self.default_patterns + lines
+            predicate = CompiledIgnorePredicate(lines) if lines else None
+            self._loaded[dir_str] = (mtime_ns, predicate)
+
+        self._predicates[dir_str] = predicate
+        return predicate
+
+    def _verdict(self, path_str):
+        """
+        :return (bool): True if `path_str` itself is ignored by
+                        the deepest ignore file with a pattern
+                        matching it
+        """
+        dir_str = path_str
+        while dir_str:
+            dir_str = dir_str.rpartition("/")[0]
+            predicate = self._get_predicate(dir_str)
+            if predicate is None:
+                continue
+            verdict = predicate.verdict(
+                path_str[len(dir_str) + 1:] if dir_str else path_str
             )
-        ] + predicates
+            if verdict is not None:
+                return verdict
+        return False
 
-        self.predicate = CompoundIgnorePredicate(
-            predicates
+    def _is_dir_ignored(self, dir_str):
+        try:
+            return self._dir_verdicts[dir_str]
+        except KeyError:
+            pass
+        parent_str = dir_str.rpartition("/")[0]
+        verdict = (
+            (bool(parent_str) and self._is_dir_ignored(parent_str)) or
+            self._verdict(dir_str)
         )
+        self._dir_verdicts[dir_str] = verdict
+        return verdict
 
     def ignore(self, file_path):
-        return self.predicate.ignore(
-            self.base_path, file_path
+        path_str = relative_path_str(self.base_path, file_path)
+        if path_str is None:
+            return True
+        if not path_str:
+            return False
+        parent_str = path_str.rpartition("/")[0]
+        return (
+            (bool(parent_str) and self._is_dir_ignored(parent_str)) or
+            self._verdict(path_str)
         )
@@ -2,28 +2,45 @@
 """
 """
 import os
+from functools import wraps
 from pathlib import Path
 import subprocess
 import tempfile
 import textwrap
+from nit.components.base.fsmonitor import FsMonitorClient, FsMonitorDaemon
 from nit.components.base.working_tree import BaseWorkingTree, BaseWorkingTreeEditor
 from nit.components.git.status import GitStatusFormatter
 
 from nit.core.log import getLogger
 from nit.core.errors import NitUserError, NitExpectedError, NitUnexpectedError, NitRefNotFoundError
-from nit.core.objects.index import Index
+from nit.core.objects.index import Index, IndexStat
+from nit.core.paths_factory import get_paths_cls
+from nit.core.pathspec import Pathspec
 from nit.core.repository import Repository
 from nit.core.objects.commit import Commit
-from nit.core.objects.blob import Blob
 from nit.core.objects.tree import Tree
 from nit.core.status import BaseStatusStrategy
 from nit.components.nit.ignore import NitIgnoreStrategy
-from nit.components.nit.storage import NitStorage
-from nit.components.nit.serialization import NitSerializer
+from nit.components.nit.storage import CompressedNitStorage, NitStorage
 
 logger = getLogger(__name__)
 
 
+def in_transaction(fn):
+    """
+    Decorator for running a repository method in a storage
+    transaction, so that everything it writes is made durable
+    with a single sync (see `BaseStorage.transaction`)
+    """
+
+    @wraps(fn)
+    def in_transaction_implementation(self, *args, **kwargs):
+        with self.storage.transaction():
+            return fn(self, *args, **kwargs)
+
+    return in_transaction_implementation
+
+
 class NitRepository(Repository):
 
     """
@@ -32,44 +49,76 @@ class NitRepository(Repository):
     def __init__(
         self,
         paths,
-        storage_cls=NitStorage,
-        serialization_cls=NitSerializer,
+        storage_cls=None,
+        serialization_cls=None,
         ignore_cls=NitIgnoreStrategy,
         status_cls=BaseStatusStrategy,
         status_format_cls=GitStatusFormatter,
-        working_tree_cls=BaseWorkingTree
+        working_tree_cls=BaseWorkingTree,
+        fsmonitor_client_cls=FsMonitorClient
     ):
-        self.storage = storage_cls(
-            paths,
-            serialization_cls=serialization_cls,
-            working_tree_cls=working_tree_cls
-        )
+        """
+        :param storage_cls: If None, chosen by `get_storage_cls`
+        :param serialization_cls: If None, the storage's default
+        """
+        if storage_cls is None:
+            storage_cls = self.get_storage_cls(paths)
+        storage_kwargs = {"working_tree_cls": working_tree_cls}
+        if serialization_cls is not None:
+            storage_kwargs["serialization_cls"] = serialization_cls
+        self.storage = storage_cls(paths, **storage_kwargs)
         self.ignore = ignore_cls(
             paths
         )
+        self.fsmonitor_client = fsmonitor_client_cls(
+            paths
+        )
         self._status_cls = status_cls
         self._status_format_cls = status_format_cls
 
+    @staticmethod
+    def get_storage_cls(paths):
+        """
+        :return (type): CompressedNitStorage if the
+                        core.compression setting is set,
+                        otherwise NitStorage
+        """
+        if NitStorage(paths).get_config().get("core.compression"):
+            return CompressedNitStorage
+        return NitStorage
+
     @property
     def exists(self):
         return self.storage.exists
 
     @property
     def clean(self):
-        return self._status().clean
-
-    def create(self):
-        self.storage.create()
+        self.ignore.refresh()
+        return self._status_cls.is_clean(
+            self, ignorer=self.ignore.ignore
+        )
 
-    def status(self):
-        status = self._status()
+    def create(self, hash_algorithm=None):
+        self.storage.create(hash_algorithm=hash_algorithm)
+
+    def status(self, cached=False, untracked=True, pathspec=None):
+        """
+        :param cached: Only compare HEAD with the index
+        :param untracked: If False, don't look for untracked files
+        :param pathspec: Relative paths to limit the status to
+        """
+        status = self._status(
+            cached=cached, untracked=untracked,
+            pathspec=Pathspec.from_args(pathspec)
+        )
         status_fmt = self._status_format_cls(status)
         logger.info(status_fmt)
         return status
 
-    def _status(self):
+    def _status(self, **kwargs):
+        self.ignore.refresh()
         return self._status_cls.from_repo(
-            self, ignorer=self.ignore.ignore
+            self, ignorer=self.ignore.ignore, **kwargs
         )
 
     def config(self, set_value=None, use_global=False):
@@ -87,6 +136,16 @@ class NitRepository(Repository):
 
         key, value = (set_value[0], " ".join(set_value[1:]))
 
+        if (
+            value and not use_global and
+            key.lower() == "core.hashalgorithm"
+        ):
+            raise NitUserError(
+                "core.hashAlgorithm can only be chosen when a "
+                "repository is created (use --global to change "
+                "the default for new repositories)"
+            )
+
         if value:
             config[key] = value
             config.save()
@@ -97,13 +156,13 @@ class NitRepository(Repository):
                 logger.info(value)
             return value
 
+    @in_transaction
     def add(self, *relative_file_paths, force=False):
-        blobs = []
+        added = []
 
         index = self.storage.get_index()
 
-        if not index:
-            from nit.core.objects.index import Index
+        if index is None:
             index = Index()
 
         file_paths = [
@@ -111,6 +170,9 @@ class NitRepository(Repository):
             for rfp in relative_file_paths
         ]
 
+        add_paths = []
+
+        self.ignore.refresh()
         for file_path in file_paths:
             if not file_path.exists():
                 raise NitUserError(
@@ -128,25 +190,87 @@ class NitRepository(Repository):
                     )
                 )
                 continue
-            with file_path.open('rb') as file:
-                contents = file.read()
-                blob = Blob(contents)
-                key = self.storage.put(blob)
-                relative_file_path = file_path.relative_to(
-                    self.storage.paths.project
-                )
-                blobs.append(
-                    (key, relative_file_path, blob)
-                )
-                node = Tree.Node(
-                    relative_file_path,
-                    key
-                )
-                index.add_node(node)
+            add_paths.append(file_path)
+
+        # The stat data is taken before the files are read, so
+        # that a file changed while it's read will look changed
+        stats = [
+            IndexStat.from_stat_result(os.stat(str(file_path)))
+            for file_path in add_paths
+        ]
+
+        keys = self.storage.put_blobs_from_paths(add_paths)
+
+        for key, file_path, stat in zip(keys, add_paths, stats):
+            relative_file_path = file_path.relative_to(
+                self.storage.paths.project
+            )
+            added.append(
+                (key, relative_file_path)
+            )
+            node = Tree.Node(
+                relative_file_path,
+                key
+            )
+            index.add_node(node, stat=stat)
 
         self.storage.put(index)
 
-        return blobs
+        return added
+
+    def repack(self):
+        count = self.storage.repack()
+        logger.info(
+            "Packed {} loose object{}".format(
+                count, "" if count == 1 else "s"
+            )
+        )
+        return count
+
+    def migrate(self, layout):
+        """
+        Moves the loose objects into another directory layout
+        (see `nit.core.paths_factory`) and records it as the
+        repository's core.objectLayout.
+
+        The setting is saved first: a layout that can still find
+        objects in the old one (e.g. fanout) then serves other
+        commands run while the migration is in progress.
+        """
+        paths_cls = get_paths_cls(layout)
+        paths = self.storage.paths
+        new_paths = paths_cls(
+            paths.current_working_dir,
+            repo_name=paths.repo_name
+        )
+
+        config = self.storage.get_config().repo_config
+        config["core.objectLayout"] = layout
+        config.save()
+
+        count = self.storage.migrate_objects(new_paths)
+        logger.info(
+            "Moved {} loose object{} into the {} layout".format(
+                count, "" if count == 1 else "s", layout
+            )
+        )
+        return count
+
+    def fsmonitor(self, stop=False):
+        """
+        Runs the filesystem monitor daemon until it's stopped
+        (see `nit.components.base.fsmonitor`), or stops the one
+        that's running
+        """
+        if stop:
+            if not self.fsmonitor_client.stop():
+                raise NitUserError(
+                    "The filesystem monitor isn't running"
+                )
+            logger.info("Stopped the filesystem monitor")
+            return
+
+        FsMonitorDaemon(self.storage.paths).run()
 
     def _reformat_message(self, text, indent=4, ch=' '):
         text = text.strip()
@@ -205,6 +329,7 @@ class NitRepository(Repository):
                 )
         return []
 
+    @in_transaction
     def commit(self, message=None):
         config = self.storage.get_config()
 
@@ -219,7 +344,7 @@ class NitRepository(Repository):
             user_email,
         )
         index = self.storage.get_index()
-        if not index:
+        if index is None:
             raise NitUserError("Nothing to commit!")
         parent_key = self._get_head_commit_key()
         if parent_key:
@@ -227,8 +352,11 @@ class NitRepository(Repository):
         else:
             parent_commit = None
 
-        index_tree = index.to_tree()
-        tree_key = self.storage.put_tree(index_tree)
+        # Only the trees of directories changed since the index
+        # was last committed or checked out are stored
+        tree_key = self.storage.put_nested_tree(
+            index, tree_cache=index.tree_cache
+        )
         if parent_commit and tree_key == parent_commit.tree_key:
             raise NitUserError("The tree to be committed "
                                "is identical to the parent.")
@@ -251,12 +379,16 @@ class NitRepository(Repository):
         ref = self.storage.put_ref(self.get_current_branch(), commit_key)
         self.storage.put_symbolic_ref("HEAD", ref)
 
+        # Keeps the tree cache for the next commit
+        self.storage.put_index(index)
+
     def branch(self, name=None):
         if name is None:
             self._show_branches()
         else:
             self._create_branch(name)
 
+    @in_transaction
     def _create_branch(self, name, key=None):
         if key is None:
             key = self._get_head_commit_key()
@@ -329,6 +461,7 @@ class NitRepository(Repository):
     def diff(self):
         raise Exception("boo")
 
+    @in_transaction
     def checkout(self, treeish):
         # TODO: This should be done by comparing index
         #       rather than working tree
@@ -350,13 +483,16 @@ class NitRepository(Repository):
         logger.debug("treeish_obj: {}".format(treeish_obj))
         assert isinstance(treeish_obj, (Commit, Tree))
         working = BaseWorkingTreeEditor(
-            self.storage, self.ignore.ignore
+            self.storage, self.ignore.ignore,
+            index=self.storage.get_index()
         )
 
+        tree_cache = {}
         if isinstance(treeish_obj, Commit):
             commit = treeish_obj
-            tree = self.storage.get(commit.tree_key)
-            assert isinstance(tree, Tree)
+            tree = self.storage.get_nested_tree(
+                commit.tree_key, tree_cache=tree_cache
+            )
             working.replace(tree)
         else:
             raise NitUserError(
@@ -369,7 +505,7 @@ class NitRepository(Repository):
             )
 
         # need to update the index
-        index = Index.from_tree(tree)
+        index = Index.from_tree(tree, tree_cache=tree_cache)
         self.storage.put_index(index)
 
         if detached:
@@ -1,11 +1,14 @@
 #! /usr/bin/env python
 """
 """
+import os
+import struct
+import zlib
 from datetime import datetime
 from io import BytesIO
 
 from nit.core.objects.tree import Tree
-from nit.core.objects.index import Index
+from nit.core.objects.index import DirCacheEntry, Index, IndexStat
 from nit.core.objects.blob import Blob
 from nit.core.objects.commit import Commit
 from nit.core.log import getLogger
@@ -28,15 +31,53 @@ class NitSerializer(BaseSerializer):
     obj_type_mapping = {
         "blob": Blob,
         "tree": Tree,
+        "btree": Tree,
         "index": Index,
+        "index2": Index,
+        "bindex": Index,
         "commit": Commit
     }
 
-    def __init__(self, stream):
+    # The formats that trees and the index can be written in;
+    # either can be read regardless (see `serialize_binary_tree`)
+    TEXT_FORMAT = "text"
+    BINARY_FORMAT = "binary"
+    TREE_FORMATS = (TEXT_FORMAT, BINARY_FORMAT)
+
+    BINARY_HEADER = struct.Struct(">BI")
+    BINARY_ENTRY = struct.Struct(">HH")
+    BINARY_STAT = struct.Struct(">qQQ")
+    BINARY_DIR = struct.Struct(">qII")
+    BINARY_COUNT = struct.Struct(">I")
+    BINARY_STR_LEN = struct.Struct(">H")
+    BINARY_KEY_LEN = struct.Struct(">B")
+
+    # Written in place of the stat data of an index entry
+    # which has none
+    NO_STAT_STR = "-"
+
+    # Introduces the directory cache extension of an index,
+    # which can't be mistaken for a key
+    DIR_CACHE_STR = "dircache"
+
+    # Introduces the filesystem monitor token of an index
+    FSMONITOR_STR = "fsmonitor"
+
+    # Introduces the tree cache extension of an index
+    TREE_CACHE_STR = "treecache"
+
+    def __init__(self, stream, tree_format=None):
+        """
+        :param tree_format: The format to write trees and the
+                            index in, from TREE_FORMATS
+        """
         super().__init__(stream)
+        self.obj_type = None
+        self.tree_format = tree_format or self.TEXT_FORMAT
 
     def _deserialize_get_obj_cls(self):
         obj_len, obj_type = self.deserialize_signature()
+        self.obj_type = obj_type
 
         try:
             return self.obj_type_mapping[obj_type]
@@ -62,27 +103,209 @@ class NitSerializer(BaseSerializer):
         return obj_len, obj_type
 
     def serialize_index(self, index):
+        """
+        Writes a version 2 ("index2") index, whose entries are
+        ``key mtime_ns size ino path`` lines, optionally followed
+        by the directory cache:
+
+            dircache <number of directories>
+            <mtime_ns> <number of subdirs> <number of files> <path>
+            <subdir name>
+            ...
+            <file name>
+            ...
+
+        then by the token of the filesystem monitor the index is
+        up to date with, if any:
+
+            fsmonitor <token>
+
+        and then by the tree cache:
+
+            treecache <number of directories>
+            <key> <path>
+            ...
+        """
         logger.trace("Serializing Index")
 
-        content = self._serialize_tree_to_bytes(index)
+        if self.tree_format == self.BINARY_FORMAT:
+            return self.serialize_binary_index(index)
+
+        with BytesIO() as memory_file:
+            memory_serializer = self.__class__(memory_file)
+
+            for node in index.nodes_sorted:
+                stat = index.stats.get(node.path_str)
+                if stat is None:
+                    stat = [self.NO_STAT_STR] * len(IndexStat._fields)
+                memory_serializer.write_string(
+                    self.FIELD_SEP_STR.join(
+                        [node.key] + [str(f) for f in stat]
+                    ) + self.FIELD_SEP_STR
+                )
+                memory_serializer.write_string(
+                    node.path_str + self.CHUNK_SEP_STR
+                )
+
+            if index.dir_cache:
+                memory_serializer._serialize_dir_cache(index.dir_cache)
+
+            if index.fsmonitor_token:
+                memory_serializer.write_string(
+                    self.FSMONITOR_STR + self.FIELD_SEP_STR +
+                    index.fsmonitor_token + self.CHUNK_SEP_STR
+                )
+
+            if index.tree_cache:
+                memory_serializer._serialize_tree_cache(index.tree_cache)
+
+            content = memory_file.getvalue()
 
-        self.serialize_signature("index", len(content))
+        self.serialize_signature("index2", len(content))
         self.write_bytes(content)
 
     def deserialize_index(self, index_cls):
         logger.trace("Deserializing Index")
 
-        index = self._deserialize_tree_from_bytes(index_cls)
+        if self.obj_type == "index":
+            # Version 1, which is a tree without stat data
+            return self._deserialize_tree_from_bytes(index_cls)
+
+        if self.obj_type == "bindex":
+            return self.deserialize_binary_index(index_cls)
+
+        nodes = []
+        stats = {}
+        dir_cache = None
+        fsmonitor_token = None
+        tree_cache = None
+
+        while True:
+            key = self.read_bytes_until(
+                self.FIELD_SEP_BYTE
+            ).decode()
+            if not key:
+                break
+
+            if key == self.DIR_CACHE_STR:
+                dir_cache = self._deserialize_dir_cache()
+                continue
+
+            if key == self.FSMONITOR_STR:
+                fsmonitor_token = self.read_bytes_until(
+                    self.CHUNK_SEP_BYTE
+                ).decode()
+                continue
+
+            if key == self.TREE_CACHE_STR:
+                tree_cache = self._deserialize_tree_cache()
+                continue
+
+            stat = [
+                self.read_bytes_until(self.FIELD_SEP_BYTE).decode()
+                for _ in IndexStat._fields
+            ]
+
+            path = self.read_bytes_until(
+                self.CHUNK_SEP_BYTE
+            ).decode()
+
+            nodes.append(index_cls.Node(relative_file_path=path, key=key))
+            if self.NO_STAT_STR not in stat:
+                stats[path] = IndexStat(*map(int, stat))
+
+        return index_cls.from_nodes(
+            nodes, stats=stats, dir_cache=dir_cache,
+            fsmonitor_token=fsmonitor_token, tree_cache=tree_cache
+        )
+
+    def _serialize_tree_cache(self, tree_cache):
+        lines = [
+            self.TREE_CACHE_STR + self.FIELD_SEP_STR + str(len(tree_cache))
+        ]
+        for dir_str, key in sorted(tree_cache.items()):
+            lines.append(key + self.FIELD_SEP_STR + dir_str)
+        self.write_string(
+            "".join(line + self.CHUNK_SEP_STR for line in lines)
+        )
+
+    def _deserialize_tree_cache(self):
+        tree_cache = {}
+        count = int(self.read_bytes_until(self.CHUNK_SEP_BYTE))
+        for _ in range(count):
+            key = self.read_bytes_until(self.FIELD_SEP_BYTE).decode()
+            dir_str = self.read_bytes_until(self.CHUNK_SEP_BYTE).decode()
+            tree_cache[dir_str] = key
+        return tree_cache
+
+    def _serialize_dir_cache(self, dir_cache):
+        lines = [
+            self.DIR_CACHE_STR + self.FIELD_SEP_STR + str(len(dir_cache))
+        ]
+        for dir_str, entry in sorted(dir_cache.items()):
+            lines.append(self.FIELD_SEP_STR.join([
+                str(entry.mtime_ns),
+                str(len(entry.dir_names)),
+                str(len(entry.file_names)),
+                dir_str
+            ]))
+            lines.extend(entry.dir_names)
+            lines.extend(entry.file_names)
+        self.write_string(
+            "".join(line + self.CHUNK_SEP_STR for line in lines)
+        )
+
+    def _deserialize_dir_cache(self):
+        def read_line():
+            return self.read_bytes_until(self.CHUNK_SEP_BYTE).decode()
 
-        return index
+        def read_field():
+            return int(self.read_bytes_until(self.FIELD_SEP_BYTE))
+
+        dir_cache = {}
+        for _ in range(int(read_line())):
+            mtime_ns, n_dirs, n_files = (
+                read_field(), read_field(), read_field()
+            )
+            dir_str = read_line()
+            dir_names = tuple(read_line() for _ in range(n_dirs))
+            file_names = tuple(read_line() for _ in range(n_files))
+            dir_cache[dir_str] = DirCacheEntry(
+                mtime_ns, dir_names, file_names
+            )
+        return dir_cache
 
     def serialize_blob(self, blob):
         logger.trace("Serializing Blob")
 
         content = blob.content
-        self.serialize_signature("blob", len(content))
+        self.serialize_blob_header(len(content))
         self.write_bytes(content)
 
+    def serialize_blob_header(self, blob_len):
+        """
+        Writes everything that precedes a blob's content, so
+        that the content itself can be streamed in afterwards
+        """
+        self.serialize_signature("blob", blob_len)
+
+    def deserialize_blob_header(self):
+        """
+        Reads everything that precedes a blob's content, leaving
+        the stream positioned at the first byte of the content,
+        which is stored verbatim.
+
+        :return (int): The length of the content, or None if the
+                       stream doesn't hold a blob
+        """
+        try:
+            obj_len, obj_type = self.deserialize_signature()
+        finally:
+            self._unread()
+        if obj_type != "blob":
+            return None
+        return obj_len
+
     def deserialize_blob(self, blob_cls):
         logger.trace("Deserializing Blob")
 
@@ -97,14 +320,14 @@ class NitSerializer(BaseSerializer):
                     node.key + self.FIELD_SEP_STR
                 )
                 memory_serializer.write_string(
-                    str(node.path) + self.CHUNK_SEP_STR
+                    self._node_path_str(node) + self.CHUNK_SEP_STR
                 )
 
                 logger.trace(
                     ("Serialized Tree.Node:\n"
                      "    Key:  {}\n"
                      "    Path: {}").format(
-                        node.key, node.path
+                        node.key, node.path_str
                     )
                 )
 
@@ -191,38 +414,428 @@ class NitSerializer(BaseSerializer):
     def serialize_tree(self, tree):
         logger.trace("Serializing Tree")
 
+        if self.tree_format == self.BINARY_FORMAT:
+            return self.serialize_binary_tree(tree)
+
         content = self._serialize_tree_to_bytes(tree)
 
         self.serialize_signature("tree", len(content))
         self.write_bytes(content)
 
     def _deserialize_tree_from_bytes(self, tree_cls):
-        tree = tree_cls()
-        while True:
-            key = self.read_bytes_until(
-                self.FIELD_SEP_BYTE
-            ).decode()
+        # The content is read and decoded all at once, and split
+        # into nodes with str methods, which is much faster than
+        # parsing a large tree a field at a time
+        content = self.read_bytes().decode()
+
+        nodes = []
+        for line in content.split(self.CHUNK_SEP_STR):
+            key, _, path = line.partition(self.FIELD_SEP_STR)
             if not key:
                 break
+            nodes.append(self._make_node(tree_cls, path, key))
+
+        logger.trace("Deserialized Tree of {} nodes".format(len(nodes)))
+
+        return tree_cls.from_nodes(nodes)
+
+    @staticmethod
+    def _node_path_str(node):
+        """
+        :return (str): The path of `node` as written in a tree,
+                       where a subtree's has a trailing slash
+        """
+        path_str = node.path_str
+        return path_str + "/" if node.is_tree else path_str
+
+    @staticmethod
+    def _make_node(tree_cls, path_str, key):
+        """
+        :return (TreeNode): For a path read from a tree
+        """
+        if path_str.endswith("/"):
+            return tree_cls.Subtree(relative_file_path=path_str[:-1], key=key)
+        return tree_cls.Node(relative_file_path=path_str, key=key)
 
-            path = self.read_bytes_until(
-                self.CHUNK_SEP_BYTE
-            ).decode()
+    def deserialize_tree(self, tree_cls):
+        logger.trace("Deserializing Tree")
 
-            logger.trace(
-                ("Deserialized TreeNode:\n"
-                 "    Key:  {}\n"
-                 "    Path: {}").format(
-                    key, path
+        if self.obj_type == "btree":
+            return self.deserialize_binary_tree(tree_cls)
+
+        tree = self._deserialize_tree_from_bytes(tree_cls)
+
+        return tree
+
+    def serialize_binary_tree(self, tree):
+        """
+        Writes a binary ("btree") tree, which is a third of the
+        size of a text one, and can hold any path:
+
+            key length (B) | number of nodes (I)
+            node
+            ...
+
+        where each node, in order of path, is
+
+            shared (H) | suffix length (H) | suffix | key
+
+        The node's UTF-8 path is the first `shared` bytes of the
+        previous node's path followed by `suffix`, and its key
+        is stored as raw bytes rather than hex.
+        """
+        content = b"".join(self._encode_binary_nodes(tree.nodes_sorted))
+
+        self.serialize_signature("btree", len(content))
+        self.write_bytes(content)
+
+    def deserialize_binary_tree(self, tree_cls):
+        reader = BinaryReader(self.read_bytes())
+        return tree_cls.from_nodes(
+            self._decode_binary_nodes(reader, tree_cls)
+        )
+
+    def serialize_binary_index(self, index):
+        """
+        Writes a binary ("bindex") index, which is a binary tree
+        (see `serialize_binary_tree`) whose nodes are followed
+        by their stat data,
+
+            has stat (B) [| mtime_ns (q) | size (Q) | ino (Q)]
+
+        and then by the filesystem monitor token (a string, which
+        is empty if there's none), the directory cache:
+
+            number of directories (I)
+            mtime_ns (q) | number of subdirs (I) | number of files (I)
+            path
+            subdir name
+            ...
+            file name
+            ...
+
+        and the tree cache:
+
+            number of directories (I)
+            key length (B) | key | path
+            ...
+
+        where each string is its UTF-8 length (H) and bytes.
+        """
+        parts = self._encode_binary_nodes(
+            index.nodes_sorted, stats=index.stats
+        )
+
+        parts.extend(self._encode_binary_str(index.fsmonitor_token or ""))
+
+        parts.append(self.BINARY_COUNT.pack(len(index.dir_cache)))
+        for dir_str, entry in sorted(index.dir_cache.items()):
+            parts.append(self.BINARY_DIR.pack(
+                entry.mtime_ns,
+                len(entry.dir_names),
+                len(entry.file_names)
+            ))
+            for name in (dir_str,) + entry.dir_names + entry.file_names:
+                parts.extend(self._encode_binary_str(name))
+
+        parts.append(self.BINARY_COUNT.pack(len(index.tree_cache)))
+        for dir_str, key in sorted(index.tree_cache.items()):
+            key_b = bytes.fromhex(key)
+            parts.append(self.BINARY_KEY_LEN.pack(len(key_b)))
+            parts.append(key_b)
+            parts.extend(self._encode_binary_str(dir_str))
+
+        content = b"".join(parts)
+
+        self.serialize_signature("bindex", len(content))
+        self.write_bytes(content)
+
+    def deserialize_binary_index(self, index_cls):
+        reader = BinaryReader(self.read_bytes())
+
+        stats = {}
+        nodes = self._decode_binary_nodes(reader, index_cls, stats=stats)
+
+        fsmonitor_token = self._decode_binary_str(reader) or None
+
+        dir_cache = {}
+        for _ in range(reader.unpack(self.BINARY_COUNT)[0]):
+            mtime_ns, n_dirs, n_files = reader.unpack(self.BINARY_DIR)
+            dir_str = self._decode_binary_str(reader)
+            dir_names = tuple(
+                self._decode_binary_str(reader) for _ in range(n_dirs)
+            )
+            file_names = tuple(
+                self._decode_binary_str(reader) for _ in range(n_files)
+            )
+            dir_cache[dir_str] = DirCacheEntry(
+                mtime_ns, dir_names, file_names
+            )
+
+        tree_cache = {}
+        for _ in range(reader.unpack(self.BINARY_COUNT)[0]):
+            key_len, = reader.unpack(self.BINARY_KEY_LEN)
+            key = reader.read(key_len).hex()
+            tree_cache[self._decode_binary_str(reader)] = key
+
+        return index_cls.from_nodes(
+            nodes, stats=stats, dir_cache=dir_cache,
+            fsmonitor_token=fsmonitor_token, tree_cache=tree_cache
+        )
+
+    def _encode_binary_nodes(self, nodes, stats=None):
+        """
+        :param nodes: Sorted by path
+        :param stats (dict): If given, the stat data to write
+                             after each node, by path
+        :return (list): The byte strings of a binary tree
+        """
+        parts = [None]
+        key_len = 0
+        count = 0
+        prev_path_b = b""
+
+        for node in nodes:
+            path_str = node.path_str
+            path_b = self._node_path_str(node).encode()
+            key_b = bytes.fromhex(node.key)
+
+            if not key_len:
+                key_len = len(key_b)
+            elif len(key_b) != key_len:
+                raise ValueError(
+                    "All keys in a tree must have the same length"
                 )
+
+            shared = len(os.path.commonprefix([prev_path_b, path_b]))
+            parts.append(
+                self.BINARY_ENTRY.pack(shared, len(path_b) - shared)
             )
+            parts.append(path_b[shared:])
+            parts.append(key_b)
+
+            if stats is not None:
+                stat = stats.get(path_str)
+                if stat is None:
+                    parts.append(b"\0")
+                else:
+                    parts.append(b"\1" + self.BINARY_STAT.pack(*stat))
+
+            prev_path_b = path_b
+            count += 1
+
+        parts[0] = self.BINARY_HEADER.pack(key_len, count)
+        return parts
+
+    def _decode_binary_nodes(self, reader, tree_cls, stats=None):
+        """
+        :param stats (dict): If given, the stat data read after
+                             each node is added to it, by path
+        :return (list): The nodes of a binary tree
+        """
+        key_len, count = reader.unpack(self.BINARY_HEADER)
+
+        # This loop is the bulk of reading a large tree, so it
+        # reads the content directly rather than through `reader`
+        content = reader.content
+        offset = reader.offset
+        unpack_entry = self.BINARY_ENTRY.unpack_from
+        entry_size = self.BINARY_ENTRY.size
+        unpack_stat = self.BINARY_STAT.unpack_from
+        stat_size = self.BINARY_STAT.size
+        node_cls = tree_cls.Node
+
+        nodes = []
+        path_b = b""
+        try:
+            for _ in range(count):
+                shared, suffix_len = unpack_entry(content, offset)
+                offset += entry_size
+                path_b = path_b[:shared] + content[
+                    offset:offset + suffix_len
+                ]
+                offset += suffix_len
+                key_b = content[offset:offset + key_len]
+                offset += key_len
+                if len(key_b) != key_len:
+                    raise struct.error("truncated key")
+
+                path_str = path_b.decode()
+                if path_str.endswith("/"):
+                    nodes.append(tree_cls.Subtree(
+                        relative_file_path=path_str[:-1], key=key_b.hex()
+                    ))
+                else:
+                    nodes.append(node_cls(
+                        relative_file_path=path_str, key=key_b.hex()
+                    ))
+
+                if stats is not None:
+                    has_stat = content[offset]
+                    offset += 1
+                    if has_stat:
+                        stats[path_str] = IndexStat._make(
+                            unpack_stat(content, offset)
+                        )
+                        offset += stat_size
+        except (struct.error, IndexError):
+            raise ValueError("Unexpected end of binary object")
+
+        reader.offset = offset
+        return nodes
+
+    def _encode_binary_str(self, s):
+        b = s.encode()
+        return [self.BINARY_STR_LEN.pack(len(b)), b]
+
+    def _decode_binary_str(self, reader):
+        return reader.read(reader.unpack(self.BINARY_STR_LEN)[0]).decode()
+
+
+class BinaryReader:
 
-            tree.add_node(tree_cls.Node(relative_file_path=path, key=key))
-        return tree
+    """
+    Reads the fields of a binary object from its content,
+    raising ValueError if it's truncated
+    """
 
-    def deserialize_tree(self, tree_cls):
-        logger.trace("Deserializing Tree")
+    def __init__(self, content):
+        self.content = content
+        self.offset = 0
 
-        tree = self._deserialize_tree_from_bytes(tree_cls)
+    def read(self, n):
+        end = self.offset + n
+        if end > len(self.content):
+            raise ValueError("Unexpected end of binary object")
+        b = self.content[self.offset:end]
+        self.offset = end
+        return b
 
-        return tree
+    def unpack(self, fmt):
+        """
+        :param fmt (struct.Struct):
+        :return (tuple): The fields of the next `fmt`
+        """
+        return fmt.unpack(self.read(fmt.size))
+
+
+class DeflateWriter:
+
+    """
+    A write-only stream that deflates everything written to it
+    before passing it on to `stream`. `finish` must be called
+    to flush the end of the zlib stream.
+    """
+
+    def __init__(self, stream, level):
+        self.stream = stream
+        self._compressor = zlib.compressobj(level)
+
+    def write(self, b):
+        self.stream.write(self._compressor.compress(b))
+        return len(b)
+
+    def finish(self):
+        self.stream.write(self._compressor.flush())
+        return self.stream
+
+
+class InflateReader:
+
+    """
+    A read-only stream that inflates `stream` on demand.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._decompressor = zlib.decompressobj()
+        self._buffer = bytearray()
+
+    def _fill(self, n):
+        while n is None or len(self._buffer) < n:
+            if self._decompressor.eof:
+                break
+            compressed = self.stream.read(self.CHUNK_SIZE)
+            if not compressed:
+                self._buffer += self._decompressor.flush()
+                break
+            self._buffer += self._decompressor.decompress(compressed)
+
+    def read(self, n=None):
+        if n is not None and n < 0:
+            n = None
+        self._fill(n)
+        if n is None:
+            n = len(self._buffer)
+        b = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return b
+
+
+class CompressedNitSerializer(NitSerializer):
+
+    """
+    A NitSerializer which deflates what it writes with zlib,
+    and inflates what it reads.
+
+    Streams that don't begin with a zlib header are read as
+    plain NitSerializer output, so a repository with objects
+    written before compression was enabled still loads.
+
+    A `level` of None writes the plain (canonical) form, which
+    is what object keys are computed from.
+    """
+
+    DEFAULT_LEVEL = zlib.Z_DEFAULT_COMPRESSION
+
+    def __init__(self, stream, level=None, tree_format=None):
+        super().__init__(stream, tree_format=tree_format)
+        self.level = level
+
+    @staticmethod
+    def is_deflated(head):
+        """
+        :param head: The first two bytes of a stream
+        :return (bool): True if `head` is a zlib header
+        """
+        return (
+            len(head) == 2 and
+            head[0] & 0x0f == zlib.DEFLATED and
+            (head[0] << 8 | head[1]) % 31 == 0
+        )
+
+    def serialize(self, serializable):
+        if self.level is None:
+            return super().serialize(serializable)
+
+        raw_stream = self.stream
+        self.stream = DeflateWriter(raw_stream, self.level)
+        try:
+            super().serialize(serializable)
+            self.stream.finish()
+        finally:
+            self.stream = raw_stream
+
+    def _peek_is_deflated(self):
+        head = self.stream.read(2)
+        self.stream.seek(-len(head), 1)
+        return self.is_deflated(head)
+
+    def deserialize_blob_header(self):
+        # A deflated blob's content isn't stored verbatim
+        if self._peek_is_deflated():
+            return None
+        return super().deserialize_blob_header()
+
+    def deserialize(self):
+        if not self._peek_is_deflated():
+            return super().deserialize()
+
+        raw_stream = self.stream
+        self.stream = InflateReader(raw_stream)
+        try:
+            return super().deserialize()
+        finally:
+            self.stream = raw_stream
@@ -1,9 +1,16 @@
 #! /usr/bin/env python
 """
 """
+import zlib
+
+from nit.core.errors import NitUserError
 from nit.core.log import getLogger
+from nit.core.objects.blob import Blob
 from nit.components.base.working_tree import BaseWorkingTree
-from nit.components.nit.serialization import NitSerializer
+from nit.components.nit.serialization import (
+    NitSerializer,
+    CompressedNitSerializer
+)
 from nit.components.base.storage import BaseStorage
 
 logger = getLogger(__name__)
@@ -12,6 +19,14 @@ logger = getLogger(__name__)
 class NitStorage(BaseStorage):
 
     """
+    Writes trees and the index in the format from the
+    ``core.treeFormat`` config setting: "text" (the default)
+    or "binary", which is smaller and faster to read (see
+    `NitSerializer.serialize_binary_tree`).
+
+    Either format can be read whatever the setting is. Since a
+    tree's key depends on its format, changing the setting
+    gives new trees new keys, but leaves old ones readable.
     """
 
     def __init__(
@@ -22,5 +37,94 @@ class NitStorage(BaseStorage):
     ):
         super().__init__(
             paths,
-            serialization_cls
+            serialization_cls,
+            working_tree_cls=working_tree_cls
         )
+        self._tree_format = None
+
+    @property
+    def tree_format(self):
+        if self._tree_format is None:
+            tree_format = (
+                self.get_config().get("core.treeFormat") or
+                self._serialization_cls.TEXT_FORMAT
+            ).lower()
+            if tree_format not in self._serialization_cls.TREE_FORMATS:
+                raise NitUserError(
+                    '"{}" is not a valid tree format '
+                    '(expected one of: {})'.format(
+                        tree_format,
+                        ", ".join(sorted(
+                            self._serialization_cls.TREE_FORMATS
+                        ))
+                    )
+                )
+            self._tree_format = tree_format
+        return self._tree_format
+
+    def _get_canonical_serializer(self, stream):
+        return self._serialization_cls(
+            stream, tree_format=self.tree_format
+        )
+
+
+class CompressedNitStorage(NitStorage):
+
+    """
+    A NitStorage which deflates objects and the index with
+    zlib, using the level from the ``core.compression`` config
+    setting (-1 to 9, as with zlib).
+
+    Keys are still computed from the uncompressed bytes, so
+    changing the level never changes a key.
+    """
+
+    def __init__(
+            self,
+            paths,
+            serialization_cls=CompressedNitSerializer,
+            working_tree_cls=BaseWorkingTree
+    ):
+        super().__init__(
+            paths,
+            serialization_cls=serialization_cls,
+            working_tree_cls=working_tree_cls
+        )
+        self._compression_level = None
+
+    @property
+    def compression_level(self):
+        if self._compression_level is None:
+            level = self.get_config().get("core.compression")
+            if not level:
+                level = self._serialization_cls.DEFAULT_LEVEL
+            try:
+                level = int(level)
+                assert -1 <= level <= 9
+            except (ValueError, AssertionError):
+                raise NitUserError(
+                    "core.compression must be an integer "
+                    "from -1 to 9, not '{}'".format(level)
+                )
+            self._compression_level = level
+        return self._compression_level
+
+    def _get_serializer(self, stream):
+        return self._serialization_cls(
+            stream,
+            level=self.compression_level,
+            tree_format=self.tree_format
+        )
+
+    def _encode_object_chunks(self, chunks):
+        compressor = zlib.compressobj(self.compression_level)
+        for chunk in chunks:
+            yield compressor.compress(chunk)
+        yield compressor.flush()
+
+    def _get_cached_size(self, obj, stored_size):
+        # The stored bytes are deflated, so charge what the object
+        # takes once inflated
+        if isinstance(obj, Blob):
+            return len(obj.content)
+        return len(self._serialize_object_to_bytes(obj))
@@ -70,12 +70,12 @@ class BaseTreeDiff(TreeDiff):
 
         # Associate paths with nodes
         self.from_paths = {
-            n.path: n for n in self.from_nodes
+            n.path_str: n for n in self.from_nodes
         }
         self.from_paths_set = set(self.from_paths)
 
         self.to_paths = {
-            n.path: n for n in self.to_nodes
+            n.path_str: n for n in self.to_nodes
         }
         self.to_paths_set = set(self.to_paths)
 
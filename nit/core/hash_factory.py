@@ -0,0 +1,32 @@
+import hashlib
+from functools import partial
+
+from nit.core.errors import NitUserError
+
+
+__all__ = [
+    'DEFAULT_HASH_ALGORITHM',
+    'get_hash_fn',
+]
+
+
+DEFAULT_HASH_ALGORITHM = 'sha1'
+
+# Each value makes a new hashlib object; BLAKE2b is truncated
+# to 32 bytes, so that its keys are the same length as SHA-256's
+algorithms = {
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'blake2b': partial(hashlib.blake2b, digest_size=32),
+}
+
+
+def get_hash_fn(algorithm):
+    fn = algorithms.get(algorithm or DEFAULT_HASH_ALGORITHM)
+    if not fn:
+        raise NitUserError(
+            '"{}" is not a valid hash algorithm (expected one of: {})'.format(
+                algorithm, ", ".join(sorted(algorithms))
+            )
+        )
+    return fn
@@ -7,6 +7,32 @@ from pathlib import Path
 from abc import ABCMeta, abstractmethod
 
 
+def relative_path_str(base_path, file_path):
+    """
+    Like Path.relative_to, but on strings, since it's called
+    for every file in the working tree
+
+    :return (str): `file_path` relative to `base_path`, with
+                   "/" separators, or None if it's outside it
+    """
+    base_str = str(base_path)
+    path_str = str(file_path)
+
+    if os.path.isabs(path_str):
+        base_str = base_str.rstrip(os.path.sep)
+        if path_str.startswith(base_str + os.path.sep):
+            path_str = path_str[len(base_str) + 1:]
+        elif path_str.rstrip(os.path.sep) == base_str:
+            path_str = ""
+        else:
+            return None
+
+    if os.path.sep != "/":
+        path_str = path_str.replace(os.path.sep, "/")
+
+    return path_str.strip("/")
+
+
 class IgnorePredicate(metaclass=ABCMeta):
 
     """
@@ -156,3 +182,213 @@ class DirPathspecIgnorePredicate(PathspecIgnorePredicate):
 
     """
     """
+
+
+class CompiledIgnorePredicate(IgnorePredicate):
+
+    """
+    Matches paths against a whole ignore file's worth of
+    gitignore-style patterns at once:
+
+     * A pattern without a slash (other than a trailing one)
+       matches a file or directory name at any depth; one
+       with a slash matches from the project directory.
+     * ``*`` and ``?`` don't match slashes, ``**`` matches any
+       number of directories, ``[...]`` is a character class
+       and ``!`` negates a pattern.
+     * The last pattern that matches a name wins, and nothing
+       inside an ignored directory can be re-included.
+
+    Rather than trying every pattern in turn, the patterns are
+    sorted into literal names (a hash lookup), ``*.ext``-style
+    suffixes (a lookup per distinct suffix length), and the
+    rest, which are combined into one regex for names and one
+    for paths. Verdicts for directories are cached, since every
+    file below a directory needs one.
+
+    A trailing slash is accepted, but since the type of the
+    final path component isn't known, such a pattern matches
+    files as well as directories.
+    """
+
+    GLOB_CHARS = frozenset("*?[\\")
+
+    def __init__(self, patterns):
+        self.literals = {}
+        self.suffixes = {}
+        name_regexes = []
+        path_regexes = []
+
+        for i, pattern in enumerate(patterns):
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+
+            negated = pattern.startswith("!")
+            if negated:
+                pattern = pattern[1:]
+            pattern = pattern.rstrip("/")
+            if not pattern:
+                continue
+
+            rule = (i, negated)
+
+            if "/" in pattern:
+                path_regexes.append(
+                    (rule, self._translate(pattern.lstrip("/")))
+                )
+            elif not self.GLOB_CHARS.intersection(pattern):
+                self.literals[pattern] = rule
+            elif (
+                len(pattern) > 1 and pattern.startswith("*") and
+                not self.GLOB_CHARS.intersection(pattern[1:])
+            ):
+                self.suffixes.setdefault(len(pattern) - 1, {})[
+                    pattern[1:]
+                ] = rule
+            else:
+                name_regexes.append((rule, self._translate(pattern)))
+
+        self.suffix_lens = sorted(self.suffixes)
+        self.name_regex, self.name_rules = self._combine(name_regexes)
+        self.path_regex, self.path_rules = self._combine(path_regexes)
+        self._dir_verdicts = {}
+
+    @staticmethod
+    def _combine(regexes):
+        """
+        Joins `regexes` into a single alternation, latest rule
+        first, so that the first alternative to match is the
+        last pattern that matches
+
+        :return (tuple): (compiled regex or None, the rule of
+                          each alternative by group number)
+        """
+        if not regexes:
+            return None, []
+        regexes = list(reversed(regexes))
+        combined = re.compile("|".join(
+            "({})".format(regex) for _, regex in regexes
+        ))
+        return combined, [None] + [rule for rule, _ in regexes]
+
+    @staticmethod
+    def _translate(pattern):
+        """
+        :return (str): A regex, with no capturing groups, that
+                       matches what the glob `pattern` does
+        """
+        regex = []
+        i, n = 0, len(pattern)
+        while i < n:
+            c = pattern[i]
+            at_segment_start = i == 0 or pattern[i - 1] == "/"
+            if at_segment_start and pattern.startswith("**/", i):
+                regex.append("(?:.*/)?")
+                i += 3
+                continue
+            if at_segment_start and pattern[i:] == "**":
+                regex.append(".*")
+                break
+            if c == "*":
+                regex.append("[^/]*")
+            elif c == "?":
+                regex.append("[^/]")
+            elif c == "[":
+                end = pattern.find("]", i + 2)
+                if end < 0:
+                    regex.append(re.escape(c))
+                else:
+                    chars = pattern[i + 1:end]
+                    if chars.startswith("!"):
+                        chars = "^" + chars[1:]
+                    regex.append("[{}]".format(chars.replace("\\", "\\\\")))
+                    i = end
+            elif c == "\\" and i + 1 < n:
+                i += 1
+                regex.append(re.escape(pattern[i]))
+            else:
+                regex.append(re.escape(c))
+            i += 1
+        return "".join(regex)
+
+    def _last_rule(self, name, path_str):
+        """
+        :return (tuple): The (index, negated) rule of the last
+                         pattern matching the file or directory
+                         `name` at `path_str`, or None
+        """
+        rules = [self.literals.get(name)]
+
+        for suffix_len in self.suffix_lens:
+            if suffix_len > len(name):
+                break
+            rules.append(self.suffixes[suffix_len].get(name[-suffix_len:]))
+
+        for regex, regex_rules, s in (
+            (self.name_regex, self.name_rules, name),
+            (self.path_regex, self.path_rules, path_str),
+        ):
+            if regex is not None:
+                m = regex.fullmatch(s)
+                if m is not None:
+                    rules.append(regex_rules[m.lastindex])
+
+        rules = [rule for rule in rules if rule is not None]
+        return max(rules) if rules else None
+
+    def verdict(self, path_str):
+        """
+        Matches `path_str` alone, without its parents
+
+        :return (bool): True if the last matching pattern
+                        ignores it, False if it re-includes it,
+                        or None if no pattern matches
+        """
+        name = path_str.rpartition("/")[2]
+        rule = self._last_rule(name, path_str)
+        return None if rule is None else not rule[1]
+
+    def _is_ignored(self, path_str):
+        return bool(self.verdict(path_str))
+
+    def _is_dir_ignored(self, dir_str):
+        """
+        :return (bool): True if the directory at `dir_str`, or
+                        any directory containing it, is ignored
+        """
+        try:
+            return self._dir_verdicts[dir_str]
+        except KeyError:
+            pass
+        parent_str = dir_str.rpartition("/")[0]
+        verdict = (
+            (parent_str and self._is_dir_ignored(parent_str)) or
+            self._is_ignored(dir_str)
+        )
+        self._dir_verdicts[dir_str] = verdict
+        return verdict
+
+    def match(self, path_str):
+        """
+        :param path_str: A path relative to the project, with
+                         "/" separators
+        :return (bool): True if it should be ignored
+        """
+        path_str = path_str.strip("/")
+        if not path_str:
+            return False
+        parent_str = path_str.rpartition("/")[0]
+        return bool(
+            (parent_str and self._is_dir_ignored(parent_str)) or
+            self._is_ignored(path_str)
+        )
+
+    def ignore(self, base_path, file_path):
+        path_str = relative_path_str(base_path, file_path)
+        if path_str is None:
+            return True
+        return self.match(path_str)
+
+    def ignore_path(self, base_path, file_path):
+        return self.ignore(base_path, file_path)
@@ -1,15 +1,88 @@
 #! /usr/bin/env python
 """
 """
+import os
+from collections import namedtuple
 
 from nit.core.objects.tree import Tree
 
 
+class IndexStat(namedtuple("IndexStat", ("mtime_ns", "size", "ino"))):
+
+    """
+    The stat data of a file, as recorded in the index when the
+    file was last hashed
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_stat_result(cls, st):
+        return cls(st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class DirCacheEntry(namedtuple(
+    "DirCacheEntry", ("mtime_ns", "dir_names", "file_names")
+)):
+
+    """
+    The listing of a directory in the working tree, as it was
+    when the directory had the given mtime. A directory's mtime
+    changes whenever an entry is added to, removed from or
+    renamed in it, so while it stays the same the listing can
+    be reused instead of reading the directory again.
+
+    `dir_names` only holds real subdirectories (not symlinks),
+    which are the ones the working tree descends into.
+    """
+
+    __slots__ = ()
+
+
 class Index(Tree):
 
     """
+    The next tree to be committed.
+
+    Alongside each node, the index may keep the stat data that
+    the node's file had when it was hashed (see `IndexStat`), so
+    that a file whose stat data hasn't changed since needn't be
+    hashed again to know its key.
     """
 
+    # A file modified less than this long before the index was
+    # written is "racily clean": it may change again without its
+    # mtime changing (timestamps are coarse on some filesystems),
+    # so its stat data can't be trusted
+    RACY_WINDOW_NS = 2 * 10 ** 9
+
+    def __init__(
+        self, nodes=None, stats=None, dir_cache=None,
+        fsmonitor_token=None, tree_cache=None
+    ):
+        super().__init__(nodes=nodes)
+        self.stats = dict(stats or {})
+
+        # The keys of the trees of directories whose contents
+        # haven't changed since they were stored, keyed by their
+        # relative paths ("" for the project directory), so that
+        # only the changed directories have to be stored again
+        # (see `BaseStorage.put_nested_tree`)
+        self.tree_cache = dict(tree_cache or {})
+
+        # Listings of the working tree's directories, keyed by
+        # their relative paths ("" for the project directory)
+        self.dir_cache = dict(dir_cache or {})
+
+        # The filesystem monitor's token for the moment the
+        # stats and the directory cache were last verified (see
+        # `nit.components.base.fsmonitor`)
+        self.fsmonitor_token = fsmonitor_token
+
+        # When the index was last written, if it's been read
+        # from disk; set by the storage
+        self.mtime_ns = None
+
     def accept_put(self, storage):
         storage.put_index(self)
 
@@ -20,18 +93,96 @@ class Index(Tree):
     def accept_deserializer(cls, deserializer):
         return deserializer.deserialize_index(cls)
 
-    def add_node(self, tree_node):
-        return super().add_node(tree_node)
+    def add_node(self, tree_node, stat=None):
+        """
+        :param stat (IndexStat): The stat data of the node's
+                                 file, if it was just hashed
+        """
+        self.stats.pop(tree_node.path_str, None)
+        if stat is not None:
+            self.stats[tree_node.path_str] = stat
+        added = super().add_node(tree_node)
+        if added:
+            self._invalidate_tree_cache(tree_node.path_str)
+        return added
+
+    def remove_node(self, tree_node):
+        self.stats.pop(tree_node.path_str, None)
+        super().remove_node(tree_node)
+        self._invalidate_tree_cache(tree_node.path_str)
+
+    def _invalidate_tree_cache(self, path_str):
+        """
+        Forgets the trees of the directories containing the
+        file at `path_str`, which have changed along with it
+        """
+        while path_str:
+            path_str = os.path.dirname(path_str)
+            self.tree_cache.pop(path_str, None)
+
+    def get_clean_key(self, path_str, st):
+        """
+        :param path_str: The relative path of a file
+        :param st: The result of os.stat() for the file
+        :return (str): The key of the file, if its stat data
+                       shows it's unchanged since it was hashed,
+                       or None if it has to be hashed again
+        """
+        stat = self.stats.get(path_str)
+        if stat is None or stat != IndexStat.from_stat_result(st):
+            return None
+        if self._is_racy(stat.mtime_ns):
+            return None
+        node = self.nodes_by_path_str.get(path_str)
+        return node.key if node else None
+
+    def get_clean_dir(self, dir_str, st):
+        """
+        :param dir_str: The relative path of a directory
+        :param st: The result of os.stat() for the directory
+        :return (DirCacheEntry): The cached listing of the
+                                 directory, if its mtime shows
+                                 it's still valid, or None
+        """
+        entry = self.dir_cache.get(dir_str)
+        if entry is None or entry.mtime_ns != st.st_mtime_ns:
+            return None
+        if self._is_racy(entry.mtime_ns):
+            return None
+        return entry
+
+    def _is_racy(self, mtime_ns):
+        return (
+            self.mtime_ns is None or
+            mtime_ns >= self.mtime_ns - self.RACY_WINDOW_NS
+        )
+
+    def drop_racy_stats(self, now_ns):
+        """
+        Forgets the stat data of files, and the listings of
+        directories, modified too recently before `now_ns` (when
+        the index is about to be written) to be trusted later,
+        along with the stat data of files no longer in the index
+        """
+        self.stats = {
+            path_str: stat
+            for path_str, stat in self.stats.items()
+            if path_str in self._nodes and
+            stat.mtime_ns < now_ns - self.RACY_WINDOW_NS
+        }
+        self.dir_cache = {
+            dir_str: entry
+            for dir_str, entry in self.dir_cache.items()
+            if entry.mtime_ns < now_ns - self.RACY_WINDOW_NS
+        }
 
     @classmethod
-    def from_tree(cls, tree):
-        index = cls()
-        for node in tree:
-            index.add_node(node)
-        return index
+    def from_tree(cls, tree, tree_cache=None):
+        """
+        :param tree_cache (dict): The keys of the trees of the
+                                  directories in `tree`, if known
+        """
+        return cls.from_nodes(tree, tree_cache=tree_cache)
 
     def to_tree(self):
-        tree = Tree()
-        for node in self:
-            tree.add_node(node)
-        return tree
+        return Tree.from_nodes(self)
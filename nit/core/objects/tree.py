@@ -1,7 +1,10 @@
 #! /usr/bin/env python
 """
 """
+import re
+import sys
 from abc import abstractproperty, abstractmethod
+from collections import namedtuple
 from pathlib import Path
 from nit.core.diff import BaseTreeDiff
 from nit.core.log import getLogger
@@ -11,33 +14,80 @@ from nit.core.storage import Storable
 logger = getLogger(__name__)
 
 
-class TreeNode:
+# Matches the paths that Path would normalize: empty, "." or
+# with an empty or "." component
+_UNNORMALIZED_PATH_RE = re.compile(r"(^|/)\.?(/|$)")
+
+
+def _intern_path_str(relative_file_path):
+    """
+    :param relative_file_path: A Path or a POSIX str
+    :return (str): The path as an interned POSIX str,
+                   normalized as Path would
+    """
+    if (
+        not isinstance(relative_file_path, str) or
+        _UNNORMALIZED_PATH_RE.search(relative_file_path)
+    ):
+        relative_file_path = Path(relative_file_path).as_posix()
+    return sys.intern(relative_file_path)
+
+
+class TreeNode(namedtuple("TreeNode", ("path_str", "key", "is_tree"))):
     """
+    A file in a tree: its path, relative to the tree, and the
+    key of its blob.
+
+    Nodes are immutable tuples, so they're small and hash and
+    compare without any formatting. Their path strs are
+    interned, so the nodes for a path in the head tree, the
+    index and the working tree share one str.
     """
 
-    def __init__(self, relative_file_path, key):
-        self.path = Path(relative_file_path)
-        self.key = key
+    __slots__ = ()
+
+    # The is_tree of every node of the class
+    _IS_TREE = False
+
+    def __new__(cls, relative_file_path, key):
+        return super().__new__(
+            cls, _intern_path_str(relative_file_path), key, cls._IS_TREE
+        )
+
+    def __getnewargs__(self):
+        return self.path_str, self.key
+
+    @property
+    def path(self):
+        """
+        :return (Path): A new Path for `path_str`
+        """
+        return Path(self.path_str)
 
     def __str__(self):
         return "{} {}".format(
-            self.path, self.key
+            self.path_str, self.key
         )
 
     def __repr__(self):
         return "TreeNode('{}')".format(self)
 
-    def __hash__(self):
-        return hash(str(self))
 
-    def __eq__(self, other):
-        return hash(self) == hash(other)
+class SubtreeNode(TreeNode):
+    """
+    A node naming the tree of a directory, within the tree of
+    its parent (see `BaseStorage.put_nested_tree`). Its path is
+    written with a trailing slash, which no file's path can have.
+    """
+
+    __slots__ = ()
 
-    def __ne__(self, other):
-        return not self.__eq__(other)
+    _IS_TREE = True
 
-    def __lt__(self, other):
-        return str(self.path) < str(other.path)
+    def __str__(self):
+        return "{}/ {}".format(
+            self.path_str, self.key
+        )
 
 
 class Treeish(Storable):
@@ -58,12 +108,37 @@ class Tree(Treeish):
     Stores a tree of objects, particularly Blobs and
     child Trees. This almost always represents a sub-directory
     as part of a Commit.
+
+    Nodes are kept by path, so a tree holds at most one node per
+    path and finding a path's node doesn't scan the tree. The
+    sorted nodes are kept until the tree changes.
     """
 
     Node = TreeNode
+    Subtree = SubtreeNode
 
     def __init__(self, nodes=None):
-        self._nodes = set(nodes or [])
+        # path str -> node
+        self._nodes = {}
+        self._sorted = None
+        for node in nodes or []:
+            self._nodes[node.path_str] = node
+
+    @classmethod
+    def from_nodes(cls, nodes, **kwargs):
+        """
+        Builds a tree of many nodes at once. If they're already
+        sorted by path, as they're serialized, they needn't be
+        sorted again.
+
+        :param kwargs: Passed on to the constructor
+        :return (Tree):
+        """
+        tree = cls(nodes=nodes, **kwargs)
+        path_strs = list(tree._nodes)
+        if all(a < b for a, b in zip(path_strs, path_strs[1:])):
+            tree._sorted = list(tree._nodes.values())
+        return tree
 
     def __str__(self):
         return (
@@ -71,8 +146,8 @@ class Tree(Treeish):
             "{}\n\n"
         ).format(
             "\n".join(
-                "    {} {}".format(
-                    n.key, n.path
+                "    {} {}{}".format(
+                    n.key, n.path_str, "/" if n.is_tree else ""
                 ) for n in self.nodes_sorted
             )
         )
@@ -89,32 +164,60 @@ class Tree(Treeish):
 
     @property
     def nodes_sorted(self):
-        return sorted(
-            iter(self),
-            key=lambda node: str(node.path)
-        )
+        if self._sorted is None:
+            self._sorted = [
+                self._nodes[path_str] for path_str in sorted(self._nodes)
+            ]
+        return self._sorted
 
     @property
     def nodes_by_path(self):
         return {
-            n.path: n for n in self._nodes
+            n.path: n for n in self._nodes.values()
         }
 
+    @property
+    def nodes_by_path_str(self):
+        """
+        :return (dict): The nodes keyed by the strs of their
+                        paths; not to be modified
+        """
+        return self._nodes
+
+    def get(self, path, default=None):
+        """
+        :param path: The path of a node, as a Path or a str
+        :return (TreeNode): The node at `path`, or `default`
+        """
+        return self._nodes.get(str(path), default)
+
     def __iter__(self):
-        return iter(self._nodes)
+        return iter(self._nodes.values())
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, tree_node):
+        return self._nodes.get(tree_node.path_str) == tree_node
 
     def add_node(self, tree_node):
-        if tree_node in self._nodes:
+        """
+        Adds `tree_node`, replacing any node with the same path
+
+        :return (bool): False if the tree already had it
+        """
+        path_str = tree_node.path_str
+        if self._nodes.get(path_str) == tree_node:
             return False
-        if tree_node.path in self.nodes_by_path:
-            self._nodes.remove(
-                self.nodes_by_path[tree_node.path]
-            )
-        self._nodes.add(tree_node)
+        self._nodes[path_str] = tree_node
+        self._sorted = None
         return True
 
     def remove_node(self, tree_node):
-        self._nodes.remove(tree_node)
+        if tree_node not in self:
+            raise KeyError(tree_node)
+        del self._nodes[tree_node.path_str]
+        self._sorted = None
 
     def diff(self, other):
         return BaseTreeDiff(self, other)
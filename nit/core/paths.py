@@ -110,6 +110,14 @@ class BasePaths(Paths):
         """
         return "objects"
 
+    @property
+    def packs_name(self):
+        """
+        The name of the subdirectory of objects where
+        packfiles are stored
+        """
+        return "pack"
+
     @property
     def refs_name(self):
         """
@@ -127,6 +135,22 @@ class BasePaths(Paths):
         """
         return "index"
 
+    @property
+    def key_index_name(self):
+        """
+        The name of the file that stores a sorted index
+        of every key in the object database
+        """
+        return "keys"
+
+    @property
+    def fsmonitor_socket_name(self):
+        """
+        The name of the Unix socket that the filesystem
+        monitor daemon listens on
+        """
+        return "fsmonitor.sock"
+
     @property
     def head_name(self):
         """
@@ -181,6 +205,13 @@ class BasePaths(Paths):
         """
         return self.repo/self.objects_name
 
+    @property
+    def packs(self):
+        """
+        :return (Path):
+        """
+        return self.objects/self.packs_name
+
     @property
     def refs(self):
         """
@@ -202,6 +233,20 @@ class BasePaths(Paths):
         """
         return self.repo/self.head_name
 
+    @property
+    def key_index(self):
+        """
+        :return (Path):
+        """
+        return self.repo/self.key_index_name
+
+    @property
+    def fsmonitor_socket(self):
+        """
+        :return (Path):
+        """
+        return self.repo/self.fsmonitor_socket_name
+
     @property
     def ignore(self):
         """
@@ -258,8 +303,9 @@ class BasePaths(Paths):
         """
         canonical_path = self.get_canonical_object_path(keyish)
 
-        if canonical_path.exists() and not canonical_path.is_dir():
-            return canonical_path
+        existing_path = self.get_existing_object_path(keyish)
+        if existing_path:
+            return existing_path
 
         search_result = self.find_object_paths_matching(keyish)
 
@@ -292,6 +338,16 @@ class BasePaths(Paths):
     def get_canonical_object_path(self, key):
         return self.objects/key
 
+    def get_existing_object_path(self, key):
+        """
+        :return (Path): The path of the loose object with exactly
+                        `key`, or None if there isn't one
+        """
+        canonical_path = self.get_canonical_object_path(key)
+        if canonical_path.is_file():
+            return canonical_path
+        return None
+
     def iter_object_paths_matching(self, keyish):
         assert keyish
         return (
@@ -304,6 +360,19 @@ class BasePaths(Paths):
             self.iter_object_paths_matching(keyish)
         )
 
+    def iter_loose_object_paths(self):
+        """
+        Every object file stored outside of a pack (hidden
+        temporary files are skipped)
+        """
+        return (
+            p for p in self.objects.iterdir()
+            if p.is_file() and not p.name.startswith(".")
+        )
+
+    def get_object_key_for_path(self, object_path):
+        return object_path.name
+
     def get_ref_relative_path(self, name):
         parts = name.split("/")
         if len(parts) == 1:
@@ -317,3 +386,74 @@ class BasePaths(Paths):
         relative_path = self.get_ref_relative_path(name)
         return self.repo/relative_path
 
+
+class FanoutPaths(BasePaths):
+
+    """
+    Shards the object database into subdirectories named after
+    the first characters of each key (``objects/ab/cdef...``),
+    so that no directory grows past a few thousand entries and
+    an abbreviated key only requires listing one shard.
+
+    Objects still in the flat layout are found by exact key, so
+    a store keeps working while it is being migrated.
+    """
+
+    FANOUT_LEN = 2
+
+    def _is_shard(self, path):
+        return (
+            len(path.name) == self.FANOUT_LEN and
+            path.is_dir() and
+            all(c in "0123456789abcdef" for c in path.name)
+        )
+
+    def get_canonical_object_path(self, key):
+        if len(key) <= self.FANOUT_LEN:
+            return self.objects/key
+        return self.objects/key[:self.FANOUT_LEN]/key[self.FANOUT_LEN:]
+
+    def get_existing_object_path(self, key):
+        existing_path = super().get_existing_object_path(key)
+        if existing_path:
+            return existing_path
+        flat_path = self.objects/key
+        if flat_path.is_file():
+            return flat_path
+        return None
+
+    def iter_object_paths_matching(self, keyish):
+        assert keyish
+
+        if len(keyish) < self.FANOUT_LEN:
+            shard_paths = [
+                p for p in self.objects.glob(keyish + "*")
+                if self._is_shard(p)
+            ]
+            pattern = "*"
+        else:
+            shard_paths = [self.objects/keyish[:self.FANOUT_LEN]]
+            pattern = keyish[self.FANOUT_LEN:] + "*"
+
+        for shard_path in shard_paths:
+            if not shard_path.is_dir():
+                continue
+            yield from (
+                p for p in shard_path.glob(pattern)
+                if p.is_file() and not p.name.startswith(".")
+            )
+
+    def iter_loose_object_paths(self):
+        for p in self.objects.iterdir():
+            if self._is_shard(p):
+                yield from (
+                    op for op in p.iterdir()
+                    if op.is_file() and not op.name.startswith(".")
+                )
+            elif p.is_file() and not p.name.startswith("."):
+                yield p
+
+    def get_object_key_for_path(self, object_path):
+        if object_path.parent == self.objects:
+            return object_path.name
+        return object_path.parent.name + object_path.name
@@ -0,0 +1,24 @@
+from nit.core.errors import NitUserError
+from nit.core.paths import BasePaths, FanoutPaths
+
+
+__all__ = [
+    'get_paths_cls',
+]
+
+
+layouts = {
+    'flat': BasePaths,
+    'fanout': FanoutPaths,
+}
+
+
+def get_paths_cls(layout):
+    cls = layouts.get(layout or 'flat')
+    if not cls:
+        raise NitUserError(
+            '"{}" is not a valid object layout (expected one of: {})'.format(
+                layout, ", ".join(sorted(layouts))
+            )
+        )
+    return cls
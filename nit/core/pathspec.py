@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+"""
+"""
+import os
+
+from nit.core.errors import NitUserError
+
+
+class Pathspec:
+
+    """
+    Limits a command to some of the project's files: those at,
+    or below, any of a list of paths relative to the project
+    directory (e.g. ``src/`` or ``README.md``).
+    """
+
+    def __init__(self, path_strs):
+        self.path_strs = set()
+        for path_str in path_strs:
+            path_str = os.path.normpath(str(path_str))
+            if path_str == os.path.pardir or path_str.startswith(
+                os.path.pardir + os.path.sep
+            ) or os.path.isabs(path_str):
+                raise NitUserError(
+                    "'{}' is outside the project".format(path_str)
+                )
+            if path_str == os.path.curdir:
+                path_str = ""
+            self.path_strs.add(path_str)
+
+    @classmethod
+    def from_args(cls, path_strs):
+        """
+        :return (Pathspec): For `path_strs`, or None if it's
+                            empty or matches everything
+        """
+        pathspec = cls(path_strs or [])
+        if not pathspec.path_strs or "" in pathspec.path_strs:
+            return None
+        return pathspec
+
+    def matches(self, path_str):
+        """
+        :return (bool): True if `path_str` is at or below one
+                        of the paths
+        """
+        path_str = str(path_str)
+        while True:
+            if path_str in self.path_strs:
+                return True
+            if not path_str:
+                return False
+            path_str = os.path.dirname(path_str)
+
+    def matches_below(self, dir_str):
+        """
+        :return (bool): True if anything in the directory at
+                        `dir_str` could match
+        """
+        if self.matches(dir_str):
+            return True
+        prefix = dir_str + os.path.sep
+        return any(p.startswith(prefix) for p in self.path_strs)
+
+    def filter(self, nodes):
+        """
+        :return (list): The nodes whose paths match
+        """
+        return [n for n in nodes or [] if self.matches(n.path_str)]
@@ -62,28 +62,93 @@ class Serializer(metaclass=ABCMeta):
 class BaseSerializer(Serializer):
 
     """
+    Reads are buffered: `read_bytes_until` reads the stream in
+    chunks and scans them with bytes.find, rather than reading
+    a byte at a time. Whatever was read ahead is handed back to
+    the stream (by seeking, if it's seekable) when the rest of
+    it is read with `read_bytes()`, or when a deserialization
+    finishes, so the stream is left just past what was parsed.
     """
 
+    # Chunks start small, since often only a short header is
+    # parsed (see `deserialize_blob_header`), and double in
+    # size up to the maximum
+    MIN_READ_SIZE = 256
+    MAX_READ_SIZE = 64 * 1024
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self._buffer = b""
+        self._pos = 0
+        self._read_size = self.MIN_READ_SIZE
+
     def write_bytes(self, b):
         self.stream.write(b)
 
     def read_bytes(self, n=None):
-        return self.stream.read(n)
+        available = len(self._buffer) - self._pos
 
-    def read_bytes_until(self, terminator=b"\0"):
-        byte_string = []
+        if available and n is None and self._is_seekable():
+            # Rather than copying what's buffered onto the front
+            # of what's left, which could be a large blob
+            self._unread()
+            available = 0
+
+        if not available:
+            return self.stream.read(n)
 
+        if n is not None and n <= available:
+            b = self._buffer[self._pos:self._pos + n]
+            self._pos += n
+            return b
+
+        head = self._buffer[self._pos:]
+        self._clear_buffer()
+        tail = self.stream.read(None if n is None else n - available)
+        return head + tail if tail else head
+
+    def read_bytes_until(self, terminator=b"\0"):
+        """
+        :return (bytes): Everything up to the next `terminator`
+                         (which is consumed but not returned),
+                         or to the end of the stream
+        """
         while True:
-            last_byte = self.stream.read(1)
-            if last_byte in [terminator, b""]:
-                break
-            byte_string.append(last_byte)
+            i = self._buffer.find(terminator, self._pos)
+            if i >= 0:
+                b = self._buffer[self._pos:i]
+                self._pos = i + len(terminator)
+                return b
+
+            chunk = self.stream.read(self._read_size)
+            self._read_size = min(self._read_size * 2, self.MAX_READ_SIZE)
+
+            if not chunk:
+                b = self._buffer[self._pos:]
+                self._clear_buffer()
+                return b
 
-        byte_string = b"".join(byte_string)
+            self._buffer = self._buffer[self._pos:] + chunk
+            self._pos = 0
 
-        # bytes conversion is not necessary here, it's
-        # used to provide a type-hint for IDEs
-        return bytes(byte_string)
+    def _clear_buffer(self):
+        self._buffer = b""
+        self._pos = 0
+        self._read_size = self.MIN_READ_SIZE
+
+    def _is_seekable(self):
+        seekable = getattr(self.stream, "seekable", None)
+        return seekable is not None and seekable()
+
+    def _unread(self):
+        """
+        Seeks the stream back over what was read ahead, if it's
+        seekable, and empties the buffer either way
+        """
+        available = len(self._buffer) - self._pos
+        self._clear_buffer()
+        if available and self._is_seekable():
+            self.stream.seek(-available, 1)
 
     def write_string(self, s, encoding="utf-8"):
         b = s.encode(encoding=encoding)
@@ -98,8 +163,11 @@ class BaseSerializer(Serializer):
         serializable.accept_serializer(self)
 
     def deserialize(self):
-        obj_cls = self._deserialize_get_obj_cls()
-        return obj_cls.accept_deserializer(self)
+        try:
+            obj_cls = self._deserialize_get_obj_cls()
+            return obj_cls.accept_deserializer(self)
+        finally:
+            self._unread()
 
     def _deserialize_get_obj_cls(self):
         raise NotImplementedError("_deserialize_get_obj_cls")
@@ -119,6 +187,12 @@ class BaseSerializer(Serializer):
     def serialize_blob(self, blob):
         raise NotImplementedError("serialize_blob")
 
+    def serialize_blob_header(self, blob_len):
+        raise NotImplementedError("serialize_blob_header")
+
+    def deserialize_blob_header(self):
+        raise NotImplementedError("deserialize_blob_header")
+
     def deserialize_blob(self, blob_cls):
         raise NotImplementedError("deserialize_blob")
 
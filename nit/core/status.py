@@ -1,9 +1,10 @@
 #! /usr/bin/env python
 """
 """
+import os
 from abc import ABCMeta, abstractproperty, abstractmethod
+from pathlib import Path
 
-from nit.core.diff import BaseTreeDiff
 from nit.core.errors import NitRefNotFoundError, \
     NitObjectNotFoundError
 from nit.core.objects.tree import Tree
@@ -56,50 +57,264 @@ class StatusStrategy(metaclass=ABCMeta):
 class BaseStatusStrategy(StatusStrategy):
 
     """
+    Compares the head tree, the index and the working tree.
+
+    The first time a result is asked for, the three trees are
+    joined on their paths in a single pass, and every path is
+    classified once. The results are kept, so asking again
+    (e.g. for `clean`, then for each section of a formatted
+    status) costs nothing.
+
+    If `cached` is True, the working tree wasn't read, and only
+    the head tree and the index are compared.
     """
 
+    CATEGORIES = (
+        "added", "removed", "unmodified", "modified",
+        "unstaged", "untracked", "ignored"
+    )
+
     def __init__(
         self, head, index, working,
         ignorer=None, current_branch=None,
-        tree_diff_cls=BaseTreeDiff,
-        head_commit=None
+        head_commit=None, cached=False
     ):
         self._ignorer = ignorer or (lambda n: False)
         self.current_branch = current_branch
-        self.head_index = tree_diff_cls(head, index)
-        self.head_working = tree_diff_cls(head, working)
-        self.index_working = tree_diff_cls(index, working)
         self.head_commit = head_commit
+        self.cached = cached
+        self._trees = (head, index, None if cached else working)
+        self._results = None
 
-    @classmethod
-    def from_repo(
-        cls, repo, ignorer=None, tree_diff_cls=BaseTreeDiff
-    ):
+    def _join(self):
+        """
+        :return (dict): [head node, index node, working node]
+                        by path, with None where a tree has no
+                        node at the path
+        """
+        joined = {}
+        for i, tree in enumerate(self._trees):
+            for node in tree or []:
+                nodes = joined.get(node.path_str)
+                if nodes is None:
+                    nodes = joined[node.path_str] = [None, None, None]
+                nodes[i] = node
+        return joined
+
+    def _classify(self):
+        """
+        :return (dict): A frozenset of nodes for each of the
+                        CATEGORIES
+        """
+        if self._results is not None:
+            return self._results
+
+        results = {category: [] for category in self.CATEGORIES}
+        added = results["added"].append
+        removed = results["removed"].append
+        unmodified = results["unmodified"].append
+        modified = results["modified"].append
+        unstaged = results["unstaged"].append
+        untracked = results["untracked"].append
+        ignored = results["ignored"].append
+        ignorer = self._ignorer
+        cached = self.cached
+
+        for head, index, working in self._join().values():
+            if head is not None:
+                if index is None or (working is None and not cached):
+                    removed(head)
+                if index is not None:
+                    if index.key == head.key:
+                        unmodified(head)
+                    else:
+                        modified(index)
+            elif index is not None:
+                added(index)
+
+            if working is None:
+                continue
+            if index is None:
+                if ignorer(working.path):
+                    ignored(working)
+                else:
+                    untracked(working)
+            elif working.key != index.key and not ignorer(working.path):
+                unstaged(working)
+
+        self._results = {
+            category: frozenset(nodes)
+            for category, nodes in results.items()
+        }
+        return self._results
+
+    @staticmethod
+    def _get_head_commit(repo):
+        """
+        :return (Commit): The HEAD commit, or None
+        """
         try:
-            head_commit = repo.storage.resolve_symbolic_ref(
+            return repo.storage.resolve_symbolic_ref(
                 "HEAD"
             )
         except NitObjectNotFoundError:
-            head_commit = None
+            return None
 
-        try:
-            head_tree_key = head_commit.tree_key
-            head = repo.storage.get_object(
-                head_tree_key
-            )
-        except AttributeError:
-            head = Tree()
+    @staticmethod
+    def _get_head_tree(repo, head_commit, index=None):
+        """
+        :param index (Index): If given, the directories whose
+                              trees haven't changed in it are
+                              taken from it, rather than loaded
+                              (see `BaseStorage.get_nested_tree`)
+        :return (Tree): The tree of `head_commit`, which is
+                        empty if it's None
+        """
+        if head_commit is None:
+            return Tree()
+        return repo.storage.get_nested_tree(
+            head_commit.tree_key, index=index
+        )
+
+    @classmethod
+    def _get_head(cls, repo, index=None):
+        """
+        :return (tuple): (the HEAD commit or None, its tree)
+        """
+        head_commit = cls._get_head_commit(repo)
+        return head_commit, cls._get_head_tree(repo, head_commit, index)
+
+    @classmethod
+    def is_clean(cls, repo, ignorer=None):
+        """
+        The same as ``from_repo(repo, ignorer).clean``, but
+        stops at the first path that makes the repository
+        dirty.
+
+        None of the categories that `clean` depends on needs
+        the content of a file, only whether it exists, so the
+        working tree is walked (using the index's directory
+        cache) but no file in it is read or even stat'ed.
 
+        :return (bool):
+        """
+        ignorer = ignorer or (lambda n: False)
+        head_commit = cls._get_head_commit(repo)
+        index = repo.storage.get_index()
+
+        # Added, modified or removed in the index
+        index_keys = {n.path_str: n.key for n in index or []}
+        if (
+            index is not None and head_commit is not None and
+            index.tree_cache.get("") == head_commit.tree_key
+        ):
+            # The index is unchanged since it was committed or
+            # checked out, so the head tree needn't be loaded
+            head_keys = index_keys
+        else:
+            head = cls._get_head_tree(repo, head_commit, index)
+            head_keys = {n.path_str: n.key for n in head}
+            if head_keys != index_keys:
+                return False
+
+        # Untracked, or removed from the working tree
+        missing = set(head_keys)
+        project = repo.storage.paths.project
+        for path_str in repo.storage.iter_working_tree_paths(
+            index=index, ignore=ignorer
+        ):
+            if path_str in head_keys:
+                missing.discard(path_str)
+            elif (
+                not ignorer(Path(path_str)) and
+                os.path.isfile(os.path.join(str(project), path_str))
+            ):
+                return False
+
+        return not missing
+
+    @classmethod
+    def from_repo(
+        cls, repo, ignorer=None, cached=False, untracked=True,
+        pathspec=None
+    ):
+        """
+        :param cached (bool): Only compare the head tree and the
+                              index, without reading the working
+                              tree at all
+        :param untracked (bool): If False, don't look for
+                                 untracked files, so that only
+                                 tracked directories are walked
+        :param pathspec (Pathspec): Only compare the paths it
+                                    matches
+        """
         index = repo.storage.get_index()
-        working = repo.storage.get_working_tree()
+        head_commit, head = cls._get_head(repo, index)
 
         current_branch = repo.get_current_branch()
 
+        status_head, status_index = head, index
+        if pathspec is not None:
+            status_head = pathspec.filter(head)
+            status_index = pathspec.filter(index)
+
+        if cached:
+            return cls(
+                status_head, status_index, None,
+                ignorer=ignorer,
+                current_branch=current_branch,
+                head_commit=head_commit,
+                cached=True
+            )
+
+        partial = pathspec is not None or not untracked
+
+        # A filesystem monitor, if one is running, can tell
+        # which paths may have changed since the index was
+        # written; the token is taken before the working tree is
+        # read, so that nothing changed while it's read is missed
+        fsmonitor_token, changed_paths = None, None
+        fsmonitor = getattr(repo, "fsmonitor_client", None)
+        if index is not None and fsmonitor is not None and not partial:
+            fsmonitor_token, changed_paths = fsmonitor.query(
+                index.fsmonitor_token
+            )
+
+        working = repo.storage.get_working_tree(
+            index=index, ignore=ignorer, changed_paths=changed_paths,
+            pathspec=pathspec, untracked=untracked
+        )
+
+        fsmonitor_token_advanced = (
+            fsmonitor_token is not None and
+            fsmonitor_token != index.fsmonitor_token and
+            changed_paths != set()
+        )
+
+        if index is not None and (
+            working.refreshed_stats or working.dir_cache_refreshed or
+            working.stale_stats or fsmonitor_token_advanced
+        ):
+            # Save the stat data of files that had to be hashed,
+            # and the directories that had to be listed, so that
+            # the work isn't repeated next time
+            index.stats.update(working.refreshed_stats)
+            for path_str in working.stale_stats:
+                index.stats.pop(path_str, None)
+            if working.partial:
+                # Directories that weren't walked keep their
+                # entries
+                index.dir_cache.update(working.dir_cache)
+            else:
+                index.dir_cache = working.dir_cache
+            if fsmonitor_token is not None:
+                index.fsmonitor_token = fsmonitor_token
+            repo.storage.put_index(index)
+
         return cls(
-            head, index, working,
+            status_head, status_index, working,
             ignorer=ignorer,
             current_branch=current_branch,
-            tree_diff_cls=tree_diff_cls,
             head_commit=head_commit
         )
 
@@ -127,41 +342,32 @@ class BaseStatusStrategy(StatusStrategy):
         Nodes whose paths are found in the index tree but
         not the head tree.
         """
-        return self.head_index.added
+        return self._classify()["added"]
 
     @property
     def removed(self):
         """
         Nodes whose paths are found in the head tree but
-        not the index tree.
+        not the index tree, or not the working tree.
         """
-        return (
-            self.head_index.removed.union(
-                self.head_working.removed
-            )
-        )
+        return self._classify()["removed"]
 
     @property
     def unmodified(self):
         """
         Nodes whose paths are found in the head tree and
-        the index tree, but which have different keys.
+        the index tree, with the same keys.
         """
-        return self.head_index.unmodified
+        return self._classify()["unmodified"]
 
     @property
     def unstaged(self):
         """
-        Nodes whose paths are found in the working tree but
-        whose keys are not in the index, and are not ignored.
+        Nodes whose paths are found in the working tree and
+        the index tree, but with different keys, and are not
+        ignored.
         """
-        return set(
-            n for n
-            in self.index_working.modified.union(
-                self.index_working.added
-            )
-            if not self._ignorer(n.path)
-        ) - self.untracked
+        return self._classify()["unstaged"]
 
     @property
     def modified(self):
@@ -169,7 +375,7 @@ class BaseStatusStrategy(StatusStrategy):
         Nodes whose paths are found in the head tree and
         the index tree, but which have different keys.
         """
-        return self.head_index.modified
+        return self._classify()["modified"]
 
     @property
     def untracked_all(self):
@@ -177,7 +383,7 @@ class BaseStatusStrategy(StatusStrategy):
         Nodes whose paths are found in the working tree
         but not in the index tree.
         """
-        return self.index_working.added
+        return self.untracked.union(self.ignored)
 
     @property
     def untracked(self):
@@ -185,11 +391,7 @@ class BaseStatusStrategy(StatusStrategy):
         Nodes whose paths are found in the working tree
         but not in the index tree, and are not ignored.
         """
-        return set(
-            n for n
-            in self.untracked_all
-            if not self._ignorer(n.path)
-        )
+        return self._classify()["untracked"]
 
     @property
     def ignored(self):
@@ -197,11 +399,7 @@ class BaseStatusStrategy(StatusStrategy):
         Nodes whose paths are found in the working tree
         but not in the index tree, but are ignored.
         """
-        return set(
-            n for n
-            in self.untracked_all
-            if self._ignorer(n.path)
-        )
+        return self._classify()["ignored"]
 
 
 class StatusFormatter(metaclass=ABCMeta):
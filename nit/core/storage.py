@@ -5,6 +5,7 @@ from abc import (
     ABCMeta,
     abstractmethod,
     abstractproperty)
+from contextlib import contextmanager
 from nit.core.errors import NitExpectedError
 
 from nit.core.log import getLogger
@@ -52,6 +53,24 @@ class ObjectStorage(metaclass=ABCMeta):
         """
         return storable.accept_put(self)
 
+    def get_many(self, keyishes):
+        """
+        Returns the `Storable` matching each of `keyishes`
+
+        :param keyishes: An iterable of keyishes
+        :return (list): The objects, in the same order
+        """
+        return [self.get(keyish) for keyish in keyishes]
+
+    def put_many(self, storables):
+        """
+        Writes each of `storables` to the ObjectStorage.
+
+        :param storables: An iterable of `Storable`
+        :return (list): The keys of the objects, in the same order
+        """
+        return [self.put(storable) for storable in storables]
+
 
 class RefStorage(ObjectStorage, metaclass=ABCMeta):
 
@@ -119,8 +138,33 @@ class MetadataStorage(metaclass=ABCMeta):
         """
 
     @abstractmethod
-    def get_working_tree(self):
+    def get_working_tree(
+        self, index=None, ignore=None, changed_paths=None,
+        pathspec=None, untracked=True
+    ):
+        """
+        :param index (Index): The index, whose stat data may be
+                              used to avoid reading files
+        :param ignore: A predicate for paths that needn't be read
+        :param changed_paths (set): The relative paths that a
+                                    filesystem monitor saw change
+                                    since `index` was written
+        :param pathspec (Pathspec): Limits the files included
+        :param untracked (bool): If False, only the files in
+                                 `index` are included
+        :return (WorkingTree):
+        """
+
+    @abstractmethod
+    def iter_working_tree_paths(self, index=None, ignore=None):
         """
+        :param index (Index): The index, whose directory cache
+                              may be used to avoid listing
+                              directories
+        :param ignore: A predicate for paths that needn't be
+                       walked
+        :return (iterator): The relative path (str) of every
+                            file in the working tree
         """
 
 
@@ -136,3 +180,11 @@ class Storage(RefStorage, MetadataStorage, metaclass=ABCMeta):
     @abstractmethod
     def create(self, force=False):
         pass
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups the writes made in the body of a `with` statement,
+        so that implementations can make them durable together
+        """
+        yield
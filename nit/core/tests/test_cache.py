@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+"""
+"""
+from nit.components.base.cache import LruPool, ObjectCache, parse_size
+from nit.components.nit.storage import CompressedNitStorage, NitStorage
+from nit.core.objects.blob import Blob
+from nit.core.objects.commit import Commit
+from nit.core.tests.util import NitStorageTestCase, NitTestCase
+
+
+class TestLruPool(NitTestCase):
+
+    """
+    """
+
+    def test_evicts_least_recently_used(self):
+        pool = LruPool(10)
+        pool.put("a", "A", 4)
+        pool.put("b", "B", 4)
+        pool.get("a")
+        pool.put("c", "C", 4)
+        assert "a" in pool
+        assert "b" not in pool
+        assert "c" in pool
+        self.assertEqual(pool.size, 8)
+
+    def test_skips_objects_larger_than_limit(self):
+        pool = LruPool(10)
+        pool.put("a", "A", 11)
+        assert "a" not in pool
+        self.assertEqual(pool.size, 0)
+
+
+class TestObjectCache(NitTestCase):
+
+    """
+    """
+
+    def test_separate_pools(self):
+        cache = ObjectCache(blob_limit=10, object_limit=10)
+        commit = Commit("", "tree")
+        cache.put("commit", commit, 8)
+        cache.put("blob", Blob(b"x"), 8)
+        cache.put("blob2", Blob(b"y"), 8)
+        self.assertIs(cache.get("commit"), commit)
+        self.assertIsNone(cache.get("blob"))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 3)
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("12"), 12)
+        self.assertEqual(parse_size("2k"), 2048)
+        self.assertEqual(parse_size("3M"), 3 * 1024 * 1024)
+        with self.expectUserError():
+            parse_size("lots")
+
+
+class TestStorageObjectCache(NitStorageTestCase):
+
+    """
+    """
+
+    def test_get_object_hits_cache(self):
+        key = self.storage.put(Commit("", "tree", message="m"))
+        commit = self.storage.get(key)
+        self.assertIs(self.storage.get(key), commit)
+        self.assertIs(self.storage.get(key[:8]), commit)
+        self.assertEqual(self.storage.object_cache.misses, 1)
+        self.assertEqual(self.storage.object_cache.hits, 2)
+
+    def test_limits_from_config(self):
+        config = self.storage.get_config().repo_config
+        config["core.blobCacheLimit"] = "0"
+        config.save()
+        storage = NitStorage(self.paths)
+        key = storage.put(Blob(b"hello"))
+        self.assertIsNot(storage.get(key), storage.get(key))
+        self.assertEqual(storage.object_cache.hits, 0)
+
+
+class TestCompressedStorageObjectCache(NitStorageTestCase):
+
+    """
+    """
+
+    STORAGE_CLS = CompressedNitStorage
+
+    def test_charges_inflated_size(self):
+        content = b"a" * 100000
+        blob_key = self.storage.put(Blob(content))
+        commit = Commit("", "tree", message="m" * 10000)
+        commit_key = self.storage.put(commit)
+        assert (
+            self.paths.get_canonical_object_path(blob_key).stat().st_size <
+            len(content)
+        )
+
+        self.storage.get(blob_key)
+        self.storage.get(commit_key)
+        stats = self.storage.object_cache.stats
+        self.assertEqual(stats["blob_bytes"], len(content))
+        self.assertEqual(
+            stats["object_bytes"],
+            len(self.storage._serialize_object_to_bytes(commit))
+        )
+
+    def test_get_many_charges_inflated_size(self):
+        content = b"a" * 100000
+        key = self.storage.put(Blob(content))
+        self.storage.get_many([key])
+        self.assertEqual(
+            self.storage.object_cache.stats["blob_bytes"], len(content)
+        )
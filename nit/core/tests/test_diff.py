@@ -7,7 +7,13 @@ from pathlib import Path
 from nit.core.diff import BaseTreeDiff
 
 
-MockNode = namedtuple("TreeNode", ("path", "key", "ignore"))
+class MockNode(namedtuple("TreeNode", ("path", "key", "ignore"))):
+
+    __slots__ = ()
+
+    @property
+    def path_str(self):
+        return str(self.path)
 
 a1 = MockNode(Path("a"), "aaaa1", False)
 a2 = MockNode(Path("a"), "aaaa2", False)
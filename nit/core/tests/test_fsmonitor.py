@@ -0,0 +1,144 @@
+#! /usr/bin/env python
+"""
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from nit.components.base.fsmonitor import FsMonitorClient, FsMonitorDaemon
+from nit.components.base.working_tree import BaseWorkingTree
+from nit.core.objects.index import Index, IndexStat
+from nit.core.objects.tree import TreeNode
+from nit.core.tests.util import NitStorageTestCase
+
+
+@unittest.skipUnless(
+    sys.platform.startswith("linux"), "inotify is Linux-only"
+)
+class TestFsMonitorDaemon(NitStorageTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        (self.paths.project/"dir").mkdir()
+
+        self.client = FsMonitorClient(self.paths)
+        self.daemon = FsMonitorDaemon(self.paths)
+        self.thread = threading.Thread(target=self.daemon.run)
+        self.thread.start()
+
+        deadline = time.time() + 5
+        while self.client.request("since -") is None:
+            assert time.time() < deadline, "The daemon didn't start"
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.client.stop()
+        self.thread.join()
+        super().tearDown()
+
+    def test_unknown_token(self):
+        token, changed = self.client.query(None)
+        self.assertIsNotNone(token)
+        self.assertIsNone(changed)
+        self.assertIsNone(self.client.query("nope:1")[1])
+
+    def test_changes_since_token(self):
+        token, _ = self.client.query(None)
+        self.write("a")
+        self.write("dir/b")
+        self.write("new/deeper/c")
+
+        token, changed = self.client.query(token)
+        self.assertEqual(changed, {
+            "", "a", "dir", "dir/b", "new", "new/deeper", "new/deeper/c"
+        })
+
+        token, changed = self.client.query(token)
+        self.assertEqual(changed, set())
+
+        # The new directories are watched too
+        self.write("new/deeper/c", b"changed")
+        _, changed = self.client.query(token)
+        self.assertEqual(changed, {"new/deeper", "new/deeper/c"})
+
+    def test_repo_dir_is_not_watched(self):
+        token, _ = self.client.query(None)
+        self.write(self.paths.repo_name + "/scratch")
+        _, changed = self.client.query(token)
+        self.assertEqual(changed, set())
+
+    def test_already_running(self):
+        with self.expectUserError():
+            FsMonitorDaemon(self.paths).run()
+
+
+class TestChangedPaths(NitStorageTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        old_ns = time.time_ns() - 2 * Index.RACY_WINDOW_NS
+        self.index = Index()
+        for rel_path in ["a", "dir/b", "dir/c"]:
+            file_path = self.paths.project/rel_path
+            file_path.parent.mkdir(exist_ok=True)
+            with file_path.open('wb') as f:
+                f.write(rel_path.encode())
+            os.utime(str(file_path), ns=(old_ns, old_ns))
+            self.index.add_node(
+                TreeNode(rel_path, self.storage.put_blob_from_path(file_path)),
+                stat=IndexStat.from_stat_result(os.stat(str(file_path)))
+            )
+        for dir_path in [self.paths.project/"dir", self.paths.project]:
+            os.utime(str(dir_path), ns=(old_ns, old_ns))
+        self.storage.put_index(self.index)
+        self.index = self.storage.get_index()
+        self.index.dir_cache = BaseWorkingTree(
+            self.storage, index=self.index
+        ).dir_cache
+
+    def read_paths(self, changed_paths):
+        with mock.patch.object(
+            BaseWorkingTree, "_read_tree_node", autospec=True,
+            side_effect=BaseWorkingTree._read_tree_node
+        ) as read_tree_node:
+            working = BaseWorkingTree(
+                self.storage, index=self.index,
+                changed_paths=changed_paths
+            )
+        read = set(
+            str(Path(c[0][1]).relative_to(self.paths.project))
+            for c in read_tree_node.call_args_list
+        )
+        return read, working
+
+    def test_only_changed_paths_are_read(self):
+        with (self.paths.project/"dir"/"b").open('wb') as f:
+            f.write(b"modified")
+        read, working = self.read_paths({"dir", "dir/b"})
+        self.assertEqual(read, {"dir/b"})
+        self.assertEqual(
+            set(str(n.path) for n in working), {"a", "dir/b", "dir/c"}
+        )
+        self.assertEqual(working.stale_stats, {"dir/b"})
+
+    def test_unchanged_dirs_are_not_listed(self):
+        with mock.patch.object(
+            BaseWorkingTree, "_list_dir", autospec=True
+        ) as list_dir:
+            self.read_paths(set())
+        list_dir.assert_not_called()
+
+    def test_without_changed_paths_everything_is_read(self):
+        read, working = self.read_paths(None)
+        self.assertEqual(read, {"a", "dir/b", "dir/c"})
+        self.assertEqual(working.stale_stats, set())
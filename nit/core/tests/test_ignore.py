@@ -2,12 +2,18 @@
 """
 """
 import os
-from unittest import TestCase
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+from nit.components.nit import ignore as nit_ignore
+from nit.components.nit.ignore import NitIgnoreStrategy
+from nit.core.paths import BasePaths
 from nit.core.ignore import (
     RelativeIgnorePredicate,
     RegexIgnorePredicate,
     PathspecIgnorePredicate,
-    CompoundIgnorePredicate
+    CompoundIgnorePredicate,
+    CompiledIgnorePredicate
 )
 
 
@@ -357,3 +363,176 @@ class CompoundIgnorePredicateTests(TestCase):
 # class WindowsPathspecIgnorePredicateTests(PathspecIgnorePredicateTests):
 #
 #     sep = "\\"
+
+
+class CompiledIgnorePredicateTests(TestCase):
+
+    """
+    """
+
+    def assertIgnored(self, patterns, ignored=(), included=()):
+        predicate = CompiledIgnorePredicate(patterns)
+        for path in ignored:
+            assert predicate.ignore("/fake", "/fake/" + path), path
+        for path in included:
+            assert not predicate.ignore("/fake", "/fake/" + path), path
+
+    def test_literal_name(self):
+        self.assertIgnored(
+            [".ignore"],
+            ignored=[".ignore", "subdir/.ignore", ".ignore/a"],
+            included=["cignore", "ignore", "a.ignore.b"]
+        )
+
+    def test_suffix(self):
+        self.assertIgnored(
+            ["*.o", "*.tar.gz"],
+            ignored=["a.o", "dir/b.o", "c.tar.gz", ".o"],
+            included=["a.obj", "o", "c.gz", "a.o.txt"]
+        )
+
+    def test_match_all(self):
+        self.assertIgnored(
+            ["*"],
+            ignored=["foo", "a.txt", ".hidden", "dir/a"]
+        )
+
+    def test_match_all_except(self):
+        self.assertIgnored(
+            ["*", "!*.py"],
+            ignored=["a.txt", "foo", "dir/a.py"],
+            included=["a.py"]
+        )
+
+    def test_wildcards(self):
+        self.assertIgnored(
+            ["ignore?", "*.py[cd]", "[!ab]x"],
+            ignored=["ignored", "sub/ignores", "a.pyc", "cx"],
+            included=["ignore", "ignoreds", "a.py", "ax", "bx"]
+        )
+
+    def test_rooted(self):
+        self.assertIgnored(
+            ["/ignore", "sub/dir"],
+            ignored=["ignore", "ignore/a", "sub/dir", "sub/dir/a"],
+            included=["subdir/ignore", "a/sub/dir"]
+        )
+
+    def test_double_wildcard(self):
+        self.assertIgnored(
+            ["**/ignore", "sub/**/x", "logs/**"],
+            ignored=[
+                "ignore", "a/b/ignore", "sub/x", "sub/a/b/x", "logs/a/b"
+            ],
+            included=["subx", "a/sub/x", "ignored"]
+        )
+
+    def test_trailing_slash(self):
+        self.assertIgnored(
+            ["subdir/"],
+            ignored=["subdir", "subdir/", "subdir/a", "a/subdir/b"],
+            included=["subdira", "a/subdira"]
+        )
+
+    def test_last_match_wins(self):
+        self.assertIgnored(
+            ["*.log", "!keep.log", "keep*"],
+            ignored=["a.log", "keeper"],
+            included=["a.txt"]
+        )
+        self.assertIgnored(
+            ["*.log", "!keep.log"],
+            ignored=["a.log"],
+            included=["keep.log", "dir/keep.log"]
+        )
+
+    def test_no_reinclude_inside_ignored_dir(self):
+        self.assertIgnored(
+            ["build/", "!build/keep", "!*.c"],
+            ignored=["build/keep", "build/a.c"],
+            included=["src/a.c"]
+        )
+
+    def test_comments_and_blank_lines(self):
+        self.assertIgnored(
+            ["# comment", "", "  ", "a\n"],
+            ignored=["a"],
+            included=["# comment", "b"]
+        )
+
+    def test_not_relative(self):
+        predicate = CompiledIgnorePredicate(["a"])
+        assert predicate.ignore("/fake", "/notfake")
+        assert not predicate.ignore("/fake", "b")
+        assert predicate.ignore("/fake", "b/a")
+
+
+class NitIgnoreStrategyTests(TestCase):
+
+    """
+    """
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.paths = BasePaths(self.temp_dir.name, verify=False)
+        self.write_ignore("", "*.log\n/top\n")
+        self.write_ignore("sub", "!keep.log\n/only\nbuild/\n")
+        self.write_ignore("sub/build", "!*\n")
+        self.strategy = NitIgnoreStrategy(self.paths)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_ignore(self, dir_str, content, mtime_ns=None):
+        dir_path = Path(self.temp_dir.name)/dir_str
+        dir_path.mkdir(parents=True, exist_ok=True)
+        ignore_path = dir_path/self.paths.ignore_name
+        with ignore_path.open('w') as f:
+            f.write(content)
+        if mtime_ns is not None:
+            os.utime(str(ignore_path), ns=(mtime_ns, mtime_ns))
+
+    def assertIgnored(self, ignored=(), included=()):
+        for path in ignored:
+            assert self.strategy.ignore(Path(path)), path
+            assert self.strategy.ignore(
+                Path(self.temp_dir.name)/path
+            ), path
+        for path in included:
+            assert not self.strategy.ignore(Path(path)), path
+
+    def test_repo_dir(self):
+        self.assertIgnored(
+            ignored=[self.paths.repo_name, self.paths.repo_name + "/x"]
+        )
+        assert self.strategy.ignore("/elsewhere")
+        assert not self.strategy.ignore(self.temp_dir.name)
+
+    def test_nested_precedence(self):
+        self.assertIgnored(
+            ignored=["a.log", "keep.log", "other/keep.log", "sub/a.log"],
+            included=["sub/keep.log", "sub/deeper/keep.log", "a.txt"]
+        )
+
+    def test_nested_patterns_are_relative(self):
+        self.assertIgnored(
+            ignored=["top", "sub/only", "sub/build/x", "sub/a/build"],
+            included=["sub/top", "only", "sub/a/only", "build/x"]
+        )
+
+    def test_matchers_are_cached(self):
+        with mock.patch.object(
+            nit_ignore, "CompiledIgnorePredicate", autospec=True,
+            side_effect=nit_ignore.CompiledIgnorePredicate
+        ) as predicate_cls:
+            for i in range(10):
+                self.strategy.refresh()
+                self.strategy.ignore(Path("sub/a/b{}.log".format(i)))
+            self.assertEqual(predicate_cls.call_count, 2)
+
+    def test_edits_are_picked_up(self):
+        self.assertIgnored(included=["sub/x"])
+        self.write_ignore("sub", "x\n", mtime_ns=1)
+        self.assertIgnored(included=["sub/x"])
+        self.strategy.refresh()
+        self.assertIgnored(ignored=["sub/x", "sub/keep.log"])
@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+"""
+"""
+from tempfile import TemporaryDirectory
+from pathlib import Path
+
+from nit.components.base.keys import KeyIndex, is_keyish
+from nit.core.errors import NitObjectNotFoundError
+from nit.core.objects.blob import Blob
+from nit.core.tests.util import NitStorageTestCase, NitTestCase
+
+
+class TestKeyIndex(NitTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.path = Path(self.temp_dir.name)/"keys"
+        self.initial_keys = ["ab12", "ab34", "cd56"]
+        self.index = KeyIndex(self.path, lambda: iter(self.initial_keys))
+
+    def tearDown(self):
+        self.index.close()
+        self.temp_dir.cleanup()
+
+    def test_is_keyish(self):
+        assert is_keyish("0af9")
+        assert not is_keyish("")
+        assert not is_keyish("refs/heads/master")
+
+    def test_builds_missing_index(self):
+        assert "ab12" in self.index
+        assert self.path.exists()
+        self.assertEqual(list(self.index), self.initial_keys)
+
+    def test_find_keys_matching(self):
+        self.assertEqual(
+            self.index.find_keys_matching("ab"), ["ab12", "ab34"]
+        )
+        self.assertEqual(self.index.find_keys_matching("cd5"), ["cd56"])
+        self.assertEqual(self.index.find_keys_matching("ef"), [])
+        self.assertEqual(self.index.find_keys_matching("HEAD"), [])
+
+    def test_add_goes_to_journal(self):
+        self.index.add("ab00")
+        assert "ab00" in self.index
+        assert self.index.journal_path.exists()
+        self.assertEqual(
+            self.index.find_keys_matching("ab"), ["ab00", "ab12", "ab34"]
+        )
+
+        reopened = KeyIndex(self.path, lambda: iter([]))
+        assert "ab00" in reopened
+        assert "cd56" in reopened
+        reopened.close()
+
+    def test_journal_is_merged(self):
+        self.index.JOURNAL_LIMIT = 2
+        for key in ["0001", "0002", "0003"]:
+            self.index.add(key)
+        assert not self.index.journal_path.exists()
+        self.assertEqual(
+            list(self.index), ["0001", "0002", "0003"] + self.initial_keys
+        )
+
+
+class TestStorageKeyIndex(NitStorageTestCase):
+
+    """
+    """
+
+    def test_put_updates_index(self):
+        key = self.storage.put(Blob(b"hello"))
+        assert key in self.storage.key_index
+        self.assertEqual(self.storage.resolve_key(key[:5]), key)
+
+    def test_unindexed_objects_are_found(self):
+        key = self.storage.put(Blob(b"hello"))
+        self.storage.key_index.close()
+        self.paths.key_index.unlink()
+        self.storage.key_index.journal_path.unlink()
+        self.storage.key_index.rebuild([])
+
+        self.assertEqual(self.storage.resolve_key(key[:5]), key)
+        self.assertEqual(self.storage.get(key).content, b"hello")
+        assert key in self.storage.key_index
+
+    def test_unindexed_objects_make_prefix_ambiguous(self):
+        key = self.storage.put(Blob(b"hello"))
+        other_key = key[:5] + ("0" if key[5] != "0" else "1") + key[6:]
+        other_path = self.paths.get_canonical_object_path(other_key)
+        other_path.parent.mkdir(parents=True, exist_ok=True)
+        other_path.write_bytes(b"")
+        assert other_key not in self.storage.key_index
+
+        with self.assertRaises(NitObjectNotFoundError):
+            self.storage.resolve_key(key[:5])
+        self.assertEqual(self.storage.resolve_key(key[:6]), key)
+        assert other_key in self.storage.key_index
+
+    def test_pending_objects_are_found_by_prefix(self):
+        with self.storage.transaction():
+            key = self.storage.put(Blob(b"hello"))
+            assert key not in self.storage.key_index
+            self.assertEqual(self.storage.resolve_key(key[:5]), key)
+
+    def test_ref_names_are_not_keys(self):
+        self.assertRaises(
+            NitObjectNotFoundError,
+            self.storage.resolve_key,
+            "refs/heads/master"
+        )
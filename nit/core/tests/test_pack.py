@@ -0,0 +1,146 @@
+#! /usr/bin/env python
+"""
+"""
+from tempfile import TemporaryDirectory
+from pathlib import Path
+
+from nit.components.base.pack import PackSet, write_pack
+from nit.core.errors import NitObjectNotFoundError
+from nit.core.objects.blob import Blob
+from nit.core.tests.util import NitStorageTestCase, NitTestCase
+
+
+class TestWritePack(NitTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.packs_dir = Path(self.temp_dir.name)/"pack"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_write_then_read(self):
+        entries = [
+            ("cc", b"third"),
+            ("aa", b"first"),
+            ("ab", b"second"),
+        ]
+        idx_path = write_pack(self.packs_dir, iter(entries))
+        assert idx_path.exists()
+        assert idx_path.with_suffix(".pack").exists()
+
+        packs = PackSet(self.packs_dir)
+        for key, content in entries:
+            assert key in packs
+            self.assertEqual(packs.read(key), content)
+        assert "ac" not in packs
+        self.assertIsNone(packs.read("ac"))
+        packs.close()
+
+    def test_find_keys_matching(self):
+        write_pack(self.packs_dir, [
+            ("aa", b"1"), ("ab", b"2"), ("bb", b"3")
+        ])
+        packs = PackSet(self.packs_dir)
+        self.assertEqual(packs.find_keys_matching("a"), ["aa", "ab"])
+        self.assertEqual(packs.find_keys_matching("bb"), ["bb"])
+        self.assertEqual(packs.find_keys_matching("c"), [])
+        packs.close()
+
+    def test_write_nothing(self):
+        self.assertIsNone(write_pack(self.packs_dir, []))
+        self.assertEqual(list(self.packs_dir.iterdir()), [])
+
+    def test_concurrent_writes(self):
+        def iter_entries():
+            yield "aa", b"first"
+            # Another writer starts and finishes in the meantime
+            write_pack(self.packs_dir, [("bb", b"other")])
+            yield "ab", b"second"
+
+        write_pack(self.packs_dir, iter_entries())
+
+        packs = PackSet(self.packs_dir)
+        self.assertEqual(len(packs), 2)
+        self.assertEqual(packs.read("aa"), b"first")
+        self.assertEqual(packs.read("ab"), b"second")
+        self.assertEqual(packs.read("bb"), b"other")
+        packs.close()
+        self.assertEqual(
+            [p for p in self.packs_dir.iterdir() if p.name.startswith(".")],
+            []
+        )
+
+    def test_failed_write_leaves_nothing(self):
+        def iter_entries():
+            yield "aa", b"first"
+            raise RuntimeError()
+
+        with self.assertRaises(RuntimeError):
+            write_pack(self.packs_dir, iter_entries())
+        self.assertEqual(list(self.packs_dir.iterdir()), [])
+
+
+class TestStorageRepack(NitStorageTestCase):
+
+    """
+    """
+
+    def test_repack_moves_loose_objects(self):
+        keys = [
+            self.storage.put(Blob(b"blob " + str(i).encode()))
+            for i in range(10)
+        ]
+        self.assertEqual(self.storage.repack(), 10)
+        self.assertEqual(
+            list(self.paths.iter_loose_object_paths()), []
+        )
+        for i, key in enumerate(keys):
+            blob = self.storage.get(key)
+            self.assertEqual(blob.content, b"blob " + str(i).encode())
+
+    def test_repack_counts_only_newly_packed_objects(self):
+        key = self.storage.put(Blob(b"hello"))
+        object_path = self.paths.get_object_path(key)
+        content = object_path.read_bytes()
+        self.storage.repack()
+
+        # A loose copy of a packed object, e.g. left by a repack
+        # that was interrupted before removing it
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        object_path.write_bytes(content)
+        self.storage.put(Blob(b"world"))
+
+        self.assertEqual(self.storage.repack(), 1)
+        self.assertEqual(
+            list(self.paths.iter_loose_object_paths()), []
+        )
+        self.assertEqual(self.storage.get(key).content, b"hello")
+
+    def test_repack_nothing(self):
+        self.assertEqual(self.storage.repack(), 0)
+
+    def test_abbreviated_key_in_pack(self):
+        key = self.storage.put(Blob(b"hello"))
+        self.storage.repack()
+        self.assertEqual(self.storage.resolve_key(key[:6]), key)
+        self.assertEqual(self.storage.get(key[:6]).content, b"hello")
+
+    def test_missing_key(self):
+        self.storage.put(Blob(b"hello"))
+        self.storage.repack()
+        self.assertRaises(
+            NitObjectNotFoundError, self.storage.get, "refs/heads/master"
+        )
+
+    def test_put_packed_object_is_not_rewritten(self):
+        key = self.storage.put(Blob(b"hello"))
+        self.storage.repack()
+        self.storage.put(Blob(b"hello"))
+        assert key in self.storage.packs
+        self.assertEqual(
+            list(self.paths.iter_loose_object_paths()), []
+        )
@@ -6,7 +6,7 @@ from tempfile import TemporaryDirectory
 from pathlib import Path
 from nit.core.errors import NitExpectedError
 
-from nit.core.paths import BasePaths
+from nit.core.paths import BasePaths, FanoutPaths
 
 
 class BasePathsTests(TestCase):
@@ -205,3 +205,61 @@ class BasePathsTests(TestCase):
                 self.paths.objects/"c2"
             }
         )
+
+
+class FanoutPathsTests(TestCase):
+
+    """
+    """
+
+    def setUp(self):
+        self.project_dir_td = TemporaryDirectory()
+        self.project_dir = Path(self.project_dir_td.name)
+        (self.project_dir/".nit").mkdir()
+
+        self.paths = FanoutPaths(self.project_dir)
+        self.paths.objects.mkdir()
+
+    def tearDown(self):
+        self.project_dir_td.cleanup()
+
+    def touch_object(self, key):
+        object_path = self.paths.get_canonical_object_path(key)
+        object_path.parent.mkdir(exist_ok=True)
+        object_path.touch()
+        return object_path
+
+    def test_get_canonical_object_path(self):
+        self.assertEqual(
+            self.paths.get_canonical_object_path("abcdef"),
+            self.paths.objects/"ab"/"cdef"
+        )
+
+    def test_get_object_path_abbreviated(self):
+        object_path = self.touch_object("abcdef")
+        self.touch_object("abdddd")
+        self.assertEqual(self.paths.get_object_path("abc"), object_path)
+        self.assertEqual(self.paths.get_object_path("abcdef"), object_path)
+        self.assertRaises(
+            NitExpectedError, self.paths.get_object_path, "ab"
+        )
+
+    def test_get_object_path_short_keyish(self):
+        object_path = self.touch_object("abcdef")
+        self.assertEqual(self.paths.get_object_path("a"), object_path)
+
+    def test_finds_flat_objects(self):
+        flat_path = self.paths.objects/"abcdef"
+        flat_path.touch()
+        self.assertEqual(self.paths.get_object_path("abcdef"), flat_path)
+
+    def test_key_for_path(self):
+        for key in ["abcdef", "123456"]:
+            object_path = self.touch_object(key)
+            self.assertEqual(
+                self.paths.get_object_key_for_path(object_path), key
+            )
+        self.assertEqual(
+            sorted(self.paths.iter_loose_object_paths()),
+            [self.paths.objects/"12"/"3456", self.paths.objects/"ab"/"cdef"]
+        )
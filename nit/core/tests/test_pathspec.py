@@ -0,0 +1,46 @@
+#! /usr/bin/env python
+"""
+"""
+from pathlib import Path
+
+from nit.core.objects.tree import TreeNode
+from nit.core.pathspec import Pathspec
+from nit.core.tests.util import NitTestCase
+
+
+class TestPathspec(NitTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        self.pathspec = Pathspec(["src/", "./docs/index.md", "a"])
+
+    def test_matches(self):
+        for path_str in ["src", "src/x", "src/x/y", "docs/index.md", "a"]:
+            assert self.pathspec.matches(path_str), path_str
+        for path_str in ["srcs", "docs", "docs/other.md", "b/a", ""]:
+            assert not self.pathspec.matches(path_str), path_str
+        assert self.pathspec.matches(Path("src/x"))
+
+    def test_matches_below(self):
+        for dir_str in ["src", "src/x", "docs"]:
+            assert self.pathspec.matches_below(dir_str), dir_str
+        for dir_str in ["doc", "lib", "docs/index"]:
+            assert not self.pathspec.matches_below(dir_str), dir_str
+
+    def test_filter(self):
+        nodes = [TreeNode("src/x", "1"), TreeNode("b", "2")]
+        self.assertEqual(self.pathspec.filter(nodes), nodes[:1])
+        self.assertEqual(self.pathspec.filter(None), [])
+
+    def test_from_args(self):
+        self.assertIsNone(Pathspec.from_args(None))
+        self.assertIsNone(Pathspec.from_args([]))
+        self.assertIsNone(Pathspec.from_args(["src", "."]))
+        self.assertEqual(Pathspec.from_args(["a/"]).path_strs, {"a"})
+
+    def test_outside_project(self):
+        for path_str in ["..", "../x", "a/../../x", "/abs"]:
+            with self.expectUserError():
+                Pathspec([path_str])
@@ -1,11 +1,17 @@
 #! /usr/bin/env python
 """
 """
+import os
+from pathlib import Path
 from tempfile import TemporaryDirectory
+from unittest import mock
 
+from nit.components.base.working_tree import WorkingTreeWalker
 from nit.components.nit.repository import NitRepository
+from nit.components.nit.storage import CompressedNitStorage, NitStorage
+from nit.core.pathspec import Pathspec
 from nit.core.paths import BasePaths
-from nit.core.tests.util import NitTestCase
+from nit.core.tests.util import NitRepositoryTestCase, NitTestCase
 
 
 class TestNitRepository(NitTestCase):
@@ -38,3 +44,254 @@ class TestNitRepository(NitTestCase):
         """
         self.repo.create()
         self.repo.create(force=True)
+
+
+class TestClean(NitRepositoryTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.commit_files({".nitignore": "*.log\n", "a": "a", "dir/b": "b"})
+
+    def assertClean(self, clean):
+        with mock.patch.object(
+            self.repo.storage, "get_object_key_for_path"
+        ) as get_key:
+            self.assertEqual(self.repo.clean, clean)
+        get_key.assert_not_called()
+        self.assertEqual(self.repo._status().clean, clean)
+
+    def test_clean(self):
+        self.assertClean(True)
+
+    def test_clean_after_commit_needs_no_head_tree(self):
+        with mock.patch.object(
+            self.repo.storage, "get_nested_tree"
+        ) as get_nested_tree:
+            self.assertTrue(self.repo.clean)
+        get_nested_tree.assert_not_called()
+
+    def test_ignored_file(self):
+        self.write("dir/c.log", "c")
+        self.assertClean(True)
+
+    def test_untracked_file(self):
+        self.write("dir/deeper/c", "c")
+        self.assertClean(False)
+
+    def test_removed_file(self):
+        (self.paths.project/"dir"/"b").unlink()
+        self.assertClean(False)
+
+    def test_added_file(self):
+        self.write("c", "c")
+        self.repo.add("c")
+        self.assertClean(False)
+
+    def test_modified_file(self):
+        self.write("a", "changed")
+        self.repo.add("a")
+        self.assertClean(False)
+
+
+class TestCompression(NitRepositoryTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.plain_repo = self.repo
+        self.repo.config(["core.compression", "9"])
+        self.repo = NitRepository(self.paths)
+
+    def test_storage_follows_config(self):
+        self.assertIs(type(self.plain_repo.storage), NitStorage)
+        self.assertIs(type(self.repo.storage), CompressedNitStorage)
+        self.assertEqual(self.repo.storage.compression_level, 9)
+
+    def test_add_commit_and_read_back(self):
+        content = "compressible " * 100
+        self.commit_files({"a": content, "dir/b": "b"})
+
+        commit_key = self.repo._get_head_commit_key()
+        commit = self.repo.storage.get_object(commit_key)
+        tree = self.repo.storage.get_nested_tree(commit.tree_key)
+        keys = {str(n.path): n.key for n in tree}
+        self.assertEqual(set(keys), {"a", "dir/b"})
+
+        object_path = self.paths.get_object_path(keys["a"])
+        self.assertLess(object_path.stat().st_size, len(content))
+        self.assertEqual(
+            self.repo.storage.get_object(keys["a"]).content,
+            content.encode()
+        )
+        self.assertTrue(NitRepository(self.paths).clean)
+
+        self.write("a", "changed")
+        self.repo.checkout(commit_key)
+        with (self.paths.project/"a").open() as f:
+            self.assertEqual(f.read(), content)
+
+
+class TestNestedCommits(NitRepositoryTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.commit_files({
+            rel_path: rel_path
+            for rel_path in ["a", "src/b", "src/sub/c", "docs/d"]
+        })
+        self.first_key = self.repo._get_head_commit_key()
+
+    def test_commit_only_stores_changed_directories(self):
+        self.write("src/sub/c", "changed")
+        self.repo.add("src/sub/c")
+        self.assertEqual(
+            set(self.repo.storage.get_index().tree_cache), {"docs"}
+        )
+
+        with mock.patch.object(
+            self.repo.storage, "put_many", wraps=self.repo.storage.put_many
+        ) as put_many:
+            self.repo.commit(message="Second")
+        self.assertEqual(
+            sum(len(c[0][0]) for c in put_many.call_args_list), 3
+        )
+
+        index = self.repo.storage.get_index()
+        commit = self.repo.storage.get_object(
+            self.repo._get_head_commit_key()
+        )
+        self.assertEqual(index.tree_cache[""], commit.tree_key)
+        self.assertEqual(
+            set(self.repo.storage.get_nested_tree(commit.tree_key)),
+            set(index)
+        )
+
+    def test_status_loads_only_changed_directories(self):
+        docs_key = self.repo.storage.get_index().tree_cache["docs"]
+        self.write("src/sub/c", "changed")
+        self.repo.add("src/sub/c")
+
+        with mock.patch.object(
+            self.repo.storage, "get_many", wraps=self.repo.storage.get_many
+        ) as get_many:
+            status = self.repo._status()
+        loaded_keys = set(
+            key for c in get_many.call_args_list for key in c[0][0]
+        )
+        self.assertEqual(len(loaded_keys), 3)
+        self.assertNotIn(docs_key, loaded_keys)
+
+        self.assertEqual(
+            set(str(n.path) for n in status.modified), {"src/sub/c"}
+        )
+        self.assertEqual(
+            set(str(n.path) for n in status.unmodified),
+            {"a", "src/b", "docs/d"}
+        )
+
+    def test_checkout_restores_tree_cache(self):
+        self.write("src/sub/c", "changed")
+        self.repo.add("src/sub/c")
+        self.repo.commit(message="Second")
+
+        self.repo.checkout(self.first_key)
+        first = self.repo.storage.get_object(self.first_key)
+        index = self.repo.storage.get_index()
+        self.assertEqual(index.tree_cache[""], first.tree_key)
+        self.assertEqual(
+            set(index.tree_cache), {"", "src", "src/sub", "docs"}
+        )
+        with (self.paths.project/"src"/"sub"/"c").open() as f:
+            self.assertEqual(f.read(), "src/sub/c")
+
+
+class TestStatusOptions(NitRepositoryTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.commit_files({
+            rel_path: rel_path
+            for rel_path in ["a", "src/b", "src/c", "docs/d"]
+        })
+
+        self.write("src/b", "modified")
+        self.write("new", "new")
+        self.write("untracked/e", "e")
+        self.write("c", "c")
+        self.repo.add("c")
+
+    def get_status(self, **kwargs):
+        with mock.patch.object(
+            self.repo.storage, "get_object_key_for_path",
+            wraps=self.repo.storage.get_object_key_for_path
+        ) as get_key:
+            status = self.repo._status(**kwargs)
+        hashed = set(
+            str(Path(c[0][0]).relative_to(self.paths.project))
+            for c in get_key.call_args_list
+        )
+        paths = {
+            category: set(str(n.path) for n in getattr(status, category))
+            for category in ["added", "unstaged", "untracked"]
+        }
+        return paths, hashed
+
+    def test_full(self):
+        paths, _ = self.get_status()
+        self.assertEqual(paths, {
+            "added": {"c"},
+            "unstaged": {"src/b"},
+            "untracked": {"new", "untracked/e"},
+        })
+
+    def test_cached(self):
+        with mock.patch.object(
+            self.repo.storage, "get_working_tree"
+        ) as get_working_tree:
+            paths, _ = self.get_status(cached=True)
+        get_working_tree.assert_not_called()
+        self.assertEqual(
+            paths, {"added": {"c"}, "unstaged": set(), "untracked": set()}
+        )
+
+    def test_no_untracked(self):
+        with mock.patch.object(
+            WorkingTreeWalker, "_list_dir", autospec=True,
+            side_effect=WorkingTreeWalker._list_dir
+        ) as list_dir:
+            paths, hashed = self.get_status(untracked=False)
+        self.assertEqual(
+            paths, {"added": {"c"}, "unstaged": {"src/b"}, "untracked": set()}
+        )
+        self.assertNotIn("new", hashed)
+        listed = set(
+            os.path.relpath(c[0][1], str(self.paths.project))
+            for c in list_dir.call_args_list
+        )
+        self.assertNotIn("untracked", listed)
+
+    def test_pathspec(self):
+        paths, hashed = self.get_status(pathspec=Pathspec(["src", "new"]))
+        self.assertEqual(
+            paths, {"added": set(), "unstaged": {"src/b"}, "untracked": {"new"}}
+        )
+        self.assertFalse(hashed & {"a", "c", "docs/d", "untracked/e"})
+
+    def test_partial_status_keeps_dir_cache(self):
+        self.get_status()
+        dir_cache = self.repo.storage.get_index().dir_cache
+        self.get_status(pathspec=Pathspec(["src"]))
+        self.assertEqual(
+            set(self.repo.storage.get_index().dir_cache), set(dir_cache)
+        )
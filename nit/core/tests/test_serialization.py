@@ -2,10 +2,16 @@
 """
 """
 import io
+import zlib
 
 from nit.core.serialization import BaseSerializer
-from nit.components.nit.serialization import NitSerializer
+from nit.components.nit.serialization import (
+    NitSerializer,
+    CompressedNitSerializer
+)
 from nit.core.objects.blob import Blob
+from nit.core.objects.index import DirCacheEntry, Index, IndexStat
+from nit.core.objects.tree import SubtreeNode, Tree, TreeNode
 from nit.core.tests.util import NitTestCase
 
 
@@ -42,6 +48,21 @@ class TestBaseSerializer(NitTestCase):
         b = self.serializer.read_bytes_until()
         self.assertEqual(expected_b, b)
 
+    def test_read_bytes_until_then_read_bytes(self):
+        rest = self.HELLO * 10000
+        self.serializer.write_bytes(b"head\0" + rest)
+        self.stream.seek(0)
+        self.assertEqual(self.serializer.read_bytes_until(), b"head")
+        self.assertEqual(self.serializer.read_bytes(3), rest[:3])
+        self.assertEqual(self.serializer.read_bytes(), rest[3:])
+
+    def test_read_ahead_is_unread(self):
+        self.serializer.write_bytes(b"head\0" + self.HELLO)
+        self.stream.seek(0)
+        self.serializer.read_bytes_until()
+        self.serializer._unread()
+        self.assertEqual(self.stream.read(), self.HELLO)
+
 
 class TestNitSerializer(TestBaseSerializer):
 
@@ -58,3 +79,188 @@ class TestNitSerializer(TestBaseSerializer):
 
         actual_blob = self.serializer.deserialize()
         self.assertEqual(blob.content, actual_blob.content)
+
+    def test_serialize_then_deserialize_index(self):
+        index = Index()
+        index.add_node(
+            TreeNode("dir/with space", "aaaa"),
+            stat=IndexStat(1234567890123456789, 5, 42)
+        )
+        index.add_node(TreeNode("b", "bbbb"))
+        self.serializer.serialize(index)
+
+        self.stream.seek(0)
+
+        actual_index = self.serializer.deserialize()
+        self.assertEqual(set(actual_index), set(index))
+        self.assertEqual(
+            actual_index.stats,
+            {"dir/with space": IndexStat(1234567890123456789, 5, 42)}
+        )
+
+    def test_serialize_then_deserialize_index_dir_cache(self):
+        index = Index()
+        index.add_node(TreeNode("a", "aaaa"))
+        index.dir_cache = {
+            "": DirCacheEntry(123, ("dir",), ("a", "b c")),
+            "dir": DirCacheEntry(456, (), ()),
+        }
+        self.serializer.serialize(index)
+
+        self.stream.seek(0)
+
+        actual_index = self.serializer.deserialize()
+        self.assertEqual(set(actual_index), set(index))
+        self.assertEqual(actual_index.dir_cache, index.dir_cache)
+
+    def test_serialize_then_deserialize_index_fsmonitor_token(self):
+        index = Index()
+        index.add_node(TreeNode("a", "aaaa"))
+        index.dir_cache = {"": DirCacheEntry(123, (), ("a",))}
+        index.fsmonitor_token = "0123abcd:42"
+        self.serializer.serialize(index)
+
+        self.stream.seek(0)
+
+        actual_index = self.serializer.deserialize()
+        self.assertEqual(set(actual_index), set(index))
+        self.assertEqual(actual_index.dir_cache, index.dir_cache)
+        self.assertEqual(actual_index.fsmonitor_token, "0123abcd:42")
+
+    def test_serialize_then_deserialize_index_tree_cache(self):
+        index = Index()
+        index.add_node(TreeNode("dir/a", "aaaa"))
+        index.tree_cache = {"": "bbbb", "dir": "cccc"}
+        self.serializer.serialize(index)
+
+        self.stream.seek(0)
+
+        actual_index = self.serializer.deserialize()
+        self.assertEqual(set(actual_index), set(index))
+        self.assertEqual(actual_index.tree_cache, index.tree_cache)
+
+    def test_serialize_then_deserialize_tree(self):
+        tree = Tree([
+            TreeNode("dir/file {}".format(i), "{:04x}".format(i))
+            for i in range(1000)
+        ])
+        self.serializer.serialize(tree)
+
+        self.stream.seek(0)
+
+        actual_tree = self.serializer.deserialize()
+        self.assertEqual(set(actual_tree), set(tree))
+
+    def test_serialize_then_deserialize_nested_tree(self):
+        tree = Tree([TreeNode("file", "aaaa"), SubtreeNode("dir", "bbbb")])
+        for tree_format in ("text", "binary"):
+            stream = io.BytesIO()
+            self.SERIALIZER_CLS(
+                stream, tree_format=tree_format
+            ).serialize(tree)
+            stream.seek(0)
+
+            actual_tree = self.SERIALIZER_CLS(stream).deserialize()
+            self.assertEqual(set(actual_tree), set(tree))
+            self.assertEqual(
+                {str(n.path): n.is_tree for n in actual_tree},
+                {"file": False, "dir": True}
+            )
+
+    def test_deserialize_blob_header_leaves_content(self):
+        self.serializer.serialize(Blob(self.HELLO))
+        self.stream.seek(0)
+        self.serializer.deserialize_blob_header()
+        self.assertEqual(self.stream.read(), self.HELLO)
+
+    def test_serialize_then_deserialize_binary_tree(self):
+        tree = Tree([
+            TreeNode("dir/with space", "aa" * 20),
+            TreeNode("dir/with\nnewline", "bb" * 20),
+            TreeNode("dir/\u00fcnicode", "cc" * 20),
+            TreeNode("file", "dd" * 20),
+        ])
+        self.SERIALIZER_CLS(
+            self.stream, tree_format="binary"
+        ).serialize(tree)
+
+        text_stream = io.BytesIO()
+        self.SERIALIZER_CLS(text_stream).serialize(tree)
+        self.assertLess(
+            len(self.stream.getvalue()), len(text_stream.getvalue())
+        )
+        self.stream.seek(0)
+
+        actual_tree = self.serializer.deserialize()
+        self.assertEqual(set(actual_tree), set(tree))
+
+    def test_serialize_then_deserialize_binary_index(self):
+        index = Index()
+        index.add_node(
+            TreeNode("dir/with space", "aaaa"),
+            stat=IndexStat(-1234567890123456789, 5, 42)
+        )
+        index.add_node(TreeNode("dir/b", "bbbb"))
+        index.dir_cache = {
+            "": DirCacheEntry(123, ("dir",), ()),
+            "dir": DirCacheEntry(456, (), ("b", "with space")),
+        }
+        index.fsmonitor_token = "0123abcd:42"
+        index.tree_cache = {"": "cccc", "dir": "dddd"}
+        self.SERIALIZER_CLS(
+            self.stream, tree_format="binary"
+        ).serialize(index)
+
+        self.stream.seek(0)
+
+        actual_index = self.serializer.deserialize()
+        self.assertEqual(set(actual_index), set(index))
+        self.assertEqual(actual_index.stats, index.stats)
+        self.assertEqual(actual_index.dir_cache, index.dir_cache)
+        self.assertEqual(actual_index.fsmonitor_token, "0123abcd:42")
+        self.assertEqual(actual_index.tree_cache, index.tree_cache)
+
+    def test_deserialize_truncated_binary_tree(self):
+        tree = Tree([TreeNode("file", "aaaa")])
+        NitSerializer(self.stream, tree_format="binary").serialize(tree)
+        self.stream.truncate(len(self.stream.getvalue()) - 1)
+        self.stream.seek(0)
+        with self.assertRaises(ValueError):
+            self.serializer.deserialize()
+
+    def test_deserialize_version_1_index(self):
+        self.serializer.write_bytes(b"index 10\naaaa a b\n")
+        self.stream.seek(0)
+
+        index = self.serializer.deserialize()
+        self.assertEqual(set(index), {TreeNode("a b", "aaaa")})
+        self.assertEqual(index.stats, {})
+
+
+class TestCompressedNitSerializer(TestNitSerializer):
+
+    """
+    """
+
+    SERIALIZER_CLS = CompressedNitSerializer
+
+    def test_serialize_deflates(self):
+        blob = Blob(self.HELLO)
+        self.SERIALIZER_CLS(self.stream, level=9).serialize(blob)
+        self.assertEqual(
+            zlib.decompress(self.stream.getvalue()),
+            b"blob 5\nhello"
+        )
+
+    def test_deserialize_deflated_blob(self):
+        blob = Blob(self.HELLO * 1000)
+        self.SERIALIZER_CLS(self.stream, level=1).serialize(blob)
+        self.stream.seek(0)
+        actual_blob = self.serializer.deserialize()
+        self.assertEqual(blob.content, actual_blob.content)
+
+    def test_deserialize_plain_blob(self):
+        NitSerializer(self.stream).serialize(Blob(self.HELLO))
+        self.stream.seek(0)
+        actual_blob = self.serializer.deserialize()
+        self.assertEqual(self.HELLO, actual_blob.content)
@@ -8,7 +8,13 @@ from collections import namedtuple
 from nit.core.status import BaseStatusStrategy
 
 
-MockNode = namedtuple("MockNode", ("path", "key"))
+class MockNode(namedtuple("MockNode", ("path", "key"))):
+
+    __slots__ = ()
+
+    @property
+    def path_str(self):
+        return str(self.path)
 
 a1 = MockNode(Path("a"), "aaaa1")
 a2 = MockNode(Path("a"), "aaaa2")
@@ -109,3 +115,37 @@ class BaseTreeDiffNoHeadTests(TestCase):
 
     def test_ignored(self):
         assert {f1} == self.diff.ignored
+
+
+class BaseStatusStrategyTests(TestCase):
+
+    """
+    """
+
+    def test_unstaged(self):
+        diff = BaseStatusStrategy([a1, b1], [a1, b2], [a2, b2, c1])
+        assert {a2} == diff.unstaged
+        assert {c1} == diff.untracked
+        assert {b2} == diff.modified
+
+    def test_removed_from_working_tree(self):
+        diff = BaseStatusStrategy([a1, b1], [a1, b1], [b1])
+        assert {a1} == diff.removed
+        assert not diff.clean
+
+    def test_results_are_computed_once(self):
+        ignored_paths = []
+
+        def ignorer(path):
+            ignored_paths.append(path)
+            return path == f1.path
+
+        diff = BaseStatusStrategy([a1], [a1], [a2, e1, f1], ignorer=ignorer)
+        for _ in range(3):
+            assert not diff.clean
+            assert {e1} == diff.untracked
+            assert {f1} == diff.ignored
+            assert {a2} == diff.unstaged
+        self.assertEqual(
+            sorted(ignored_paths), [a1.path, e1.path, f1.path]
+        )
@@ -6,11 +6,15 @@ from pathlib import Path
 from unittest import mock
 
 from nit.components.nit.serialization import NitSerializer
+from nit.components.nit.storage import NitStorage, CompressedNitStorage
+from nit.core.objects.blob import Blob
 from nit.core.objects.commit import Commit
-from nit.core.paths import BasePaths
+from nit.core.objects.index import Index
+from nit.core.objects.tree import Tree, TreeNode
+from nit.core.paths import BasePaths, FanoutPaths
 from nit.core.serialization import BaseSerializer
-from nit.components.base.storage import BaseStorage
-from nit.core.tests.util import NitTestCase
+from nit.components.base.storage import BaseStorage, get_file_mode
+from nit.core.tests.util import NitStorageTestCase, NitTestCase
 
 
 class TestBaseStorageCreation(NitTestCase):
@@ -196,3 +200,492 @@ class TestNitStorage(TestBaseStorage):
     # @skip("Not Implemented")
     # def test_write_object(self):
     #     assert False
+
+
+class TestCompressedNitStorage(NitStorageTestCase):
+
+    """
+    """
+
+    STORAGE_CLS = CompressedNitStorage
+
+    def test_keys_match_uncompressed_storage(self):
+        blob = Blob(b"hello " * 100)
+        key = self.storage.put(blob)
+        self.assertEqual(key, NitStorage(self.paths).get_object_key_for(blob))
+
+    def test_put_then_get(self):
+        key = self.storage.put(Blob(b"hello " * 100))
+        object_path = self.paths.get_object_path(key)
+        self.assertLess(object_path.stat().st_size, 100)
+        self.assertEqual(self.storage.get(key).content, b"hello " * 100)
+
+    def test_reads_uncompressed_objects(self):
+        key = NitStorage(self.paths).put(Blob(b"plain"))
+        self.assertEqual(self.storage.get(key).content, b"plain")
+
+    def test_compression_level_from_config(self):
+        config = self.storage.get_config().repo_config
+        config["core.compression"] = "0"
+        config.save()
+        self.assertEqual(CompressedNitStorage(self.paths).compression_level, 0)
+
+        config["core.compression"] = "fast"
+        config.save()
+        with self.expectUserError():
+            CompressedNitStorage(self.paths).compression_level
+
+
+class TestTreeFormat(NitStorageTestCase):
+
+    """
+    """
+
+    STORAGE_CLS = CompressedNitStorage
+
+    def setUp(self):
+        super().setUp()
+        self.tree = Tree([TreeNode("a b", "aa" * 20)])
+
+    def set_tree_format(self, tree_format):
+        config = self.storage.get_config().repo_config
+        config["core.treeFormat"] = tree_format
+        config.save()
+
+    def test_default_is_text(self):
+        self.assertEqual(self.storage.tree_format, "text")
+
+    def test_either_format_is_readable(self):
+        text_key = self.storage.put_tree(self.tree)
+        self.set_tree_format("binary")
+        storage = CompressedNitStorage(self.paths)
+        binary_key = storage.put_tree(self.tree)
+
+        self.assertNotEqual(text_key, binary_key)
+        self.assertEqual(
+            binary_key, NitStorage(self.paths).get_object_key_for(self.tree)
+        )
+        for key in (text_key, binary_key):
+            self.assertEqual(set(storage.get(key)), set(self.tree))
+
+    def test_binary_index(self):
+        self.set_tree_format("binary")
+        storage = CompressedNitStorage(self.paths)
+        index = Index()
+        index.add_node(TreeNode("a b", "aa" * 20))
+        storage.put_index(index)
+        self.set_tree_format("text")
+        actual_index = CompressedNitStorage(self.paths).get_index()
+        self.assertEqual(set(actual_index), set(index))
+
+    def test_unknown_format(self):
+        self.set_tree_format("xml")
+        with self.expectUserError():
+            CompressedNitStorage(self.paths).tree_format
+
+
+class TestNestedTrees(NitStorageTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.tree = Tree([
+            TreeNode("a", "aaaa"),
+            TreeNode("src/b", "bbbb"),
+            TreeNode("src/sub/c", "cccc"),
+            TreeNode("docs/d", "dddd"),
+        ])
+
+    def test_put_then_get(self):
+        tree_cache = {}
+        key = self.storage.put_nested_tree(self.tree, tree_cache=tree_cache)
+
+        self.assertEqual(
+            set(tree_cache), {"", "src", "src/sub", "docs"}
+        )
+        self.assertEqual(tree_cache[""], key)
+        root = self.storage.get_object(key)
+        self.assertEqual(
+            {str(n.path): n.is_tree for n in root},
+            {"a": False, "src": True, "docs": True}
+        )
+
+        loaded_cache = {}
+        tree = self.storage.get_nested_tree(key, tree_cache=loaded_cache)
+        self.assertEqual(set(tree), set(self.tree))
+        self.assertEqual(loaded_cache, tree_cache)
+
+    def test_only_changed_directories_are_stored(self):
+        tree_cache = {}
+        self.storage.put_nested_tree(self.tree, tree_cache=tree_cache)
+        docs_key = tree_cache["docs"]
+
+        self.tree.add_node(TreeNode("src/sub/c", "eeee"))
+        for dir_str in ["src/sub", "src", ""]:
+            del tree_cache[dir_str]
+
+        with mock.patch.object(
+            self.storage, "put_many", wraps=self.storage.put_many
+        ) as put_many:
+            key = self.storage.put_nested_tree(
+                self.tree, tree_cache=tree_cache
+            )
+        self.assertEqual(
+            sum(len(c[0][0]) for c in put_many.call_args_list), 3
+        )
+        self.assertEqual(tree_cache["docs"], docs_key)
+        self.assertEqual(
+            set(self.storage.get_nested_tree(key)), set(self.tree)
+        )
+
+    def test_get_flat_tree(self):
+        key = self.storage.put_tree(self.tree)
+        self.assertEqual(
+            set(self.storage.get_nested_tree(key)), set(self.tree)
+        )
+
+    def test_get_reuses_unchanged_index_directories(self):
+        tree_cache = {}
+        key = self.storage.put_nested_tree(self.tree, tree_cache=tree_cache)
+        docs_key = tree_cache["docs"]
+        sub_key = tree_cache["src/sub"]
+
+        index = Index.from_tree(self.tree, tree_cache=tree_cache)
+        index.add_node(TreeNode("src/b", "eeee"))
+
+        loaded_cache = {}
+        with mock.patch.object(
+            self.storage, "get_many", wraps=self.storage.get_many
+        ) as get_many:
+            tree = self.storage.get_nested_tree(
+                key, tree_cache=loaded_cache, index=index
+            )
+        loaded_keys = set(
+            key for c in get_many.call_args_list for key in c[0][0]
+        )
+        self.assertEqual(loaded_keys, {key, tree_cache["src"]})
+        self.assertNotIn(docs_key, loaded_keys)
+        self.assertNotIn(sub_key, loaded_keys)
+
+        self.assertEqual(set(tree), set(self.tree))
+        self.assertEqual(loaded_cache, tree_cache)
+
+    def test_get_non_tree(self):
+        key = self.storage.put_object(Blob(b"blob"))
+        with self.expectUserError():
+            self.storage.get_nested_tree(key)
+
+
+class TestStreamingBlobs(NitStorageTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.storage.CHUNK_SIZE = 7
+        self.file_path = self.paths.project/"file"
+        self.content = bytes(range(256)) * 10
+        with self.file_path.open('wb') as f:
+            f.write(self.content)
+
+    def test_put_blob_from_path_matches_put(self):
+        key = self.storage.put_blob_from_path(self.file_path)
+        self.assertEqual(
+            key, self.storage.get_object_key_for(Blob(self.content))
+        )
+        self.assertEqual(self.storage.get(key).content, self.content)
+
+    def test_put_blob_from_path_leaves_no_temporary_files(self):
+        self.storage.put_blob_from_path(self.file_path)
+        self.storage.put_blob_from_path(self.file_path)
+        self.assertEqual(
+            [p.name for p in self.paths.objects.iterdir()
+             if p.name.startswith(".")],
+            []
+        )
+
+    def test_get_object_key_for_path(self):
+        self.assertEqual(
+            self.storage.get_object_key_for_path(self.file_path),
+            self.storage.get_object_key_for(Blob(self.content))
+        )
+
+
+class TestCompressedStreamingBlobs(TestStreamingBlobs):
+
+    """
+    """
+
+    STORAGE_CLS = CompressedNitStorage
+
+
+class TestCopyBlobToPath(NitStorageTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.content = b"hello\nworld\n" * 1000
+        self.key = self.storage.put(Blob(self.content))
+        self.file_path = self.paths.project/"file"
+
+    def assertFileContent(self):
+        with self.file_path.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_copy_loose_blob(self):
+        self.storage.copy_blob_to_path(self.key, self.file_path)
+        self.assertFileContent()
+
+    def test_copy_packed_blob(self):
+        self.storage.put(Blob(b"another blob"))
+        self.storage.repack()
+        self.storage.copy_blob_to_path(self.key, self.file_path)
+        self.assertFileContent()
+
+
+class TestCompressedCopyBlobToPath(TestCopyBlobToPath):
+
+    """
+    """
+
+    STORAGE_CLS = CompressedNitStorage
+
+
+class TestBatchObjects(NitStorageTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.blobs = [
+            Blob("blob {}".format(i % 5).encode()) for i in range(8)
+        ]
+
+    def test_put_many_matches_put(self):
+        keys = self.storage.put_many(self.blobs)
+        self.assertEqual(
+            keys, [self.storage.get_object_key_for(b) for b in self.blobs]
+        )
+        self.assertEqual(
+            len(list(self.paths.iter_loose_object_paths())), 5
+        )
+
+    def test_get_many_in_order(self):
+        keys = self.storage.put_many(self.blobs)
+        self.storage.get(keys[1])
+        objs = self.storage.get_many([k[:8] for k in reversed(keys)])
+        self.assertEqual(
+            [o.content for o in objs],
+            [b.content for b in reversed(self.blobs)]
+        )
+
+    def test_put_blobs_from_paths(self):
+        file_paths = []
+        for i, blob in enumerate(self.blobs):
+            file_path = self.paths.project/"file{}".format(i)
+            with file_path.open('wb') as f:
+                f.write(blob.content)
+            file_paths.append(file_path)
+
+        keys = self.storage.put_blobs_from_paths(file_paths)
+        self.assertEqual(keys, self.storage.put_many(self.blobs))
+        self.assertEqual(
+            [p.name for p in self.paths.objects.iterdir()
+             if p.name.startswith(".")],
+            []
+        )
+
+    def test_copy_blobs_to_paths(self):
+        keys = self.storage.put_many(self.blobs)
+        file_paths = [
+            self.paths.project/"file{}".format(i)
+            for i in range(len(keys))
+        ]
+        self.storage.copy_blobs_to_paths(zip(keys, file_paths))
+        for blob, file_path in zip(self.blobs, file_paths):
+            with file_path.open('rb') as f:
+                self.assertEqual(f.read(), blob.content)
+
+
+class TestCompressedBatchObjects(TestBatchObjects):
+
+    """
+    """
+
+    STORAGE_CLS = CompressedNitStorage
+
+
+class TestTransaction(NitStorageTestCase):
+
+    """
+    """
+
+    def test_refs_are_written_at_the_end(self):
+        with self.storage.transaction():
+            key = self.storage.put(Blob(b"hello"))
+            self.storage.put_ref("master", key)
+            self.assertEqual(self.storage.get_ref("master"), key)
+            assert not (self.paths.refs/"heads"/"master").exists()
+            assert self.storage.has_object(key)
+
+        with (self.paths.refs/"heads"/"master").open('rb') as f:
+            self.assertEqual(f.read(), key.encode())
+
+    def test_failed_transaction_drops_refs(self):
+        with self.assertRaises(ValueError):
+            with self.storage.transaction():
+                key = self.storage.put(Blob(b"hello"))
+                self.storage.put_ref("master", key)
+                raise ValueError()
+
+        assert self.storage.has_object(key)
+        assert not (self.paths.refs/"heads"/"master").exists()
+
+    def put_objects(self):
+        """
+        :return (list): The keys of an object stored each way
+        """
+        file_path = self.paths.project/"file"
+        with file_path.open('wb') as f:
+            f.write(b"from a file")
+        return [
+            self.storage.put(Blob(b"hello")),
+            self.storage.put_many([Blob(b"world")])[0],
+            self.storage.put_blobs_from_paths([file_path])[0],
+        ]
+
+    def test_objects_are_named_after_the_sync(self):
+        with self.storage.transaction():
+            keys = self.put_objects()
+            for key in keys:
+                self.assertIsNone(self.paths.get_existing_object_path(key))
+                self.assertNotIn(key, self.storage.key_index)
+                assert self.storage.has_object(key)
+            self.assertEqual(self.storage.get(keys[0]).content, b"hello")
+
+        for key in keys:
+            self.assertIsNotNone(self.paths.get_existing_object_path(key))
+            self.assertIn(key, self.storage.key_index)
+
+    def test_crash_before_sync_leaves_no_named_objects(self):
+        with mock.patch(
+            "nit.components.base.storage.sync_filesystem",
+            side_effect=OSError("crash")
+        ):
+            with self.assertRaises(OSError):
+                with self.storage.transaction():
+                    keys = self.put_objects()
+
+        for key in keys:
+            self.assertIsNone(self.paths.get_existing_object_path(key))
+            self.assertNotIn(key, self.storage.key_index)
+        self.assertEqual(
+            [p.name for p in self.paths.repo.glob("**/.tmp-*")], []
+        )
+
+        # Storing them again isn't fooled into skipping them
+        self.assertEqual(self.put_objects(), keys)
+        self.assertEqual(self.storage.get(keys[0]).content, b"hello")
+
+    def test_nested_transactions_join(self):
+        with self.storage.transaction():
+            with self.storage.transaction():
+                self.storage.put_symbolic_ref("HEAD", "refs/heads/dev")
+            self.assertEqual(
+                self.storage.get_symbolic_ref("HEAD"), "refs/heads/dev"
+            )
+            with (self.paths.repo/"HEAD").open('rb') as f:
+                self.assertEqual(f.read(), b"ref: refs/heads/master")
+
+        self.assertEqual(
+            self.storage.get_symbolic_ref("HEAD"), "refs/heads/dev"
+        )
+
+    def test_writes_respect_umask(self):
+        key = self.storage.put(Blob(b"hello"))
+        self.storage.put_ref("master", key)
+        for file_path in [
+            self.paths.get_object_path(key),
+            self.paths.refs/"heads"/"master",
+        ]:
+            self.assertEqual(
+                file_path.stat().st_mode & 0o777, get_file_mode()
+            )
+
+    def test_writes_leave_no_temporary_files(self):
+        with self.storage.transaction():
+            key = self.storage.put(Blob(b"hello"))
+            self.storage.put_ref("master", key)
+        self.storage.put(Blob(b"world"))
+        self.assertEqual(
+            [p.name for p in self.paths.repo.glob("**/.tmp-*")], []
+        )
+
+
+class TestHashAlgorithm(NitStorageTestCase):
+
+    """
+    """
+
+    PATHS_CLS = FanoutPaths
+    CREATE_STORAGE = False
+
+    def test_default_is_sha1(self):
+        self.storage.create()
+        self.assertEqual(self.storage.hash_algorithm, "sha1")
+        self.assertEqual(len(self.storage.put(Blob(b"hello"))), 40)
+
+    def test_algorithm_is_recorded(self):
+        self.storage.create(hash_algorithm="blake2b")
+        storage = NitStorage(self.paths)
+        self.assertEqual(storage.hash_algorithm, "blake2b")
+
+        key = storage.put(Blob(b"hello"))
+        self.assertEqual(len(key), 64)
+        self.assertEqual(storage.resolve_key(key[:7]), key)
+        self.assertEqual(storage.get(key).content, b"hello")
+
+    def test_keys_follow_algorithm(self):
+        self.storage.create(hash_algorithm="sha256")
+        file_path = self.paths.project/"file"
+        with file_path.open('wb') as f:
+            f.write(b"hello")
+        key = self.storage.put(Blob(b"hello"))
+        self.assertEqual(
+            self.storage.get_object_key_for_path(file_path), key
+        )
+        self.assertEqual(self.storage.put_blob_from_path(file_path), key)
+
+    def test_unknown_algorithm(self):
+        with self.expectUserError():
+            self.storage.create(hash_algorithm="md5")
+
+
+class TestMigrateObjects(NitStorageTestCase):
+
+    """
+    """
+
+    def test_migrate_to_fanout_and_back(self):
+        keys = [
+            self.storage.put(Blob(str(i).encode())) for i in range(20)
+        ]
+        fanout_paths = FanoutPaths(self.temp_dir.name)
+        self.assertEqual(self.storage.migrate_objects(fanout_paths), 20)
+
+        storage = NitStorage(fanout_paths)
+        for i, key in enumerate(keys):
+            assert fanout_paths.get_canonical_object_path(key).is_file()
+            self.assertEqual(storage.get(key[:6]).content, str(i).encode())
+
+        self.assertEqual(storage.migrate_objects(self.paths), 20)
+        self.assertEqual(
+            sorted(p.name for p in self.paths.objects.iterdir()),
+            sorted(keys + ["pack"])
+        )
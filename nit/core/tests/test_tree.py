@@ -0,0 +1,135 @@
+#! /usr/bin/env python
+"""
+"""
+from pathlib import Path
+
+from nit.core.objects.index import Index, IndexStat
+from nit.core.objects.tree import SubtreeNode, Tree, TreeNode
+from nit.core.tests.util import NitTestCase
+
+
+class TestTreeNode(NitTestCase):
+
+    """
+    """
+
+    def test_path(self):
+        node = TreeNode(Path("dir") / "a.txt", "1" * 40)
+        self.assertEqual("dir/a.txt", node.path_str)
+        self.assertEqual(Path("dir/a.txt"), node.path)
+        self.assertEqual("dir/a.txt " + "1" * 40, str(node))
+
+    def test_path_normalized(self):
+        for path_str in ("./a/b", "a//b", "a/./b", "a/b/"):
+            self.assertEqual("a/b", TreeNode(path_str, "1").path_str)
+        self.assertEqual(".", TreeNode("", "1").path_str)
+
+    def test_path_str_interned(self):
+        a = TreeNode("".join(["dir/", "a.txt"]), "1")
+        b = TreeNode("".join(["dir/a", ".txt"]), "2")
+        self.assertIs(a.path_str, b.path_str)
+
+    def test_equality(self):
+        node = TreeNode("a", "1")
+        self.assertEqual(node, TreeNode(Path("a"), "1"))
+        self.assertEqual(hash(node), hash(TreeNode(Path("a"), "1")))
+        self.assertNotEqual(node, TreeNode("a", "2"))
+        self.assertNotEqual(node, TreeNode("b", "1"))
+        self.assertNotEqual(node, SubtreeNode("a", "1"))
+        self.assertEqual(2, len({node, SubtreeNode("a", "1")}))
+        self.assertFalse(node.is_tree)
+        self.assertTrue(SubtreeNode("a", "1").is_tree)
+
+    def test_immutable(self):
+        node = TreeNode("a", "1")
+        with self.assertRaises(AttributeError):
+            node.key = "2"
+        with self.assertRaises(AttributeError):
+            node.extra = True
+
+
+class TestTree(NitTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        self.a = TreeNode("a.txt", "1" * 40)
+        self.b = TreeNode("dir/b.txt", "2" * 40)
+        self.c = TreeNode("c.txt", "3" * 40)
+        self.tree = Tree([self.a, self.b, self.c])
+
+    def test_get(self):
+        self.assertIs(self.b, self.tree.get("dir/b.txt"))
+        self.assertIs(self.b, self.tree.get(Path("dir") / "b.txt"))
+        self.assertIsNone(self.tree.get("dir"))
+        self.assertEqual("x", self.tree.get("missing.txt", "x"))
+
+    def test_len_contains(self):
+        self.assertEqual(3, len(self.tree))
+        self.assertIn(self.a, self.tree)
+        self.assertNotIn(TreeNode("a.txt", "4" * 40), self.tree)
+        self.assertNotIn(SubtreeNode("a.txt", "1" * 40), self.tree)
+        self.assertEqual(0, len(Tree()))
+
+    def test_nodes_sorted(self):
+        self.assertEqual([self.a, self.c, self.b], self.tree.nodes_sorted)
+
+    def test_add_node_replaces_path(self):
+        a2 = TreeNode("a.txt", "4" * 40)
+        self.assertFalse(self.tree.add_node(self.a))
+        self.assertTrue(self.tree.add_node(a2))
+        self.assertEqual(3, len(self.tree))
+        self.assertIs(a2, self.tree.get("a.txt"))
+        self.assertEqual([a2, self.c, self.b], self.tree.nodes_sorted)
+
+    def test_add_remove_node_updates_sorted(self):
+        self.assertEqual([self.a, self.c, self.b], self.tree.nodes_sorted)
+        d = TreeNode("b.txt", "4" * 40)
+        self.tree.add_node(d)
+        self.assertEqual(
+            [self.a, d, self.c, self.b], self.tree.nodes_sorted
+        )
+        self.tree.remove_node(self.c)
+        self.assertEqual([self.a, d, self.b], self.tree.nodes_sorted)
+        self.assertIsNone(self.tree.get("c.txt"))
+
+    def test_remove_node_missing(self):
+        with self.assertRaises(KeyError):
+            self.tree.remove_node(TreeNode("a.txt", "4" * 40))
+        self.assertIs(self.a, self.tree.get("a.txt"))
+
+    def test_from_nodes(self):
+        for nodes in (
+            [self.a, self.c, self.b],
+            [self.b, self.a, self.c],
+        ):
+            tree = Tree.from_nodes(nodes)
+            self.assertEqual(
+                [self.a, self.c, self.b], tree.nodes_sorted
+            )
+
+    def test_from_nodes_last_node_wins(self):
+        a2 = TreeNode("a.txt", "4" * 40)
+        tree = Tree.from_nodes([self.a, a2])
+        self.assertEqual([a2], tree.nodes_sorted)
+
+    def test_index_from_nodes(self):
+        stat = IndexStat(1, 2, 3)
+        index = Index.from_nodes(
+            [self.a, self.b], stats={"a.txt": stat},
+            tree_cache={"": "5" * 40}
+        )
+        self.assertIsInstance(index, Index)
+        self.assertEqual({"a.txt": stat}, index.stats)
+        self.assertEqual({"": "5" * 40}, index.tree_cache)
+        self.assertEqual([self.a, self.b], index.nodes_sorted)
+
+    def test_index_from_tree_to_tree(self):
+        index = Index.from_tree(self.tree, tree_cache={"": "5" * 40})
+        self.assertEqual({"": "5" * 40}, index.tree_cache)
+        self.assertEqual(self.tree.nodes_sorted, index.nodes_sorted)
+
+        tree = index.to_tree()
+        self.assertIs(Tree, type(tree))
+        self.assertEqual(self.tree.nodes_sorted, tree.nodes_sorted)
@@ -0,0 +1,224 @@
+#! /usr/bin/env python
+"""
+"""
+import os
+import time
+from pathlib import Path
+from unittest import mock
+
+from nit.components.base.working_tree import BaseWorkingTree
+from nit.core.objects.blob import Blob
+from nit.core.objects.index import Index, IndexStat
+from nit.core.objects.tree import TreeNode
+from nit.core.tests.util import NitStorageTestCase
+
+
+class TestBaseWorkingTree(NitStorageTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.storage.THREAD_BATCH_SIZE = 3
+
+        self.contents = {}
+        for i in range(20):
+            dir_path = self.paths.project/"dir{}".format(i % 4)
+            dir_path.mkdir(exist_ok=True)
+            file_path = dir_path/"file{}".format(i)
+            content = "file {}\n".format(i).encode() * (i + 1)
+            with file_path.open('wb') as f:
+                f.write(content)
+            self.contents[str(file_path.relative_to(
+                self.paths.project
+            ))] = content
+
+    def get_nodes(self, threads):
+        config = self.storage.get_config().repo_config
+        config["core.threads"] = str(threads)
+        config.save()
+        self.storage._threads = None
+        return {
+            str(node.path): node.key
+            for node in BaseWorkingTree(self.storage)
+            if node.path.parts[0] != self.paths.repo_name
+        }
+
+    def test_keys(self):
+        nodes = self.get_nodes(threads=4)
+        self.assertEqual(set(nodes), set(self.contents))
+        for path, content in self.contents.items():
+            self.assertEqual(
+                nodes[path], self.storage.get_object_key_for(Blob(content))
+            )
+
+    def test_threads_give_the_same_tree(self):
+        self.assertEqual(self.get_nodes(threads=1), self.get_nodes(threads=4))
+
+    def test_invalid_threads(self):
+        with self.expectUserError():
+            self.get_nodes(threads=-1)
+
+
+class TestStatCache(NitStorageTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.file_path = self.paths.project/"file"
+        with self.file_path.open('wb') as f:
+            f.write(b"hello")
+        # Make the file old enough not to be racily clean
+        old_ns = time.time_ns() - 2 * Index.RACY_WINDOW_NS
+        os.utime(str(self.file_path), ns=(old_ns, old_ns))
+
+        self.key = self.storage.put_blob_from_path(self.file_path)
+        self.index = Index()
+        self.index.add_node(
+            TreeNode("file", self.key),
+            stat=IndexStat.from_stat_result(os.stat(str(self.file_path)))
+        )
+        self.storage.put_index(self.index)
+
+    def get_hashed_paths(self, index):
+        with mock.patch.object(
+            self.storage, "get_object_key_for_path",
+            wraps=self.storage.get_object_key_for_path
+        ) as get_key:
+            working = BaseWorkingTree(self.storage, index=index)
+        nodes = {str(n.path): n.key for n in working}
+        self.assertEqual(nodes["file"], self.key)
+        hashed = set(
+            str(Path(c[0][0]).relative_to(self.paths.project))
+            for c in get_key.call_args_list
+        )
+        return hashed, working
+
+    def test_unchanged_file_is_not_hashed(self):
+        hashed, working = self.get_hashed_paths(self.storage.get_index())
+        self.assertNotIn("file", hashed)
+        self.assertEqual(working.refreshed_stats, {})
+
+    def test_changed_stat_is_hashed(self):
+        os.utime(str(self.file_path))
+        hashed, working = self.get_hashed_paths(self.storage.get_index())
+        self.assertIn("file", hashed)
+        self.assertIn("file", working.refreshed_stats)
+
+    def test_racily_clean_file_is_hashed(self):
+        index = self.storage.get_index()
+        index.mtime_ns = index.stats["file"].mtime_ns + 1
+        hashed, _ = self.get_hashed_paths(index)
+        self.assertIn("file", hashed)
+
+    def test_racy_stats_are_not_saved(self):
+        os.utime(str(self.file_path))
+        self.index.add_node(
+            TreeNode("file", self.key),
+            stat=IndexStat.from_stat_result(os.stat(str(self.file_path)))
+        )
+        self.storage.put_index(self.index)
+        self.assertEqual(self.storage.get_index().stats, {})
+
+
+class TestDirCache(NitStorageTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        for dir_name in ["a", "b"]:
+            dir_path = self.paths.project/dir_name
+            dir_path.mkdir()
+            with (dir_path/"file").open('wb') as f:
+                f.write(dir_name.encode())
+            self.make_old(dir_path)
+        self.make_old(self.paths.project)
+
+        index = Index()
+        index.dir_cache = BaseWorkingTree(self.storage).dir_cache
+        self.storage.put_index(index)
+
+    def make_old(self, path):
+        old_ns = time.time_ns() - 2 * Index.RACY_WINDOW_NS
+        os.utime(str(path), ns=(old_ns, old_ns))
+
+    def get_listed_dirs(self):
+        with mock.patch.object(
+            BaseWorkingTree, "_list_dir", autospec=True,
+            side_effect=BaseWorkingTree._list_dir
+        ) as list_dir:
+            working = BaseWorkingTree(
+                self.storage, index=self.storage.get_index()
+            )
+        listed = set(
+            os.path.relpath(c[0][1], str(self.paths.project))
+            for c in list_dir.call_args_list
+        )
+        return listed, set(str(n.path) for n in working)
+
+    def test_unchanged_dirs_are_not_listed(self):
+        listed, paths = self.get_listed_dirs()
+        self.assertEqual(listed, set())
+        self.assertEqual(paths, {"a/file", "b/file"})
+
+    def test_changed_dir_is_listed(self):
+        with (self.paths.project/"b"/"new").open('wb') as f:
+            f.write(b"new")
+        listed, paths = self.get_listed_dirs()
+        self.assertEqual(listed, {"b"})
+        self.assertEqual(paths, {"a/file", "b/file", "b/new"})
+
+    def test_repo_dir_is_not_walked(self):
+        _, paths = self.get_listed_dirs()
+        assert not any(
+            p.startswith(self.paths.repo_name) for p in paths
+        )
+
+
+class TestIgnorePruning(NitStorageTestCase):
+
+    """
+    """
+
+    def setUp(self):
+        super().setUp()
+        for rel_path in ["src/a", "build/out/b", "logs/c"]:
+            file_path = self.paths.project/rel_path
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            with file_path.open('wb') as f:
+                f.write(rel_path.encode())
+
+        self.ignore = (
+            lambda p: Path(p).parts[0] in ("build", "logs")
+        )
+
+    def walk_paths(self, index=None):
+        with mock.patch.object(
+            BaseWorkingTree, "_list_dir", autospec=True,
+            side_effect=BaseWorkingTree._list_dir
+        ) as list_dir:
+            working = BaseWorkingTree(
+                self.storage, ignore=self.ignore, index=index
+            )
+        listed = set(
+            os.path.relpath(c[0][1], str(self.paths.project))
+            for c in list_dir.call_args_list
+        )
+        return listed, set(str(n.path) for n in working)
+
+    def test_ignored_dirs_are_pruned(self):
+        listed, paths = self.walk_paths()
+        self.assertEqual(listed, {".", "src"})
+        self.assertEqual(paths, {"src/a"})
+
+    def test_dirs_with_tracked_files_are_walked(self):
+        index = Index()
+        index.add_node(TreeNode("logs/c", "cccc"))
+        listed, paths = self.walk_paths(index=index)
+        self.assertEqual(listed, {".", "src", "logs"})
+        self.assertEqual(paths, {"src/a", "logs/c"})
@@ -3,9 +3,13 @@
 """
 import os
 from contextlib import contextmanager
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
+from nit.components.nit.repository import NitRepository
+from nit.components.nit.storage import NitStorage
 from nit.core.errors import NitUserError
+from nit.core.paths import BasePaths
 
 
 class NitTestCase(TestCase):
@@ -28,3 +32,72 @@ class NitTestCase(TestCase):
 
     def assertNotDirExists(self, dir_path):
         self.assertFalse(os.path.exists(dir_path))
+
+    def write(self, rel_path, content=b"content"):
+        """
+        Writes `content` (str or bytes) to the file at `rel_path`
+        in the project directory of `self.paths`, creating any
+        directories it's in
+        """
+        if isinstance(content, str):
+            content = content.encode()
+        file_path = self.paths.project/rel_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with file_path.open('wb') as f:
+            f.write(content)
+
+
+class NitStorageTestCase(NitTestCase):
+
+    """
+    Runs each test against a new `STORAGE_CLS` storage, laid
+    out by `PATHS_CLS`, in a temporary directory. Test cases
+    that need to create the storage themselves (e.g. to pass
+    options to `create`) set `CREATE_STORAGE` to False.
+    """
+
+    STORAGE_CLS = NitStorage
+    PATHS_CLS = BasePaths
+    CREATE_STORAGE = True
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.paths = self.PATHS_CLS(self.temp_dir.name, verify=False)
+        self.storage = self.STORAGE_CLS(self.paths)
+        if self.CREATE_STORAGE:
+            self.storage.create()
+
+    def tearDown(self):
+        self.storage.close()
+        self.temp_dir.cleanup()
+
+
+class NitRepositoryTestCase(NitTestCase):
+
+    """
+    Runs each test in a new repository, in a temporary
+    directory, with a user to commit as
+    """
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.paths = BasePaths(self.temp_dir.name, verify=False)
+        self.repo = NitRepository(self.paths)
+        self.repo.create()
+        self.repo.config(["user.name", "Someone"])
+        self.repo.config(["user.email", "someone@example.com"])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def commit_files(self, contents, message="First"):
+        """
+        Writes, adds and commits files
+
+        :param contents (dict): The content of each file, by its
+                                relative path
+        """
+        for rel_path, content in contents.items():
+            self.write(rel_path, content)
+        self.repo.add(*contents)
+        self.repo.commit(message=message)